@@ -11,3 +11,15 @@ if [[ $? -ne 0 ]]
 then
     exit 1
 fi
+
+time docker run --rm -t importertest python -m unittest discover -s /tests -p 'test_*.py'
+if [[ $? -ne 0 ]]
+then
+    exit 1
+fi
+
+time docker run --rm -t importertest python /benchmark/benchmark.py --sizes 10
+if [[ $? -ne 0 ]]
+then
+    exit 1
+fi
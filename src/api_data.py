@@ -1,79 +1,207 @@
 """Functions to get data from Meteo API and update Capacity Planner."""
 
 import logging
-import argparse
-import requests
+import json
+import time
+import signal
+import capacity_analytics
 import capacity_planner
+import cli_options
+import collector
+import dry_run
+import scheduler
+import executor
+import journal
+import meteo
+import metrics
+import openstack_backends
+import reconcile
+import records
+import snapshot
+import token_cache
+import utils
 
 LOG = logging.getLogger(__name__)
-logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+
+POD_PROJECT = "Cap_Plan_Viewer"
+POD_USERNAME = "cap_plan_user"
+POD_PASSWORD = "passwd123"
 
 
 def main():
     """Main function to import, update, or delete Capacity Planner data."""
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        '--capacity-planner-base-url',
-        help="""This is the url to the capacity planner
-        """,
-        required=True
-    )
-    parser.add_argument(
-        '--default-team-name',
-        help="""This is the default team to assign new projects to,
-        if project name doesn't match existing teams
-        """,
-        required=True
-    )
-    parser.add_argument(
-        '--default-deployment-type-name',
-        help="""This is the default deployment type to assign new projects to
-        """,
-        required=True
+    args = cli_options.get_parser().parse_args()
+
+    utils.configure_logging(getattr(logging, args.log_level), args.log_payload_limit)
+    if args.metrics_file or args.metrics_prometheus_file or args.dry_run:
+        metrics.METRICS.enable()
+    if args.no_token_cache:
+        token_cache.TOKEN_CACHE.disable()
+    token_cache.TOKEN_CACHE.expiry_margin = args.token_expiry_margin
+    try:
+        run_command(args)
+    finally:
+        metrics.METRICS.write_files(args.metrics_file, args.metrics_prometheus_file)
+
+
+def run_command(args):
+    """Run the command given on the command line."""
+    LOG.info("Initialising Capacity Planner")
+    cap = {"base_url": args.capacity_planner_base_url,
+           "default_team_name": args.default_team_name,
+           "default_deployment_type_name": args.default_deployment_type_name,
+           "pool_size": args.http_pool_size,
+           "workers": args.write_workers,
+           "rate_limit": args.rate_limit,
+           "bulk_chunk_size": args.bulk_chunk_size,
+           "page_size": args.planner_page_size,
+           "retry_attempts": args.retry_attempts,
+           "adaptive_concurrency": not args.no_adaptive_concurrency,
+           "progress_interval": args.progress_interval,
+           "http_cache_dir": args.http_cache_dir,
+           "http_cache_max_bytes": int(args.http_cache_max_mb * 1024 * 1024),
+           "timeout": (capacity_planner.DEFAULT_TIMEOUT[0], args.http_timeout)}
+    changeset_plan = None
+    if args.dry_run:
+        if args.command_to_run == "daemon":
+            LOG.error("A dry run plans a single run, it can't be combined with the daemon command")
+            return
+        changeset_plan = dry_run.ChangesetPlan()
+        cap["changeset_plan"] = changeset_plan
+    write_journal = None
+    if args.journal_file and args.command_to_run in ("create", "delete") and not args.dry_run:
+        write_journal = journal.Journal(args.journal_file, args.command_to_run)
+        cap["journal"] = write_journal
+    with metrics.METRICS.phase('init'):
+        cap_planner = capacity_planner.CapacityPlanner(cap)
+
+    pods_list = meteo.iter_cloud_data(cap_planner)
+    skipped_project_keys = set()
+    projects_list = meteo.iter_project_data(cap_planner, skipped_project_keys)
+    if args.capacity_report_file and args.command_to_run == "update" and args.snapshot_file:
+        LOG.warning(
+            "Not writing the capacity report, an update with a snapshot file only reads the "
+            "Meteo projects that changed"
+        )
+    elif args.capacity_report_file and args.command_to_run in ("create", "update"):
+        pods_list, projects_list = list(pods_list), list(projects_list)
+        write_capacity_report(
+            pods_list, projects_list, args.capacity_report_file, args.max_utilisation
+        )
+    if args.live_stats and args.command_to_run in ("create", "update"):
+        pods_list = get_enriched_pods(
+            cap_planner,
+            pods_list,
+            args.cloud_workers,
+            openstack_backends.get_backend(args.openstack_backend, args.openstack_fake_data_file)
+        )
+    completed = False
+    try:
+        with metrics.METRICS.phase(args.command_to_run):
+            run_planner_command(cap_planner, args, pods_list, projects_list, skipped_project_keys)
+        completed = True
+    finally:
+        if write_journal is not None:
+            write_journal.close(completed)
+
+    cap_planner.write_executor.progress.log_progress()
+    LOG.info(
+        "HTTP requests: %(requests)d sent, %(connections_opened)d connections opened, "
+        "%(connections_reused)d reused",
+        cap_planner.session.connection_stats()
     )
-    parser.add_argument(
-        '--command-to-run',
-        help="""This is the command to run, options are create, update, and delete
-        """,
-        required=True
+    if changeset_plan is not None:
+        export_changeset_plan(cap_planner, changeset_plan, args)
+
+
+def export_changeset_plan(cap_planner, changeset_plan, args):
+    """
+    Export the changeset planned by a dry run, with a forecast of applying it.
+
+    The forecast uses the mean latency per endpoint of the metrics file
+    given as --dry-run-latency-file. The dry run itself sends no writes,
+    so without it no time is forecast.
+    """
+    latencies = {}
+    if args.dry_run_latency_file:
+        latencies = dry_run.load_latencies(args.dry_run_latency_file)
+    else:
+        LOG.warning("No --dry-run-latency-file given, the dry run can't forecast the time taken")
+    forecast = dry_run.forecast(
+        changeset_plan.requests_by_endpoint(),
+        latencies,
+        cap_planner.write_executor.workers,
+        args.rate_limit
     )
+    if forecast['estimated_seconds'] is None:
+        LOG.info("Dry run: %d requests planned", forecast['requests'])
+    else:
+        LOG.info(
+            "Dry run: %d requests planned, estimated to take %s seconds",
+            forecast['requests'],
+            forecast['estimated_seconds']
+        )
+    changeset_plan.write_file(args.command_to_run, forecast, args.dry_run_file)
 
-    args = parser.parse_args()
 
-    LOG.info("Initialising Capacity Planner")
-    cap = {"base_url": args.capacity_planner_base_url,
-           "default_team_name": args.default_team_name,
-           "default_deployment_type_name": args.default_deployment_type_name}
-    cap_planner = capacity_planner.CapacityPlanner(cap)
+def run_planner_command(cap_planner, args, pods_list, projects_list, skipped_project_keys):
+    """
+    Run the command given on the command line against Capacity Planner.
 
-    pods_list = get_cloud_data()
-    projects_list = get_project_data()
+    The keys of the Meteo projects skipped as invalid are added to
+    skipped_project_keys as projects_list is read.
+    """
     if args.command_to_run == "create":
-        upload_cap_planner_data(cap_planner, pods_list, projects_list)
+        upload_cap_planner_data(cap_planner, pods_list, projects_list, args.meteo_batch_size)
+    elif args.command_to_run == "update" and args.snapshot_file and args.dry_run:
+        sync_with_snapshot(
+            cap_planner, snapshot.Snapshot.load(args.snapshot_file), args.meteo_since_parameter
+        )
+    elif args.command_to_run == "update" and args.snapshot_file:
+        sync_cap_planner_data(cap_planner, args.snapshot_file, args.meteo_since_parameter)
     elif args.command_to_run == "update":
-        update_cap_planner_data(cap_planner, projects_list)
+        update_cap_planner_data(cap_planner, projects_list, skipped_project_keys)
     elif args.command_to_run == "delete":
         delete_cap_planner_data(cap_planner)
+    elif args.command_to_run == "daemon":
+        run_daemon(cap_planner, args)
     else:
-        LOG.error("Unknown command, options are create, update, or delete")
+        LOG.error("Unknown command, options are create, update, delete, or daemon")
+    if args.live_stats and args.command_to_run == "update":
+        executor.raise_for_failed_tasks(update_pod_usage(cap_planner, pods_list))
+
+
+def write_capacity_report(pods_list, projects_list, file_name, max_utilisation):
+    """Analyse the capacity and headroom of the Meteo pods, and write the report."""
+    if not capacity_analytics.is_available():
+        LOG.warning("NumPy isn't installed, not writing a capacity report")
+        return
+    with metrics.METRICS.phase('capacity analysis'):
+        report = capacity_analytics.analyse(pods_list, projects_list, max_utilisation)
+    report.log_overcommitted_pods()
+    report.write_file(file_name)
 
 
-def get_project_data():
+def get_project_data(cap_planner):
     """Get project data from Meteo."""
-    LOG.info("Getting project data from Meteo")
-    projects_api = requests.get("http://10.45.207.10/typhoon/get-project-list-api/")
-    projects_data = projects_api.json()
-    project_list = projects_data['projects']
-    return project_list
+    return list(meteo.iter_project_data(cap_planner))
 
 
-def get_cloud_data():
+def get_cloud_data(cap_planner):
     """Get cloud data from Meteo."""
-    LOG.info("Getting cloud data from Meteo")
-    pods_api = requests.get("http://10.45.207.10/typhoon/get-clouds-info-api/")
-    pods_data = pods_api.json()
-    pods_list = pods_data['clouds']
-    return pods_list
+    return list(meteo.iter_cloud_data(cap_planner))
+
+
+def batches(items, batch_size):
+    """Yield lists of at most batch_size items from the given iterable."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def get_pod_id(cap_planner, pod_name):
@@ -82,14 +210,10 @@ def get_pod_id(cap_planner, pod_name):
 
     Returns a string.
     """
-    pod_id = ""
-    pods = cap_planner.execute_cap_get_rest_call(
-        '/api/pods/'
-    )
-    for pod in pods:
-        if pod['name'] == pod_name:
-            pod_id = pod["_id"]
-    return pod_id
+    pod = cap_planner.cap_pods.get_by_name(pod_name)
+    if pod is None:
+        return ""
+    return pod["_id"]
 
 
 def get_deployment_type_id(cap_planner, deployment_type_name):
@@ -98,14 +222,10 @@ def get_deployment_type_id(cap_planner, deployment_type_name):
 
     Returns a string.
     """
-    deployment_type_id = ""
-    deployment_types = cap_planner.execute_cap_get_rest_call(
-        '/api/deploymenttypes/'
-    )
-    for dep_type in deployment_types:
-        if dep_type["name"] == deployment_type_name:
-            deployment_type_id = dep_type["_id"]
-    return deployment_type_id
+    deployment_type = cap_planner.cap_deployment_types.get_by_name(deployment_type_name)
+    if deployment_type is None:
+        return ""
+    return deployment_type["_id"]
 
 
 def get_deployment_type_name(cap_planner, project_id):
@@ -114,32 +234,13 @@ def get_deployment_type_name(cap_planner, project_id):
 
     Returns a string.
     """
-    deployment_type_id = ""
-    projects = get_project_list(cap_planner)
-    for project in projects:
-        if project["_id"] == project_id:
-            deployment_type_id = project["deploymenttype_id"]
-    deployment_type_name = ""
-    deployment_types = cap_planner.execute_cap_get_rest_call(
-        '/api/deploymenttypes/'
-    )
-    for dep_type in deployment_types:
-        if dep_type["_id"] == deployment_type_id:
-            deployment_type_name = dep_type["name"]
-    return deployment_type_name
-
-
-def get_team_name(project):
-    """
-    Get team name based on OpenStack Project name or team name stored in Meteo.
-
-    Returns a string.
-    """
-    name = project.get('team')
-    if name == "":
-        full_name = project.get("project_name")
-        name = full_name.rsplit("_", 1)[0]
-    return name
+    project = cap_planner.cap_projects.get_by_id(project_id)
+    if project is None:
+        return ""
+    deployment_type = cap_planner.cap_deployment_types.get_by_id(project.get("deploymenttype_id"))
+    if deployment_type is None:
+        return ""
+    return deployment_type["name"]
 
 
 def get_team_id(cap_planner, team_name):
@@ -148,29 +249,19 @@ def get_team_id(cap_planner, team_name):
 
     Returns a string.
     """
-    team_id = ""
-    teams = cap_planner.execute_cap_get_rest_call(
-        '/api/teams/'
-    )
-    for team in teams:
-        if team['name'] == team_name:
-            team_id = team["_id"]
-    return team_id
+    team = cap_planner.cap_teams.get_by_name(team_name)
+    if team is None:
+        return ""
+    return team["_id"]
 
 
 def get_team_list(cap_planner):
     """
     Get list of teams in Capacity Planner.
 
-    Returns a list of dictionary objects.
+    Returns a list of team names.
     """
-    team_list = []
-    teams = cap_planner.execute_cap_get_rest_call(
-        '/api/teams/'
-    )
-    for team in teams:
-        team_list.append(team['name'])
-    return team_list
+    return list(cap_planner.cap_teams.by_name)
 
 
 def get_project_list(cap_planner):
@@ -179,13 +270,7 @@ def get_project_list(cap_planner):
 
     Returns a list of dictionary objects.
     """
-    project_list = []
-    projects = cap_planner.execute_cap_get_rest_call(
-        '/api/projects/'
-    )
-    for project in projects:
-        project_list.append(project)
-    return project_list
+    return list(cap_planner.cap_projects)
 
 
 def get_project_id(cap_planner, project_name, pod_id):
@@ -194,12 +279,10 @@ def get_project_id(cap_planner, project_name, pod_id):
 
     Returns a string.
     """
-    project_id = ""
-    projects = get_project_list(cap_planner)
-    for project in projects:
-        if project.get("name") == project_name and project.get("pod_id") == pod_id:
-            project_id = project.get("_id")
-    return project_id
+    project = cap_planner.cap_projects.get_by_name_and_pod(project_name, pod_id)
+    if project is None:
+        return ""
+    return project.get("_id")
 
 
 def post_team(cap_planner, name):
@@ -212,61 +295,92 @@ def post_team(cap_planner, name):
 
 
 def create_teams(cap_planner, project_list):
-    """Create a list of all teams from Meteo in Capacity Planner."""
+    """
+    Create the teams from Meteo that aren't already in Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
     project_set = set()
     for project in project_list:
-        team_name = get_team_name(project)
-        project_set.add(team_name)
-    for name in project_set:
-        post_team(cap_planner, name)
+        if cap_planner.cap_teams.get_by_name(project.team_name) is None:
+            project_set.add(project.team_name)
+    return create_team_list(cap_planner, project_set)
+
+
+def create_team_list(cap_planner, team_names):
+    """
+    Create the given team names in Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
+    writes = []
+    for name in team_names:
+        writes.append(("create team " + name, None, json.dumps({"name": name})))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('POST', 'teams', writes))
 
 
 def delete_team(cap_planner, team_name):
     """Delete a team from Capacity Planner."""
-    team_list = cap_planner.execute_cap_get_rest_call(
-        '/api/teams/'
-    )
-    for team in team_list:
-        if team_name == team.get("name"):
-            team_id = team.get("_id")
-            del_item = '/api/teams/' + team_id
-            cap_planner.execute_cap_delete_rest_call(
-                del_item
-            )
+    team = cap_planner.cap_teams.get_by_name(team_name)
+    while team is not None:
+        del_item = '/api/teams/' + team.get("_id")
+        cap_planner.execute_cap_delete_rest_call(
+            del_item
+        )
+        team = cap_planner.cap_teams.get_by_name(team_name)
 
 
 def delete_teams(cap_planner):
-    """Delete all teams from Capacity Planner."""
-    team_list = cap_planner.execute_cap_get_rest_call(
-        '/api/teams/'
-    )
+    """
+    Delete all teams from Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
+    return delete_team_list(cap_planner, cap_planner.cap_teams)
+
+
+def delete_team_list(cap_planner, team_list):
+    """
+    Delete the given teams from Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
+    writes = []
     for team in team_list:
-        team_id = team.get("_id")
-        del_item = '/api/teams/' + team_id
-        cap_planner.execute_cap_delete_rest_call(
-            del_item
-        )
+        writes.append(("delete team " + team.get("name"), team.get("_id"), None))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('DELETE', 'teams', writes))
 
 
 def delete_pods(cap_planner):
-    """Delete all pods from Capacity Planner."""
-    pods = cap_planner.execute_cap_get_rest_call(
-        '/api/pods'
-    )
-    for pod in pods:
-        pod_id = pod.get("_id")
-        del_item = '/api/pods/' + pod_id
-        cap_planner.execute_cap_delete_rest_call(
-            del_item
-        )
+    """
+    Delete all pods from Capacity Planner.
 
+    Returns the list of writes that failed.
+    """
+    writes = []
+    for pod in cap_planner.cap_pods:
+        writes.append(("delete pod " + pod.get("name"), pod.get("_id"), None))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('DELETE', 'pods', writes))
 
-def delete_projects(cap_planner):
-    """Delete all projects from Capacity Planner."""
-    projects = cap_planner.execute_cap_get_rest_call(
-        '/api/projects/'
-    )
-    for project in projects:
+
+def delete_projects(cap_planner, project_list=None):
+    """
+    Delete the given, or otherwise all, projects from Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
+    if project_list is None:
+        project_list = cap_planner.cap_projects
+    writes = []
+    for project in project_list:
+        writes.append(("delete project " + project.get("name"), project.get("_id"), None))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('DELETE', 'projects', writes))
+
+
+def delete_project(cap_planner, project_name, pod_id):
+    """Delete a project in the given pod from Capacity Planner."""
+    project = cap_planner.cap_projects.get_by_name_and_pod(project_name, pod_id)
+    if project is not None:
         project_id = project.get("_id")
         del_item = '/api/projects/' + project_id
         cap_planner.execute_cap_delete_rest_call(
@@ -274,94 +388,171 @@ def delete_projects(cap_planner):
         )
 
 
-def delete_project(cap_planner, project_name, pod_id):
-    """Delete all projects from Capacity Planner."""
-    projects = cap_planner.execute_cap_get_rest_call(
-        '/api/projects/'
-    )
-    for project in projects:
-        if project_name == project.get("name") and pod_id == project.get("pod_id"):
-            project_id = project.get("_id")
-            del_item = '/api/projects/' + project_id
-            cap_planner.execute_cap_delete_rest_call(
-                del_item
-            )
+def get_pod_item(pod):
+    """
+    Get the Capacity Planner item for a pod from Meteo, with its live usage if collected.
+
+    Returns a JSON string.
+    """
+    item = {
+        "name": pod.pod_name,
+        "authUrl": pod.auth_url,
+        "project": POD_PROJECT,
+        "username": POD_USERNAME,
+        "password": POD_PASSWORD,
+        "cpu": pod.cpu,
+        "memory_mb": pod.memory_mb,
+        "cinder_gb": pod.cinder_gb,
+        "cinder_iops": pod.cinder_iops,
+        "enfs_gb": pod.enfs_gb,
+        "enfs_iops": pod.enfs_iops,
+        "cpu_contention_ratio": pod.cpu_contention_ratio
+    }
+    item.update(pod.usage())
+    return json.dumps(item)
 
 
 def create_pods(cap_planner, pods_list):
-    """Create all pods from Meteo data in Capacity Planner."""
-    project = "Cap_Plan_Viewer"
-    username = "cap_plan_user"
-    password = "passwd123"
+    """
+    Create all pods from Meteo data in Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
+    writes = []
     for pod in pods_list:
-        item = '{"name": "cloud' + pod.get("cloud_name") + \
-               '", "authUrl": "' + pod.get("auth_url") + \
-               '", "project": "' + project + \
-               '", "username": "' + username + \
-               '", "password": "' + password + \
-               '", "cpu": ' + pod.get("total_cpu") + \
-               ', "memory_mb": ' + pod.get("total_ram") + \
-               ', "cinder_gb": ' + pod.get("total_cinder_storage") + \
-               ', "cinder_iops": ' + pod.get("cinder_iops") + \
-               ', "enfs_gb": ' + pod.get("total_enfs_storage") + \
-               ', "enfs_iops": ' + pod.get("total_enfs_iops") + \
-               ', "cpu_contention_ratio": ' + pod.get("cpu_ratio") + \
-               '}'
-        cap_planner.execute_cap_post_rest_call(
-            '/api/pods/',
-            item
-        )
+        writes.append(("create pod " + pod.pod_name, None, get_pod_item(pod)))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('POST', 'pods', writes))
+
+
+def get_pod_openstack_env(pod):
+    """Return the openstack environment to collect the stats of a pod from Meteo with."""
+    return {
+        "cloud_name": pod.cloud_name,
+        "os_auth_url": pod.auth_url,
+        "os_project_name": POD_PROJECT,
+        "os_username": POD_USERNAME,
+        "os_password": POD_PASSWORD
+    }
+
+
+def get_enriched_pods(cap_planner, pods_list, workers=collector.DEFAULT_CLOUD_WORKERS,
+                      backend=None):
+    """
+    Collect the live stats of the given Meteo pods and join them with the Capacity Planner pods.
+
+    The stats are collected through the given openstack_backends backend.
+    Returns a list of records.EnrichedPod, pods whose stats couldn't be
+    collected are kept without them.
+    """
+    pods_list = list(pods_list)
+    collected_stats = collector.collect_cloud_stats(
+        [get_pod_openstack_env(pod) for pod in pods_list], workers, backend
+    )
+    live_stats = {}
+    for cloud_name, cloud_data in collected_stats.items():
+        try:
+            live_stats[cloud_name] = records.LiveCloudStats.from_collected(cloud_name, cloud_data)
+        except records.InvalidRecordException as error:
+            LOG.error("Leaving out live stats: %s", error)
+    return list(reconcile.join_pod_stats(pods_list, live_stats, cap_planner.cap_pods))
+
+
+def update_pod_usage(cap_planner, enriched_pods):
+    """
+    Write the live usage of the given records.EnrichedPod to their pods in Capacity Planner.
+
+    Only pods whose usage differs from what Capacity Planner has are written.
+    Returns the list of writes that failed.
+    """
+    writes = []
+    for pod in enriched_pods:
+        usage = pod.usage()
+        if pod.planner_id is None or not usage:
+            continue
+        planner_pod = cap_planner.cap_pods.get_by_id(pod.planner_id) or {}
+        if all(planner_pod.get(field_name) == value for field_name, value in usage.items()):
+            continue
+        writes.append(("update pod usage " + pod.pod_name, pod.planner_id, get_pod_item(pod)))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('PUT', 'pods', writes))
+
+
+def create_missing_pods(cap_planner, pods_list):
+    """
+    Create the pods from Meteo data that aren't in Capacity Planner yet.
+
+    Returns the list of writes that failed.
+    """
+    return create_pods(cap_planner, [
+        pod for pod in pods_list if cap_planner.cap_pods.get_by_name(pod.pod_name) is None
+    ])
+
+
+def get_project_item(project, pod_id, team_id, deployment_type_id):
+    """
+    Get the Capacity Planner item for a project from Meteo.
+
+    Returns a JSON string.
+    """
+    return json.dumps({
+        "pod_id": pod_id,
+        "team_id": team_id,
+        "deploymenttype_id": deployment_type_id,
+        "name": project.name,
+        "cpu": project.cpu,
+        "memory_mb": project.memory_mb,
+        "cinder_gb": project.cinder_gb
+    })
 
 
 def create_projects(cap_planner, project_list):
-    """Create all projects from Meteo data in Capacity Planner."""
+    """
+    Create all projects from Meteo data in Capacity Planner.
+
+    Projects whose pod or team isn't in Capacity Planner, because
+    creating it failed, aren't created, and count as failed writes.
+    Returns the list of writes that failed.
+    """
+    deployment_type_id = get_deployment_type_id(cap_planner, "5K")
+    writes = []
+    failed_tasks = []
     for project in project_list:
-        project_name = project.get("project_name")
-        pod = project.get("cloud")
-        team_name = get_team_name(project)
-        cpu = project.get("allocated_cpu")
-        memory_mb = project.get("allocated_ram")
-        cinder_gb = project.get("allocated_storage")
-        deployment_type = "5K"
-        team_id = get_team_id(cap_planner, team_name)
-        deployment_type_id = get_deployment_type_id(cap_planner, deployment_type)
-        pod_id = get_pod_id(cap_planner, "cloud" + str(pod))
-        item = '{"pod_id": "' + pod_id + \
-               '", "team_id": "' + team_id + \
-               '", "deploymenttype_id": "' + deployment_type_id + \
-               '", "name": "' + project_name + \
-               '", "cpu": ' + cpu + \
-               ', "memory_mb": ' + memory_mb + \
-               ', "cinder_gb": ' + cinder_gb + \
-               '}'
-
-        cap_planner.execute_cap_post_rest_call(
-            '/api/projects/',
-            item
-        )
+        pod_id = get_pod_id(cap_planner, project.pod_name)
+        team_id = get_team_id(cap_planner, project.team_name)
+        if not pod_id or not team_id:
+            failed_tasks.append(executor.failed_task(
+                "create project " + project.name, RuntimeError(
+                    "pod '%s' or team '%s' isn't in Capacity Planner"
+                    % (project.pod_name, project.team_name)
+                )
+            ))
+            continue
+        item = get_project_item(project, pod_id, team_id, deployment_type_id)
+        writes.append(("create project " + project.name, None, item))
+    return failed_tasks + cap_planner.write_executor.run(
+        cap_planner.get_write_tasks('POST', 'projects', writes)
+    )
 
 
 def update_projects(cap_planner, project_list):
-    """Update projects from Meteo data in Capacity Planner."""
+    """
+    Update projects from Meteo data in Capacity Planner.
+
+    The deployment type of each project is kept as it is.
+    Returns the list of writes that failed.
+    """
+    writes = []
     for project in project_list:
-        project_name = project.get("project_name")
-        pod = project.get("cloud")
-        team_name = get_team_name(project)
-        pod_id = get_pod_id(cap_planner, "cloud" + str(pod))
-        project_id = get_project_id(cap_planner, project_name, pod_id)
+        pod_id = get_pod_id(cap_planner, project.pod_name)
+        project_id = get_project_id(cap_planner, project.name, pod_id)
         deployment_type = get_deployment_type_name(cap_planner, project_id)
-        item = '{"pod_id": "' + pod_id + \
-               '", "team_id": "' + get_team_id(cap_planner, team_name) + \
-               '", "deploymenttype_id": "' + get_deployment_type_id(cap_planner, deployment_type) +\
-               '", "name": "' + project.get("project_name") + \
-               '", "cpu": ' + project.get("allocated_cpu") + \
-               ', "memory_mb": ' + project.get("allocated_ram") + \
-               ', "cinder_gb": ' + project.get("allocated_storage") + \
-               '}'
-        cap_planner.execute_cap_put_rest_call(
-            '/api/projects/' + project_id,
-            item
+        item = get_project_item(
+            project,
+            pod_id,
+            get_team_id(cap_planner, project.team_name),
+            get_deployment_type_id(cap_planner, deployment_type)
         )
+        writes.append(("update project " + project.name, project_id, item))
+    return cap_planner.write_executor.run(cap_planner.get_write_tasks('PUT', 'projects', writes))
 
 
 def delete_cap_planner_data(cap_planner):
@@ -371,122 +562,394 @@ def delete_cap_planner_data(cap_planner):
     Doesn't include Deployment Types.
     """
     LOG.info("Deleting all projects from Capacity Planner")
-    delete_projects(cap_planner)
+    with metrics.METRICS.phase('delete projects'):
+        failed_tasks = delete_projects(cap_planner)
 
     LOG.info("Deleting all teams from Capacity Planner")
-    delete_teams(cap_planner)
+    with metrics.METRICS.phase('delete teams'):
+        failed_tasks += delete_teams(cap_planner)
 
     LOG.info("Deleting all pods from Capacity Planner")
-    delete_pods(cap_planner)
+    with metrics.METRICS.phase('delete pods'):
+        failed_tasks += delete_pods(cap_planner)
+
+    executor.raise_for_failed_tasks(failed_tasks)
 
 
-def upload_cap_planner_data(cap_planner, pods_list, projects_list):
+def upload_cap_planner_data(cap_planner, pods_list, projects_list,
+                            batch_size=cli_options.DEFAULT_BATCH_SIZE):
     """
     Upload all Pods, Teams, and Projects to Capacity Planner.
 
+    Projects are read and written batch_size at a time, with the
+    teams of each batch created before its projects.
     Doesn't include Deployment Types.
     """
     LOG.info("Creating all pods in Capacity Planner")
-    create_pods(cap_planner, pods_list)
+    with metrics.METRICS.phase('create pods'):
+        failed_tasks = create_pods(cap_planner, pods_list)
 
-    LOG.info("Creating all teams in Capacity Planner")
-    create_teams(cap_planner, projects_list)
+    LOG.info("Creating all teams and projects in Capacity Planner")
+    with metrics.METRICS.phase('create teams and projects'):
+        for project_batch in batches(projects_list, batch_size):
+            failed_tasks += create_teams(cap_planner, project_batch)
+            failed_tasks += create_projects(cap_planner, project_batch)
 
-    LOG.info("Creating all projects in Capacity Planner")
-    create_projects(cap_planner, projects_list)
+    executor.raise_for_failed_tasks(failed_tasks)
 
 
-def update_cap_planner_data(cap_planner, projects_list):
+def update_cap_planner_data(cap_planner, projects_list, skipped_keys=None):
     """
     Update Teams and Projects in Capacity Planner.
 
+    Only the differences between Meteo and the Capacity Planner are written.
+    The projects whose Meteo record was skipped as invalid, whose keys are
+    added to skipped_keys as projects_list is read, are left as they are.
     Doesn't include Deployment Types.
     """
-    LOG.info("Adding new teams")
-    add_new_teams(cap_planner, projects_list)
+    LOG.info("Working out changes between Meteo and Capacity Planner")
+    with metrics.METRICS.phase('compute changeset'):
+        changeset = get_changeset(
+            cap_planner, projects_list, skipped_keys if skipped_keys is not None else set()
+        )
+    LOG.info("Changes to apply: %s", changeset.summary())
+    with metrics.METRICS.phase('apply changeset'):
+        failed_tasks = apply_changeset(cap_planner, changeset)
+    executor.raise_for_failed_tasks(failed_tasks)
 
-    LOG.info("Updating projects")
-    update_projects_and_teams(cap_planner, projects_list)
 
-    LOG.info("Removing unused projects")
-    remove_unused_projects(cap_planner, projects_list)
+def sync_cap_planner_data(cap_planner, snapshot_file_name, since_parameter=None):
+    """
+    Update Teams and Projects in Capacity Planner, only processing what changed since the last sync.
 
-    LOG.info("Removing unused teams")
-    remove_unused_teams(cap_planner, projects_list)
-
-
-def update_projects_and_teams(cap_planner, project_list):
-    """Update existing projects and add new projects to Capacity Planner."""
-    existing_projects_list = []
-    new_projects_list = []
-    projects_to_create = []
-    projects_to_update = []
-    existing_projects = get_project_list(cap_planner)
-    for project in existing_projects:
-        existing_projects_list.append(project.get("name"))
-    for project in project_list:
-        new_projects_list.append(project)
-    for new_project in new_projects_list:
-        if new_project.get('project_name') not in existing_projects_list:
-            projects_to_create.append(new_project)
+    The last sync is read from the snapshot in snapshot_file_name, see
+    sync_with_snapshot, and a new snapshot is stored there once all the
+    writes have succeeded. Doesn't include Deployment Types.
+    """
+    sync_with_snapshot(
+        cap_planner, snapshot.Snapshot.load(snapshot_file_name), since_parameter
+    ).save(snapshot_file_name)
+
+
+def sync_with_snapshot(cap_planner, previous, since_parameter=None):
+    """
+    Update Teams and Projects in Capacity Planner, only processing what changed since the snapshot.
+
+    The changes are found from Meteo's since parameter if given, or by
+    comparing every Meteo project with the snapshot. Without a previous
+    snapshot, every project is compared, as update_cap_planner_data does.
+    Returns the new snapshot, once all the writes have succeeded.
+    """
+    cursor = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    skipped_keys = set()
+    if previous is None:
+        project_hashes = {}
+        update_cap_planner_data(cap_planner, (
+            project for key, project in record_project_hashes(
+                meteo.iter_all_project_changes(cap_planner, skipped_keys), project_hashes
+            )
+        ), skipped_keys)
+    else:
+        if since_parameter and previous.cursor:
+            changes = meteo.iter_project_changes(
+                cap_planner, since_parameter, previous.cursor, skipped_keys
+            )
+            complete = False
         else:
-            projects_to_update.append(new_project)
-    for project in projects_to_create:
-        existing_teams = get_team_list(cap_planner)
-        team_name = get_team_name(project)
-        if team_name not in existing_teams:
-            post_team(cap_planner, team_name)
+            changes, complete = meteo.iter_all_project_changes(cap_planner, skipped_keys), True
+        with metrics.METRICS.phase('compute changeset'):
+            changeset, project_hashes = get_incremental_changeset(
+                cap_planner, previous, changes, complete, skipped_keys
+            )
+        LOG.info("Changes to apply: %s", changeset.summary())
+        with metrics.METRICS.phase('apply changeset'):
+            failed_tasks = apply_changeset(cap_planner, changeset)
+        executor.raise_for_failed_tasks(failed_tasks)
+    return get_snapshot(cap_planner, project_hashes, cursor if since_parameter else None)
+
+
+def run_daemon(cap_planner, args):
+    """
+    Keep Capacity Planner in line with Meteo until stopped, syncing every daemon interval.
+
+    The Capacity Planner index, HTTP connections and the snapshot of the
+    last sync are kept between syncs, each sync revalidating the index
+    with conditional requests, creating missing pods, then applying the
+    project changes since the last sync.
+    """
+    metrics.METRICS.enable()
+    last_snapshot = [snapshot.Snapshot.load(args.snapshot_file) if args.snapshot_file else None]
+
+    def sync():
+        """Run one sync, keeping the new snapshot."""
+        cap_planner.refresh_index()
+        with metrics.METRICS.phase('create pods'):
+            executor.raise_for_failed_tasks(
+                create_missing_pods(cap_planner, meteo.iter_cloud_data(cap_planner))
+            )
+        last_snapshot[0] = sync_with_snapshot(
+            cap_planner, last_snapshot[0], args.meteo_since_parameter
+        )
+        if args.snapshot_file:
+            last_snapshot[0].save(args.snapshot_file)
+        cap_planner.write_executor.progress.log_progress()
+
+    sync_daemon = scheduler.SyncDaemon(sync, args.daemon_interval, args.daemon_jitter)
+    status_server = scheduler.StatusServer(sync_daemon, args.daemon_host, args.daemon_port)
+    status_server.start()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *_: sync_daemon.stop())
+    try:
+        sync_daemon.run_forever()
+    finally:
+        status_server.stop()
+
+
+def record_project_hashes(changes, project_hashes):
+    """Pass the given (key, project) pairs through, keeping the hash of each in project_hashes."""
+    for key, project in changes:
+        project_hashes[key] = snapshot.project_hash(project)
+        yield key, project
+
+
+def get_incremental_changeset(cap_planner, previous, changes, complete, skipped_keys=frozenset()):
+    """
+    Get the changes needed to bring Capacity Planner in line with the Meteo projects that changed.
+
+    The changes are (key, project) pairs, the project being None if it
+    was deleted. If complete, they list every valid Meteo project, and
+    the projects of the previous snapshot not among them were deleted.
+    The skipped_keys, filled in as the changes are read, are those of the
+    projects skipped as invalid, which are left as they are and keep their
+    previous hash, see check_skipped_keys.
+    Returns the change set and the hash of each Meteo project, keyed as
+    in the snapshot.
+    """
+    changed_projects, deleted_keys, project_hashes = get_changed_projects(
+        previous, changes, complete, skipped_keys
+    )
+    desired_projects = get_desired_projects(cap_planner, changed_projects)
+    planner_projects = list(
+        cap_planner.cap_projects.get_by_name_and_pod(name, pod_id)
+        for name, pod_id in desired_projects
+    ) + list(
+        get_deleted_planner_project(cap_planner, previous, key) for key in deleted_keys
+    )
+    actual_projects = {}
+    for project in planner_projects:
+        if project is not None:
+            actual = get_actual_project(cap_planner, project)
+            actual_projects[actual.key] = actual
+
+    changeset = reconcile.ChangeSet()
+    reconcile.diff_projects(desired_projects, actual_projects, changeset)
+    desired_team_names = set(desired.team_name for desired in desired_projects.values())
+    changeset.teams_to_create.extend(sorted(desired_team_names - set(get_team_list(cap_planner))))
+    changeset.teams_to_delete.extend(
+        get_unused_team_names(cap_planner, changeset, desired_team_names)
+    )
+    return changeset, project_hashes
+
+
+def get_changed_projects(previous, changes, complete, skipped_keys):
+    """
+    Get the Meteo projects that changed since the previous snapshot, see get_incremental_changeset.
+
+    Returns the list of changed records.MeteoProject, the set of keys of
+    the deleted projects, and the hash of each Meteo project.
+    """
+    if complete:
+        project_hashes = {}
+    else:
+        project_hashes = dict(
+            (key, content_hash) for key, (content_hash, _) in previous.projects.items()
+        )
+    changed_projects = []
+    deleted_keys = set()
+    for key, project in changes:
+        if project is None:
+            deleted_keys.add(key)
+            project_hashes.pop(key, None)
+            continue
+        content_hash = snapshot.project_hash(project)
+        project_hashes[key] = content_hash
+        if previous.projects.get(key, (None, None))[0] != content_hash:
+            changed_projects.append(project)
+    if complete:
+        check_skipped_keys(skipped_keys)
+    for key in skipped_keys:
+        deleted_keys.discard(key)
+        if key in previous.projects:
+            project_hashes[key] = previous.projects[key][0]
+    if complete:
+        deleted_keys.update(key for key in previous.projects if key not in project_hashes)
+    return changed_projects, deleted_keys, project_hashes
+
+
+def get_deleted_planner_project(cap_planner, previous, key):
+    """
+    Get the Capacity Planner project of a deleted Meteo project, or None if there isn't one.
+
+    The project is looked up by the _id the previous snapshot holds for
+    it, or else by its name and pod.
+    """
+    cloud, name = key
+    planner_id = previous.projects.get(key, (None, None))[1]
+    project = cap_planner.cap_projects.get_by_id(planner_id) if planner_id else None
+    if project is None:
+        project = cap_planner.cap_projects.get_by_name_and_pod(
+            name, get_pod_id(cap_planner, "cloud" + cloud)
+        )
+    return project
+
+
+def get_unused_team_names(cap_planner, changeset, desired_team_names):
+    """
+    Get the names of the teams that no project will use once the change set is applied.
+
+    Only the teams that the deleted and updated projects leave are considered.
+    """
+    leaving_projects = changeset.projects_to_delete + [
+        actual for _, actual in changeset.projects_to_update
+    ]
+    candidate_team_names = set(
+        project.team_name for project in leaving_projects
+    ) - desired_team_names
+    if not candidate_team_names:
+        return []
+    leaving_ids = set(project.planner_id for project in leaving_projects)
+    used_team_ids = set(
+        project.get("team_id") for project in cap_planner.cap_projects
+        if project.get("_id") not in leaving_ids
+    )
+    return sorted(
+        team_name for team_name in candidate_team_names
+        if not any(
+            team_id in used_team_ids for team_id in cap_planner.cap_teams.by_name.get(team_name, {})
+        )
+    )
+
+
+def get_snapshot(cap_planner, project_hashes, cursor=None):
+    """Get the snapshot of the given Meteo project hashes, with the _id of each project."""
+    projects = {}
+    for (cloud, name), content_hash in project_hashes.items():
+        planner_id = get_project_id(cap_planner, name, get_pod_id(cap_planner, "cloud" + cloud))
+        projects[(cloud, name)] = (content_hash, planner_id or None)
+    return snapshot.Snapshot(projects, cursor)
+
+
+def get_desired_projects(cap_planner, project_list):
+    """
+    Get the state Meteo wants each project to be in.
+
+    Returns a dictionary of records.ProjectState keyed by project name and pod id.
+    """
+    desired_projects = {}
+    for project in project_list:
+        desired = records.ProjectState.from_meteo(
+            project, get_pod_id(cap_planner, project.pod_name)
+        )
+        desired_projects[desired.key] = desired
+    return desired_projects
+
+
+def get_actual_projects(cap_planner):
+    """
+    Get the state each project is in in Capacity Planner.
+
+    Returns a dictionary of records.ProjectState keyed by project name and pod id.
+    """
+    actual_projects = {}
+    for project in cap_planner.cap_projects:
+        actual = get_actual_project(cap_planner, project)
+        actual_projects[actual.key] = actual
+    return actual_projects
+
+
+def get_actual_project(cap_planner, project):
+    """Get the state of the given Capacity Planner project dictionary, as a records.ProjectState."""
+    team = cap_planner.cap_teams.get_by_id(project.get("team_id"))
+    return records.ProjectState.from_planner(
+        project,
+        team.get("name") if team is not None else None
+    )
+
+
+def get_changeset(cap_planner, project_list, skipped_keys=frozenset()):
+    """
+    Get the changes needed to bring Capacity Planner in line with Meteo.
+
+    The skipped_keys are filled in as project_list is read, see
+    get_kept_project_keys.
+    """
+    desired_projects = get_desired_projects(cap_planner, project_list)
+    return reconcile.compute_changeset(
+        desired_projects,
+        get_actual_projects(cap_planner),
+        get_team_list(cap_planner),
+        get_kept_project_keys(cap_planner, skipped_keys)
+    )
+
+
+def check_skipped_keys(skipped_keys):
+    """
+    Raise a records.InvalidRecordException if a skipped Meteo project has no cloud or name.
+
+    The Capacity Planner project such a record stands for can't be
+    told apart from a deleted one, so nothing is updated.
+    """
+    unknown_keys = [key for key in skipped_keys if None in key]
+    if unknown_keys:
+        raise records.InvalidRecordException(
+            "%d invalid Meteo projects have no project_name or cloud, the Capacity Planner "
+            "projects they stand for can't be told apart from deleted ones, not updating"
+            % len(unknown_keys)
+        )
+
+
+def get_kept_project_keys(cap_planner, skipped_keys):
+    """
+    Get the natural keys of the Capacity Planner projects whose Meteo record was skipped as invalid.
+
+    These projects are kept as they are rather than deleted, see check_skipped_keys.
+    Returns a set of (project name, pod id) pairs.
+    """
+    check_skipped_keys(skipped_keys)
+    return set((name, get_pod_id(cap_planner, "cloud" + cloud)) for cloud, name in skipped_keys)
+
+
+def apply_changeset(cap_planner, changeset):
+    """
+    Apply the given change set to Capacity Planner.
+
+    Returns the list of writes that failed.
+    """
+    LOG.info("Adding new teams")
+    failed_tasks = create_team_list(cap_planner, changeset.teams_to_create)
+
     LOG.info("Creating new projects in Capacity Planner")
-    create_projects(cap_planner, projects_to_create)
+    failed_tasks += create_projects(
+        cap_planner, [project.source for project in changeset.projects_to_create]
+    )
+
     LOG.info("Updating projects in Capacity Planner")
-    update_projects(cap_planner, projects_to_update)
+    failed_tasks += update_projects(
+        cap_planner, [desired.source for desired, _ in changeset.projects_to_update]
+    )
 
+    LOG.info("Removing unused projects")
+    failed_tasks += delete_projects(cap_planner, [
+        cap_planner.cap_projects.get_by_id(project.planner_id)
+        for project in changeset.projects_to_delete
+    ])
 
-def add_new_teams(cap_planner, project_list):
-    """Add any new teams to Capacity Planner."""
-    cap_plan_team_list = get_team_list(cap_planner)
-    opstk_team_list = []
-    teams_to_add = set()
-    for project in project_list:
-        team_name = get_team_name(project)
-        opstk_team_list.append(team_name)
-    for team in opstk_team_list:
-        if team not in cap_plan_team_list:
-            teams_to_add.add(team)
-    for team in teams_to_add:
-        post_team(cap_planner, team)
-
-
-def remove_unused_teams(cap_planner, project_list):
-    """Remove unused teams from Capacity Planner."""
-    cap_plan_team_list = get_team_list(cap_planner)
-    opstk_team_list = []
-    teams_to_remove = []
-    for project in project_list:
-        team_name = get_team_name(project)
-        opstk_team_list.append(team_name)
-    for team in cap_plan_team_list:
-        if team not in opstk_team_list:
-            teams_to_remove.append(team)
-    for team_name in teams_to_remove:
-        delete_team(cap_planner, team_name)
-
-
-def remove_unused_projects(cap_planner, project_list):
-    """Remove unused projects from Capacity Planner."""
-    cap_plan_project_list = get_project_list(cap_planner)
-    opstk_project_list = project_list
-    for project in cap_plan_project_list:
-        for opstk_project in opstk_project_list:
-            project_in_opstk = False
-            if project["name"] == opstk_project["project_name"]:
-                project_in_opstk = True
-                break
-        if not project_in_opstk:
-            del_item = '/api/projects/' + project.get("_id")
-            cap_planner.execute_cap_delete_rest_call(
-                del_item
-            )
+    LOG.info("Removing unused teams")
+    failed_tasks += delete_team_list(cap_planner, [
+        team for name in changeset.teams_to_delete
+        for team in cap_planner.cap_teams.by_name.get(name, {}).values()
+    ])
+    return failed_tasks
 
 
 if __name__ == "__main__":
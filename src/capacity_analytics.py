@@ -0,0 +1,164 @@
+"""
+This module contains the capacity and headroom analysis of the pods and projects imported.
+
+The Meteo clouds and projects are loaded into NumPy columns, one value
+per pod or project, and the allocations of each pod's projects are
+summed and compared with its capacity in one vectorised pass, so that
+the whole estate is checked in milliseconds. NumPy is optional, without
+it no analysis is made
+"""
+
+import json
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_UTILISATION = 1.0
+
+UTILISATION_COLUMNS = ('cpu_utilisation', 'memory_utilisation', 'cinder_utilisation')
+
+
+def is_available():
+    """Return True if NumPy is installed, and the analysis can be made."""
+    return numpy is not None
+
+
+def ratio(numerators, denominators):
+    """
+    Return numerators / denominators element-wise.
+
+    Where the denominator is 0, the ratio is infinite if the numerator
+    is positive and 0 otherwise
+    """
+    # NumPy's ufuncs are created when it is imported, so pylint can't see them
+    return numpy.divide(  # pylint: disable=no-member
+        numerators,
+        denominators,
+        out=numpy.where(numerators > 0, numpy.inf, 0.0),
+        where=denominators > 0
+    )
+
+
+class CapacityReport(object):
+    """
+    Holds the capacity, allocations and headroom of each pod, one NumPy column per figure.
+
+    A pod is overcommitted when its projects are allocated more than
+    max_utilisation of its contention adjusted cpu, its memory or its
+    cinder storage
+    """
+
+    def __init__(self, pod_names, columns, max_utilisation, unmatched_projects=0):
+        """Initialize a report of the given pods, the columns in the same order as the names."""
+        self.pod_names = pod_names
+        self.columns = columns
+        self.max_utilisation = max_utilisation
+        self.unmatched_projects = unmatched_projects
+
+    def overcommitted(self):
+        """Return a boolean column, True for the overcommitted pods."""
+        overcommitted = numpy.zeros(len(self.pod_names), dtype=bool)
+        for column_name in UTILISATION_COLUMNS:
+            overcommitted |= self.columns[column_name] > self.max_utilisation
+        return overcommitted
+
+    def overcommitted_pod_names(self):
+        """Return the names of the overcommitted pods."""
+        return [self.pod_names[position] for position in numpy.flatnonzero(self.overcommitted())]
+
+    def log_overcommitted_pods(self):
+        """Log a warning for each overcommitted pod, with its utilisation."""
+        for position in numpy.flatnonzero(self.overcommitted()):
+            LOG.warning(
+                "Pod %s is overcommitted: cpu %.0f%%, memory %.0f%%, cinder %.0f%% allocated",
+                self.pod_names[position],
+                self.columns['cpu_utilisation'][position] * 100,
+                self.columns['memory_utilisation'][position] * 100,
+                self.columns['cinder_utilisation'][position] * 100
+            )
+
+    def to_dict(self):
+        """Return the report as a dictionary, with None for ratios that are infinite."""
+        column_names = sorted(self.columns)
+        column_values = [self.columns[column_name].tolist() for column_name in column_names]
+        overcommitted = self.overcommitted().tolist()
+        pods = []
+        for position, pod_name in enumerate(self.pod_names):
+            pod = {'name': pod_name, 'overcommitted': overcommitted[position]}
+            for column_name, values in zip(column_names, column_values):
+                value = values[position]
+                pod[column_name] = value if numpy.isfinite(value) else None
+            pods.append(pod)
+        return {
+            'max_utilisation': self.max_utilisation,
+            'overcommitted_pods': self.overcommitted_pod_names(),
+            'unmatched_projects': self.unmatched_projects,
+            'pods': pods
+        }
+
+    def write_file(self, file_name):
+        """Write the report as JSON to the given file."""
+        with open(file_name, 'w') as report_file:
+            json.dump(self.to_dict(), report_file, indent=2, sort_keys=True, separators=(',', ': '))
+        LOG.info("Wrote the capacity report of %d pods to %s", len(self.pod_names), file_name)
+
+
+def analyse(clouds, projects, max_utilisation=DEFAULT_MAX_UTILISATION):
+    """
+    Return a CapacityReport of the given records.MeteoCloud and records.MeteoProject lists.
+
+    Projects are matched with the cloud of the same name, projects of a
+    cloud that isn't in the list are counted as unmatched
+    """
+    capacity = numpy.array(list(
+        (cloud.cpu, cloud.cpu_contention_ratio, cloud.memory_mb, cloud.cinder_gb, cloud.cinder_iops)
+        for cloud in clouds
+    ), dtype=float).reshape(-1, 5)
+    (project_counts, (allocated_cpu, allocated_memory_mb, allocated_cinder_gb),
+     unmatched) = get_allocations(clouds, projects)
+    cpu_capacity = capacity[:, 0] * capacity[:, 1]
+    memory_mb, cinder_gb, cinder_iops = capacity[:, 2], capacity[:, 3], capacity[:, 4]
+    columns = {
+        'projects': project_counts,
+        'allocated_cpu': allocated_cpu,
+        'allocated_memory_mb': allocated_memory_mb,
+        'allocated_cinder_gb': allocated_cinder_gb,
+        'cpu_capacity': cpu_capacity,
+        'cpu_headroom': cpu_capacity - allocated_cpu,
+        'cpu_utilisation': ratio(allocated_cpu, cpu_capacity),
+        'memory_headroom_mb': memory_mb - allocated_memory_mb,
+        'memory_utilisation': ratio(allocated_memory_mb, memory_mb),
+        'cinder_headroom_gb': cinder_gb - allocated_cinder_gb,
+        'cinder_utilisation': ratio(allocated_cinder_gb, cinder_gb),
+        'cinder_iops_per_allocated_gb': ratio(cinder_iops, allocated_cinder_gb)
+    }
+    return CapacityReport(
+        [cloud.pod_name for cloud in clouds], columns, max_utilisation, unmatched
+    )
+
+
+def get_allocations(clouds, projects):
+    """
+    Return the projects of each of the given clouds, and the cpu, memory_mb and cinder_gb allocated.
+
+    Returns the number of projects per cloud, the list of the three
+    allocation columns, and the number of projects matching no cloud
+    """
+    pod_positions = dict((cloud.cloud_name, position) for position, cloud in enumerate(clouds))
+    allocations = numpy.array([
+        (pod_positions.get(project.cloud, -1), project.cpu, project.memory_mb, project.cinder_gb)
+        for project in projects
+    ], dtype=float).reshape(-1, 4)
+    matched = allocations[:, 0] >= 0
+    project_pods = allocations[matched, 0].astype(int)
+    allocated = [
+        numpy.bincount(project_pods, weights=allocations[matched, column], minlength=len(clouds))
+        for column in (1, 2, 3)
+    ]
+    project_counts = numpy.bincount(project_pods, minlength=len(clouds))
+    return project_counts, allocated, int(len(matched) - matched.sum())
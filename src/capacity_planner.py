@@ -1,33 +1,419 @@
 """This file contains logic relating to the capacity planner."""
 
+import urllib
 import urlparse
 import logging
 import json
+import threading
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+import executor
+import http_cache
+import journal
+import json_stream
+import metrics
+import resilience
+import utils
 
 LOG = logging.getLogger(__name__)
-logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (10, 120)
+DEFAULT_BULK_CHUNK_SIZE = 100
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_PAGE_SIZE = 1000
 
-class CapacityPlanner(object):
+BULK_COLLECTIONS = ('teams', 'pods', 'projects')
+BULK_METHODS = ('POST', 'PUT', 'DELETE')
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+UNPROCESSED_STATUS_CODES = (429, 503)
+
+INDEXED_COLLECTIONS = {
+    'deploymenttypes': 'cap_deployment_types',
+    'teams': 'cap_teams',
+    'pods': 'cap_pods',
+    'projects': 'cap_projects'
+}
+
+
+def split_collection_url(url_string):
+    """
+    Split a capacity planner url into its collection name and item id.
+
+    '/api/projects/1234' gives ('projects', '1234'),
+    '/api/teams/' gives ('teams', None)
+    """
+    parts = [part for part in urlparse.urlparse(url_string).path.split('/') if part]
+    if len(parts) < 2 or parts[0] != 'api':
+        return None, None
+    item_id = parts[2] if len(parts) > 2 else None
+    return parts[1], item_id
+
+
+def endpoint_name(method, url_string):
+    """
+    Return the name of the endpoint a request goes to, for metrics.
+
+    Item ids are replaced so that all the calls to the same route share
+    a name, 'PUT /api/projects/1234' gives 'PUT /api/projects/{id}'
+    """
+    collection_name, item_id = split_collection_url(url_string)
+    if collection_name is None:
+        return method + ' ' + urlparse.urlparse(url_string).path
+    if item_id is None:
+        return method + ' /api/' + collection_name + '/'
+    if item_id == 'bulk':
+        return method + ' /api/' + collection_name + '/bulk/'
+    return method + ' /api/' + collection_name + '/{id}'
+
+
+def collection_url(collection_name):
+    """Return the url of the given collection."""
+    return '/api/' + collection_name + '/'
+
+
+def is_transient_error(error):
+    """Return True if the given exception, raised by requests, is likely to be transient."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def is_unprocessed_error(error):
+    """Return True if the given requests exception means the request wasn't processed."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in UNPROCESSED_STATUS_CODES
+    return isinstance(error, requests.ConnectTimeout)
+
+
+def bulk_url(collection_name):
+    """Return the url of the bulk route of the given collection."""
+    return '/api/' + collection_name + '/bulk/'
+
+
+def chunks(items, chunk_size):
+    """Split the given list into lists of at most chunk_size items."""
+    return [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+
+
+class CollectionIndex(object):
+    """
+    In memory copy of a capacity planner collection.
+
+    Items are indexed by their _id, by their name and, for items
+    that belong to a pod, by their (name, pod_id) pair
+    """
+
+    def __init__(self, items=None):
+        """Initialize the index, optionally loading the given items."""
+        self.by_id = {}
+        self.by_name = {}
+        self.by_name_and_pod = {}
+        self.load(items or [])
+
+    def __len__(self):
+        """Return the number of items in the index."""
+        return len(self.by_id)
+
+    def __iter__(self):
+        """Iterate over a copy of the indexed items."""
+        return iter(list(self.by_id.values()))
+
+    def load(self, items):
+        """Replace the contents of the index with the given items."""
+        self.by_id = {}
+        self.by_name = {}
+        self.by_name_and_pod = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """Add or replace an item in the index."""
+        item_id = item.get('_id')
+        if item_id is None:
+            return
+        if item_id in self.by_id:
+            self.remove(item_id)
+        self.by_id[item_id] = item
+        self.by_name.setdefault(item.get('name'), OrderedDict())[item_id] = item
+        if 'pod_id' in item:
+            self.by_name_and_pod[(item.get('name'), item.get('pod_id'))] = item
+
+    def remove(self, item_id):
+        """Remove an item from the index, returning it if it was there."""
+        item = self.by_id.pop(item_id, None)
+        if item is None:
+            return None
+        name = item.get('name')
+        named_items = self.by_name.get(name, {})
+        named_items.pop(item_id, None)
+        if not named_items:
+            self.by_name.pop(name, None)
+        if self.by_name_and_pod.get((name, item.get('pod_id'))) is item:
+            del self.by_name_and_pod[(name, item.get('pod_id'))]
+        return item
+
+    def get_by_id(self, item_id):
+        """Return the item with the given id, or None."""
+        return self.by_id.get(item_id)
+
+    def get_by_name(self, name):
+        """Return the most recently added item with the given name, or None."""
+        named_items = self.by_name.get(name)
+        if not named_items:
+            return None
+        return next(reversed(named_items.values()))
+
+    def get_by_name_and_pod(self, name, pod_id):
+        """Return the item with the given name in the given pod, or None."""
+        return self.by_name_and_pod.get((name, pod_id))
+
+
+class PooledSession(requests.Session):
+    """
+    A requests session with a bounded, keep-alive connection pool.
+
+    It keeps track of the connection pools it has used so that the number
+    of connections opened can be compared with the number of requests sent
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        """Initialize the session with a connection pool of the given size."""
+        super(PooledSession, self).__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        self.used_pools = {}
+
+    def send(self, request, **kwargs):
+        """Send the request, remembering the connection pool that served it, with its metrics."""
+        start_time = metrics.METRICS.start_timer()
+        try:
+            response = super(PooledSession, self).send(request, **kwargs)
+        except requests.exceptions.RequestException:
+            metrics.METRICS.record_call(
+                'rest', endpoint_name(request.method, request.url), start_time,
+                bytes_sent=len(request.body or ''), error=True
+            )
+            raise
+        if start_time is not None:
+            if kwargs.get('stream'):
+                bytes_received = int(response.headers.get('Content-Length') or 0)
+            else:
+                bytes_received = len(response.content)
+            metrics.METRICS.record_call(
+                'rest', endpoint_name(request.method, request.url), start_time,
+                bytes_sent=len(request.body or ''),
+                bytes_received=bytes_received,
+                error=not response.ok
+            )
+        pool = getattr(response.raw, '_pool', None)
+        if pool is not None:
+            self.used_pools[id(pool)] = pool
+        return response
+
+    def connection_stats(self):
+        """Return the number of requests sent, and connections opened and reused."""
+        requests_sent = sum(pool.num_requests for pool in self.used_pools.values())
+        connections_opened = sum(pool.num_connections for pool in self.used_pools.values())
+        return {
+            'requests': requests_sent,
+            'connections_opened': connections_opened,
+            'connections_reused': max(requests_sent - connections_opened, 0)
+        }
+
+
+class CapacityPlanner(object):  # pylint: disable=too-many-instance-attributes,too-many-public-methods
     """Represents a capacity planner instance."""
 
     def __init__(self, kwargs):
         """Initialize a capacity planner object."""
         self.base_url = kwargs.pop('base_url')
+        self.timeout = kwargs.pop('timeout', DEFAULT_TIMEOUT)
+        self.write_executor = executor.WriteExecutor(
+            workers=kwargs.pop('workers', executor.DEFAULT_WORKERS),
+            progress_interval=kwargs.pop('progress_interval', executor.DEFAULT_PROGRESS_INTERVAL)
+        )
+        self.rate_limiter = executor.RateLimiter(kwargs.pop('rate_limit', None))
+        self.retry_policy = resilience.RetryPolicy(
+            attempts=kwargs.pop('retry_attempts', resilience.DEFAULT_ATTEMPTS)
+        )
+        self.limiter = None
+        if kwargs.pop('adaptive_concurrency', True):
+            self.limiter = resilience.AdaptiveLimiter(self.write_executor.workers)
+        self.session = PooledSession(
+            pool_size=max(kwargs.pop('pool_size', DEFAULT_POOL_SIZE), self.write_executor.workers)
+        )
+        self.journal = kwargs.pop('journal', None)
+        self.changeset_plan = kwargs.pop('changeset_plan', None)
+        self.http_cache = http_cache.HttpCache(
+            directory=kwargs.pop('http_cache_dir', None),
+            max_bytes=kwargs.pop('http_cache_max_bytes', http_cache.DEFAULT_MAX_BYTES)
+        )
+        self.index_lock = threading.Lock()
+        self.bulk_chunk_size = kwargs.pop('bulk_chunk_size', DEFAULT_BULK_CHUNK_SIZE)
+        self.page_size = kwargs.pop('page_size', None)
+        self.bulk_methods = {}
+        self.detect_bulk_support()
+        self.cap_deployment_types = CollectionIndex()
+        self.cap_teams = CollectionIndex()
+        self.cap_pods = CollectionIndex()
+        self.cap_projects = CollectionIndex()
+        self.refresh_index()
         self.default_deployment_type_id = self.get_deployment_type_id(
             deployment_type_name=kwargs.pop('default_deployment_type_name')
         )
-        self.cap_teams = self.execute_cap_get_rest_call('/api/teams/')
         self.default_team_id = self.get_team_id(
             team_name=kwargs.pop('default_team_name')
         )
-        self.cap_pods = self.execute_cap_get_rest_call('/api/pods/')
-        self.cap_projects = self.execute_cap_get_rest_call('/api/projects/')
 
         if kwargs:
             raise TypeError('Unexpected **kwargs: %r' % kwargs)
 
+    def refresh_index(self):
+        """Load the deployment types, teams, pods and projects from the capacity planner."""
+        for collection_name in INDEXED_COLLECTIONS:
+            self.refresh_collection_index(collection_name)
+
+    def refresh_collection_index(self, collection_name):
+        """Load the items of the given collection from the capacity planner."""
+        if self.page_size:
+            items = self.iter_collection_pages(collection_name, page_size=self.page_size)
+        else:
+            items = self.execute_cap_get_rest_call(collection_url(collection_name))
+        self.get_collection_index(collection_name).load(items)
+
+    def get_collection_index(self, collection_name):
+        """Return the index for the given collection name, or None if it isn't indexed."""
+        attribute_name = INDEXED_COLLECTIONS.get(collection_name)
+        if attribute_name is None:
+            return None
+        return getattr(self, attribute_name)
+
+    def update_index(self, method, url_string, response_data, json_data=None):
+        """
+        Keep the index current after a write towards the capacity planner.
+
+        POST and PUT responses are merged with the data that was sent,
+        DELETE removes the item named in the url
+        """
+        collection_name, item_id = split_collection_url(url_string)
+        self.update_index_item(
+            method, collection_name, (url_string, item_id, json_data), response_data
+        )
+
+    def update_index_item(self, method, collection_name, write, response_data):
+        """
+        Keep the index of the given collection, and the journal if any, current after a write.
+
+        The write is a (description, item_id, json_data) tuple, as with
+        get_write_tasks
+        """
+        _, item_id, json_data = write
+        if self.journal is not None:
+            written_id = response_data.get('_id') if isinstance(response_data, dict) else None
+            self.journal.record(
+                method,
+                collection_name,
+                journal.write_key(method, item_id, json_data),
+                written_id or item_id
+            )
+        index = self.get_collection_index(collection_name)
+        if index is None:
+            return
+        if method == 'DELETE':
+            with self.index_lock:
+                index.remove(item_id)
+            return
+        item = json.loads(json_data) if json_data else {}
+        if isinstance(response_data, dict):
+            item.update(response_data)
+        if item_id is not None:
+            item.setdefault('_id', item_id)
+        with self.index_lock:
+            index.add(item)
+
+    def detect_bulk_support(self):
+        """
+        Find out which collections have a bulk route, and which methods it allows.
+
+        This is done once, with an OPTIONS request per collection, a
+        bulk chunk size of 0 turns bulk writes off altogether
+        """
+        self.bulk_methods = {}
+        if not self.bulk_chunk_size:
+            return
+        for collection_name in BULK_COLLECTIONS:
+            full_url = urlparse.urljoin(self.base_url, bulk_url(collection_name))
+            try:
+                response = self.session.options(full_url, timeout=self.timeout)
+            except requests.RequestException:
+                allowed_methods = ''
+            else:
+                allowed_methods = response.headers.get('Allow', '') if response.ok else ''
+            self.bulk_methods[collection_name] = set(
+                method.strip().upper() for method in allowed_methods.split(',')
+            ) & set(BULK_METHODS)
+        LOG.info("Capacity Planner bulk write support: %s", self.bulk_methods)
+
+    def supports_bulk(self, method, collection_name):
+        """Return True if the given collection has a bulk route for the given method."""
+        return method in self.bulk_methods.get(collection_name, ())
+
+    def get_write_tasks(self, method, collection_name, writes):
+        """
+        Return the write tasks that apply the given writes to a collection.
+
+        Each write is a (description, item_id, json_data) tuple, json_data
+        is None for deletes and item_id is None for creates. The writes are
+        sent in chunks to the bulk route when the capacity planner has one,
+        and one by one otherwise. Writes the journal shows as done by an
+        earlier run are left out
+        """
+        writes = list(writes)
+        if self.journal is not None:
+            pending_writes = [
+                write for write in writes
+                if not self.journal.is_done(
+                    method, collection_name, journal.write_key(method, write[1], write[2])
+                )
+            ]
+            if len(pending_writes) < len(writes):
+                LOG.info(
+                    "Skipping %d %s writes to %s done by an earlier run",
+                    len(writes) - len(pending_writes), method, collection_name
+                )
+            writes = pending_writes
+        if self.supports_bulk(method, collection_name):
+            return [
+                executor.WriteTask(
+                    method.lower() + ' ' + str(len(chunk)) + ' ' + collection_name +
+                    ' (' + chunk[0][0] + ' .. ' + chunk[-1][0] + ')',
+                    self.execute_cap_bulk_rest_call,
+                    method,
+                    collection_name,
+                    chunk
+                )
+                for chunk in chunks(writes, self.bulk_chunk_size)
+            ]
+        single_item_calls = {
+            'POST': self.execute_cap_post_rest_call,
+            'PUT': self.execute_cap_put_rest_call,
+            'DELETE': self.execute_cap_delete_rest_call
+        }
+        tasks = []
+        for description, item_id, json_data in writes:
+            url_string = '/api/' + collection_name + '/' + (item_id or '')
+            arguments = (url_string,) if json_data is None else (url_string, json_data)
+            tasks.append(executor.WriteTask(description, single_item_calls[method], *arguments))
+        return tasks
+
     def get_team_id(self, team_name):
         """
         Return the id of the given team.
@@ -35,15 +421,13 @@ class CapacityPlanner(object):
         Return the id of the given team from the capacity planner
         and create it if its not there
         """
-        team_name = team_name
-
         team_id = None
-        for team in self.cap_teams:
-            if team['name'] == team_name:
-                team_id = team['_id']
+        team = self.cap_teams.get_by_name(team_name)
+        if team is not None:
+            team_id = team['_id']
 
         if team_id is None:
-            LOG.info("Creating default team '" + team_name + "'")
+            LOG.info("Creating default team '%s'", team_name)
             teams_post_response = self.execute_cap_post_rest_call(
                 '/api/teams/',
                 json.dumps({'name': team_name})
@@ -53,73 +437,278 @@ class CapacityPlanner(object):
 
     def get_deployment_type_id(self, deployment_type_name):
         """Return the id of the given deployment type name from the capacity planner."""
-        deployment_type_name = deployment_type_name
-
-        deployment_types = self.execute_cap_get_rest_call(
-            '/api/deploymenttypes/',
-            {'q': 'name=' + deployment_type_name}
-        )
-        if len(deployment_types) == 1:
-            return deployment_types[0]['_id']
+        deployment_type = self.cap_deployment_types.get_by_name(deployment_type_name)
+        if deployment_type is not None:
+            return deployment_type['_id']
         else:
             raise RuntimeError(
                 "The deployment type name given could not be found in the capacity planner"
             )
 
-    def execute_cap_get_rest_call(self, url_string, payload=None):
+    def iter_collection_pages(self, collection_name, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Yield the items of a collection, reading them page_size at a time.
+
+        Only one page is held at a time. If the capacity planner ignores
+        the page and limit parameters, the whole collection it sends is
+        yielded once
+        """
+        payload = {'limit': page_size}
+        page = 1
+        first_item_ids = set()
+        while True:
+            payload['page'] = page
+            items = self.execute_cap_get_rest_call(collection_url(collection_name), dict(payload))
+            if items and items[0].get('_id') in first_item_ids:
+                return
+            for item in items:
+                yield item
+            if len(items) != page_size:
+                return
+            first_item_ids.add(items[0].get('_id'))
+            page += 1
+
+    def send_request(self, method, full_url, **kwargs):
+        """
+        Send a request and return the response, retrying requests that fail transiently.
+
+        Only idempotent requests are retried, unless the failure shows the
+        request wasn't processed, a connect timeout, 429 or 503.
+        The keyword arguments are passed to requests. A response with a
+        transient error status is raised as a requests.HTTPError once
+        out of attempts, any other status is left to the caller. The
+        number of attempts made is kept in the response's attempts
+        """
+        host = urlparse.urlparse(full_url).netloc
+        attempts = [0]
+
+        def send():
+            """Send the request once."""
+            attempts[0] += 1
+            self.rate_limiter.wait(host)
+            response = self.session.request(method, full_url, **kwargs)
+            if response.status_code in TRANSIENT_STATUS_CODES:
+                response.close()
+                response.raise_for_status()
+            response.attempts = attempts[0]
+            return response
+
+        return resilience.call(
+            send,
+            host=host,
+            idempotent=method in IDEMPOTENT_METHODS,
+            retry_policy=self.retry_policy,
+            is_transient=is_transient_error,
+            is_unprocessed=is_unprocessed_error,
+            limiter=self.limiter,
+            kind=endpoint_name(method, full_url),
+            description=method + ' ' + full_url
+        )
+
+    def execute_cap_get_rest_call(self, url_string, payload=None, timeout=None):
         """Return the result of a GET REST call towards the capacity planner."""
         full_url = urlparse.urljoin(self.base_url, url_string)
-        LOG.info(
-            "Running GET REST call towards the Capacity Planner (%s%s)",
+        LOG.debug(
+            "Running GET REST call towards the Capacity Planner (%s) with params %s",
             full_url,
-            ' with payload ' + str(payload) if payload else ''
+            payload
         )
-        logging.getLogger("requests").setLevel(logging.WARNING)
-        response = requests.get(full_url, params=payload)
+        cache_key = full_url + ('?' + urllib.urlencode(sorted(payload.items())) if payload else '')
+        cached = self.http_cache.get(cache_key)
+        response = self.send_request(
+            'GET',
+            full_url,
+            params=payload,
+            headers=cached.conditional_headers() if cached is not None else None,
+            timeout=timeout or self.timeout
+        )
+        if response.status_code == 304 and cached is not None:
+            LOG.debug("REST call completed, not modified, using the cached response")
+            return json.loads(cached.body)
         response.raise_for_status()
-        LOG.info("REST call completed")
+        LOG.debug("REST call completed")
+        self.http_cache.store(cache_key, response)
         return response.json()
 
-    def execute_cap_put_rest_call(self, url_string, json_data):
+    def execute_cap_put_rest_call(self, url_string, json_data, timeout=None):
         """Return the result of a PUT REST call towards the capacity planner."""
         full_url = urlparse.urljoin(self.base_url, url_string)
-        LOG.info(
+        LOG.debug(
             "Running PUT REST call towards the Capacity Planner (%s) with payload %s",
             full_url,
-            json_data
+            utils.PayloadPreview(json_data)
         )
-        logging.getLogger("requests").setLevel(logging.WARNING)
+        if self.changeset_plan is not None:
+            response_data = self.changeset_plan.add(
+                'PUT', endpoint_name('PUT', full_url), url_string, json_data=json_data
+            )
+            self.update_index('PUT', url_string, response_data, json_data)
+            return response_data
         headers = {"Content-Type": "application/json"}
-        response = requests.put(full_url, data=json_data, headers=headers)
+        response = self.send_request(
+            'PUT', full_url, data=json_data, headers=headers, timeout=timeout or self.timeout
+        )
         response.raise_for_status()
-        LOG.info("REST call completed")
-        return response.json()
+        LOG.debug("REST call completed")
+        response_data = response.json()
+        self.update_index('PUT', url_string, response_data, json_data)
+        return response_data
 
-    def execute_cap_post_rest_call(self, url_string, json_data):
+    def execute_cap_post_rest_call(self, url_string, json_data, timeout=None):
         """Return the result of a POST REST call towards the capacity planner."""
         full_url = urlparse.urljoin(self.base_url, url_string)
-        LOG.info(
+        LOG.debug(
             "Running POST REST call towards the Capacity Planner (%s) with payload %s",
             full_url,
-            json_data
+            utils.PayloadPreview(json_data)
         )
-        logging.getLogger("requests").setLevel(logging.WARNING)
+        if self.changeset_plan is not None:
+            response_data = self.changeset_plan.add(
+                'POST', endpoint_name('POST', full_url), url_string, json_data=json_data
+            )
+            self.update_index('POST', url_string, response_data, json_data)
+            return response_data
         headers = {"Content-Type": "application/json"}
-        response = requests.post(full_url, data=json_data, headers=headers)
+        response = self.send_request(
+            'POST', full_url, data=json_data, headers=headers, timeout=timeout or self.timeout
+        )
         response.raise_for_status()
-        LOG.info("REST call completed")
-        return response.json()
+        LOG.debug("REST call completed")
+        response_data = response.json()
+        self.update_index('POST', url_string, response_data, json_data)
+        return response_data
 
-    def execute_cap_delete_rest_call(self, url_string):
+    def execute_cap_delete_rest_call(self, url_string, timeout=None):
         """Return the result of a DELETE REST call towards the capacity planner."""
         full_url = urlparse.urljoin(self.base_url, url_string)
-        LOG.info(
+        LOG.debug(
             "Running DELETE REST call towards the Capacity Planner (%s)",
             full_url
         )
-        logging.getLogger("requests").setLevel(logging.WARNING)
+        if self.changeset_plan is not None:
+            response_data = self.changeset_plan.add(
+                'DELETE', endpoint_name('DELETE', full_url), url_string
+            )
+            self.update_index('DELETE', url_string, response_data)
+            return response_data
         headers = {"Content-Type": "application/json"}
-        response = requests.delete(full_url, headers=headers)
+        response = self.send_request(
+            'DELETE', full_url, headers=headers, timeout=timeout or self.timeout
+        )
+        if response.status_code == 404 and response.attempts > 1:
+            LOG.debug("REST call completed, the item was deleted by an earlier attempt")
+            self.update_index('DELETE', url_string, {})
+            return {}
         response.raise_for_status()
-        LOG.info("REST call completed")
-        return response.json()
+        LOG.debug("REST call completed")
+        response_data = response.json()
+        self.update_index('DELETE', url_string, response_data)
+        return response_data
+
+    def execute_cap_bulk_rest_call(self, method, collection_name, writes, timeout=None):
+        """
+        Return the result of a bulk REST call towards the capacity planner.
+
+        The writes are (description, item_id, json_data) tuples. POST and
+        PUT send a JSON array of items, DELETE sends a JSON array of ids
+        """
+        full_url = urlparse.urljoin(self.base_url, bulk_url(collection_name))
+        LOG.debug(
+            "Running bulk %s REST call towards the Capacity Planner (%s) with %d items",
+            method,
+            full_url,
+            len(writes)
+        )
+        if method == 'DELETE':
+            json_data = json.dumps([item_id for _, item_id, _ in writes])
+        else:
+            items = []
+            for _, item_id, item_json_data in writes:
+                item = json.loads(item_json_data)
+                if item_id is not None:
+                    item['_id'] = item_id
+                items.append(item)
+            json_data = json.dumps(items)
+        if self.changeset_plan is not None:
+            response_data = self.changeset_plan.add(
+                method,
+                endpoint_name(method, full_url),
+                bulk_url(collection_name),
+                json_data=json_data,
+                item_count=len(writes)
+            )
+        else:
+            headers = {"Content-Type": "application/json"}
+            response = self.send_request(
+                method, full_url, data=json_data, headers=headers, timeout=timeout or self.timeout
+            )
+            response.raise_for_status()
+            LOG.debug("REST call completed")
+            response_data = response.json()
+        self.update_index_items(method, collection_name, writes, response_data)
+        return response_data
+
+    def update_index_items(self, method, collection_name, writes, response_data):
+        """
+        Keep the index current after a bulk write of the given writes, answered with response_data.
+
+        The response is used if it is a list, its items in the order of the writes.
+        If it doesn't give the _id of every item created by a POST, the
+        collection is loaded again from the capacity planner
+        """
+        response_items = response_data if isinstance(response_data, list) else []
+        for position, write in enumerate(writes):
+            response_item = response_items[position] if position < len(response_items) else None
+            self.update_index_item(method, collection_name, write, response_item)
+        if method == 'POST' and not (len(response_items) >= len(writes) and all(
+                isinstance(response_item, dict) and response_item.get('_id')
+                for response_item in response_items[:len(writes)])):
+            LOG.warning(
+                "The bulk POST to %s didn't return the _id of the %d items created, reloading %s",
+                collection_name, len(writes), collection_name
+            )
+            self.refresh_created_items(collection_name, writes)
+
+    def refresh_created_items(self, collection_name, writes):
+        """
+        Load a collection again from the capacity planner, after creating the given items.
+
+        The index is locked meanwhile, so that the writes completing in the
+        meantime are added after it is loaded.
+        Raises a RuntimeError if the created items can't be found.
+        """
+        index = self.get_collection_index(collection_name)
+        if index is None:
+            return
+        with self.index_lock:
+            self.refresh_collection_index(collection_name)
+            missing_names = []
+            for _, _, json_data in writes:
+                item = json.loads(json_data)
+                if 'pod_id' in item:
+                    found_item = index.get_by_name_and_pod(item.get('name'), item['pod_id'])
+                else:
+                    found_item = index.get_by_name(item.get('name'))
+                if found_item is None:
+                    missing_names.append(item.get('name'))
+        if missing_names:
+            raise RuntimeError(
+                "The %s created by a bulk POST could not be found in the capacity planner: %s"
+                % (collection_name, ', '.join(str(name) for name in missing_names))
+            )
+
+    def iter_get_request_items(self, full_url, key, timeout=None):
+        """
+        Yield the items of the array under the given key of a GET request's JSON response.
+
+        The response is parsed as it arrives, so that only the
+        items not yet read are held in memory
+        """
+        response = self.send_request('GET', full_url, stream=True, timeout=timeout or self.timeout)
+        try:
+            response.raise_for_status()
+            for item in json_stream.iter_json_array_items(
+                    response.iter_content(STREAM_CHUNK_SIZE), key):
+                yield item
+        finally:
+            response.close()
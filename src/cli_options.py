@@ -0,0 +1,329 @@
+"""This module contains the command line options of api_data."""
+
+import argparse
+import capacity_analytics
+import capacity_planner
+import collector
+import executor
+import http_cache
+import openstack_backends
+import resilience
+import scheduler
+import token_cache
+import utils
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_parser():
+    """Return the parser of the api_data command line."""
+    parser = argparse.ArgumentParser()
+    add_planner_options(parser)
+    add_run_options(parser)
+    add_openstack_options(parser)
+    add_output_options(parser)
+    return parser
+
+
+def add_planner_options(parser):
+    """Add the options of the Capacity Planner and the REST calls to it to the given parser."""
+    group = parser.add_argument_group('Capacity Planner options')
+    group.add_argument(
+        '--capacity-planner-base-url',
+        help="""This is the url to the capacity planner
+        """,
+        required=True
+    )
+    group.add_argument(
+        '--default-team-name',
+        help="""This is the default team to assign new projects to, if project name doesn't match
+        existing teams
+        """,
+        required=True
+    )
+    group.add_argument(
+        '--default-deployment-type-name',
+        help="""This is the default deployment type to assign new projects to
+        """,
+        required=True
+    )
+    group.add_argument(
+        '--http-pool-size',
+        help="""This is the number of keep-alive connections to keep open per host
+        """,
+        type=int,
+        default=capacity_planner.DEFAULT_POOL_SIZE
+    )
+    group.add_argument(
+        '--http-timeout',
+        help="""This is the number of seconds to wait for a REST call to respond
+        """,
+        type=float,
+        default=capacity_planner.DEFAULT_TIMEOUT[1]
+    )
+    group.add_argument(
+        '--write-workers',
+        help="""This is the number of writes to run concurrently towards the capacity planner
+        """,
+        type=int,
+        default=executor.DEFAULT_WORKERS
+    )
+    group.add_argument(
+        '--rate-limit',
+        help="""This is the maximum number of REST calls per second towards each host, unlimited if
+        not given
+        """,
+        type=float,
+        default=None
+    )
+    group.add_argument(
+        '--retry-attempts',
+        help="""This is the number of times an idempotent REST call is tried when it fails
+        transiently
+        """,
+        type=int,
+        default=resilience.DEFAULT_ATTEMPTS
+    )
+    group.add_argument(
+        '--no-adaptive-concurrency',
+        help="""Keep the number of concurrent REST calls at --write-workers, instead of lowering it
+        as latency or errors rise
+        """,
+        action='store_true'
+    )
+    group.add_argument(
+        '--bulk-chunk-size',
+        help="""This is the number of items to send per bulk write, when the capacity planner has
+        bulk routes, 0 turns bulk writes off
+        """,
+        type=int,
+        default=capacity_planner.DEFAULT_BULK_CHUNK_SIZE
+    )
+    group.add_argument(
+        '--planner-page-size',
+        help="""This is the number of items to read at a time when loading Capacity Planner
+        collections, by default each collection is read in one request
+        """,
+        type=int,
+        default=None
+    )
+    group.add_argument(
+        '--http-cache-dir',
+        help="""This is the directory to keep Capacity Planner GET responses in between runs, by
+        default they are only kept in memory
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--http-cache-max-mb',
+        help="""This is the most the cached GET responses can take up, in megabytes
+        """,
+        type=float,
+        default=http_cache.DEFAULT_MAX_BYTES / (1024 * 1024)
+    )
+
+
+def add_run_options(parser):
+    """Add the options of the command to run, and of keeping its progress, to the given parser."""
+    group = parser.add_argument_group('command options')
+    group.add_argument(
+        '--command-to-run',
+        help="""This is the command to run, options are create, update, delete, and daemon, which
+        keeps updating on an interval
+        """,
+        required=True
+    )
+    group.add_argument(
+        '--meteo-batch-size',
+        help="""This is the number of Meteo projects to read and write at a time
+        """,
+        type=int,
+        default=DEFAULT_BATCH_SIZE
+    )
+    group.add_argument(
+        '--journal-file',
+        help="""This is the file to journal the writes of a create or delete run in, so that if the
+        run stops part way, rerunning the same command resumes where it stopped. It is removed once
+        the run completes
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--snapshot-file',
+        help="""This is the file to keep a snapshot of the last successful update in, so that the
+        next update only processes the Meteo projects that changed since, by default every project
+        is compared on every update
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--meteo-since-parameter',
+        help="""This is the name of the Meteo query parameter that limits the project list to the
+        projects changed since a UTC timestamp, if Meteo offers one, projects it reports as deleted
+        carry a true deleted field. Without it, changes are found by comparing every project with
+        the snapshot
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--daemon-interval',
+        help="""This is the number of seconds between syncs in daemon mode
+        """,
+        type=float,
+        default=scheduler.DEFAULT_INTERVAL
+    )
+    group.add_argument(
+        '--daemon-jitter',
+        help="""This is the most number of seconds each interval is randomly lengthened or shortened
+        by in daemon mode
+        """,
+        type=float,
+        default=scheduler.DEFAULT_JITTER
+    )
+    group.add_argument(
+        '--daemon-host',
+        help="""This is the address the /health, /metrics and /trigger endpoints listen on in daemon
+        mode
+        """,
+        default=scheduler.DEFAULT_HOST
+    )
+    group.add_argument(
+        '--daemon-port',
+        help="""This is the port the /health, /metrics and /trigger endpoints listen on in daemon
+        mode
+        """,
+        type=int,
+        default=scheduler.DEFAULT_PORT
+    )
+
+
+def add_openstack_options(parser):
+    """Add the options of collecting live stats from the openstack clouds to the given parser."""
+    group = parser.add_argument_group('openstack options')
+    group.add_argument(
+        '--live-stats',
+        help="""This is to collect the nova hypervisor stats and cinder pools of each cloud, and
+        write the vcpus and memory used and the free cinder capacity to its pod, when creating or
+        updating
+        """,
+        action='store_true'
+    )
+    group.add_argument(
+        '--cloud-workers',
+        help="""This is the number of openstack cli commands run at once when collecting live stats
+        """,
+        type=int,
+        default=collector.DEFAULT_CLOUD_WORKERS
+    )
+    group.add_argument(
+        '--openstack-backend',
+        help="""This is how live stats are collected, sdk calls the openstack client libraries in
+        process with a keystone session per cloud, falling back to cli if they aren't installed, cli
+        runs the openstack, nova and cinder clients, and fake serves the data in
+        --openstack-fake-data-file
+        """,
+        choices=openstack_backends.BACKEND_NAMES,
+        default=openstack_backends.DEFAULT_BACKEND
+    )
+    group.add_argument(
+        '--openstack-fake-data-file',
+        help="""This is the JSON file of openstack data served by the fake backend, keyed by auth
+        url then by data name, hypervisor_stats, cinder_pools, projects or project_quotas
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--no-token-cache',
+        help="""This is to have the openstack cli clients authenticate with the password for every
+        command, rather than be passed the keystone token cached per cloud, project and user
+        """,
+        action='store_true'
+    )
+    group.add_argument(
+        '--token-expiry-margin',
+        help="""This is the number of seconds before its expiry that a cached keystone token is
+        renewed, it should be longer than the slowest openstack cli command
+        """,
+        type=float,
+        default=token_cache.DEFAULT_EXPIRY_MARGIN
+    )
+
+
+def add_output_options(parser):
+    """Add the options of the logs, metrics, reports and dry run plans to the given parser."""
+    group = parser.add_argument_group('output options')
+    group.add_argument(
+        '--log-level',
+        help="""This is the level to log at, DEBUG logs every REST call and cli command
+        """,
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        default='INFO'
+    )
+    group.add_argument(
+        '--log-payload-limit',
+        help="""This is the number of characters of each payload to log at DEBUG, 0 leaves payloads
+        out
+        """,
+        type=int,
+        default=utils.DEFAULT_PAYLOAD_LOG_LIMIT
+    )
+    group.add_argument(
+        '--progress-interval',
+        help="""This is the number of seconds between progress lines while writing, 0 turns them off
+        """,
+        type=float,
+        default=executor.DEFAULT_PROGRESS_INTERVAL
+    )
+    group.add_argument(
+        '--metrics-file',
+        help="""This is the file to write a JSON summary of the request metrics to at exit
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--metrics-prometheus-file',
+        help="""This is the file to write the request metrics to at exit, in the Prometheus text
+        format
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--capacity-report-file',
+        help="""This is the file to write the capacity, allocations and headroom of each pod to as
+        JSON, before creating or updating, overcommitted pods are also logged. This holds all the
+        projects in memory at once and needs NumPy. It isn't written by an update with a
+        --snapshot-file, which only reads the projects that changed
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--max-utilisation',
+        help="""This is the share of a pod's contention adjusted cpu, memory or cinder storage its
+        projects can be allocated before the pod is reported as overcommitted
+        """,
+        type=float,
+        default=capacity_analytics.DEFAULT_MAX_UTILISATION
+    )
+    group.add_argument(
+        '--dry-run',
+        help="""This is to only plan the writes the command would send to the Capacity Planner, and
+        export them with a forecast of the number of requests and the time they would take, instead
+        of sending them
+        """,
+        action='store_true'
+    )
+    group.add_argument(
+        '--dry-run-file',
+        help="""This is the file to write the planned changeset to as JSON in a dry run, it is
+        printed otherwise
+        """,
+        default=None
+    )
+    group.add_argument(
+        '--dry-run-latency-file',
+        help="""This is a metrics summary written by --metrics-file in an earlier run, whose mean
+        latency per endpoint the dry run forecast is based on. Without it, a dry run sends no
+        writes to measure, so no time is forecast
+        """,
+        default=None
+    )
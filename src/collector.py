@@ -0,0 +1,138 @@
+"""
+This module contains logic for collecting openstack data from many clouds at once.
+
+Each cloud is collected with its own openstack environment variables,
+passed to each cli command rather than set process wide, so that
+several clouds can be collected concurrently
+"""
+
+import logging
+import metrics
+import openstack
+import openstack_backends
+import utils
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CLOUD_WORKERS = 8
+
+
+def collect_cloud(openstack_env, backend=None):
+    """
+    Collect the hypervisor stats, cinder pools, projects and project quotas of one cloud.
+
+    Returns a dictionary.
+    """
+    return collect_clouds([openstack_env], workers=1, backend=backend).get(
+        openstack_env['cloud_name']
+    )
+
+
+CLOUD_STATS_DATA_NAMES = ('hypervisor_stats', 'cinder_pools')
+
+
+def run_backend_calls(openstack_envs, data_names, workers, phase_name, backend):
+    """
+    Collect the given data of each of the given clouds concurrently, through the given backend.
+
+    Returns the openstack environment variables of each cloud, the data
+    collected from each cloud keyed by data name, and the set of clouds
+    that a call failed for.
+    """
+    environments = {}
+    cli_commands = []
+    for openstack_env in openstack_envs:
+        cloud_name = openstack_env['cloud_name']
+        environment = openstack.get_openstack_env_variables(openstack_env)
+        environments[cloud_name] = environment
+        for data_name in data_names:
+            cli_commands.append(
+                backend.prepare(data_name, environment, key=(cloud_name, data_name))
+            )
+
+    collected_data = {}
+    failed_clouds = set()
+    with metrics.METRICS.phase(phase_name):
+        run_collection_commands(cli_commands, workers, collected_data, failed_clouds)
+    return environments, collected_data, failed_clouds
+
+
+def collect_cloud_stats(openstack_envs, workers=DEFAULT_CLOUD_WORKERS, backend=None):
+    """
+    Collect only the hypervisor stats and cinder pools of the given clouds concurrently.
+
+    The openstack_envs and backend are as for collect_clouds. Clouds that
+    fail to be collected are logged and left out.
+    Returns a dictionary keyed by cloud name.
+    """
+    _, collected_data, failed_clouds = run_backend_calls(
+        openstack_envs, CLOUD_STATS_DATA_NAMES, workers, 'collect cloud stats',
+        backend or openstack_backends.get_backend()
+    )
+    dataset = {}
+    for cloud_name, cloud_data in collected_data.items():
+        if cloud_name not in failed_clouds:
+            dataset[cloud_name] = cloud_data
+    LOG.info("Collected the stats of %d of %d clouds", len(dataset), len(openstack_envs))
+    return dataset
+
+
+def collect_clouds(openstack_envs, workers=DEFAULT_CLOUD_WORKERS, backend=None):
+    """
+    Collect the openstack data of the given clouds concurrently.
+
+    Each openstack_env needs a cloud_name, along with the os_auth_url,
+    os_project_name, os_username and os_password of the cloud.
+    The hypervisor stats, cinder pools and project lists of all clouds
+    are collected at once, then the quotas of all their projects.
+    The data is collected through the given openstack_backends backend,
+    the default one if not given.
+    Clouds that fail to be collected are logged and left out.
+    Returns a dictionary keyed by cloud name.
+    """
+    backend = backend or openstack_backends.get_backend()
+    environments, collected_data, failed_clouds = run_backend_calls(
+        openstack_envs,
+        CLOUD_STATS_DATA_NAMES + ('projects',),
+        workers,
+        'collect cloud stats and projects',
+        backend
+    )
+
+    quota_commands = []
+    for cloud_name, cloud_data in collected_data.items():
+        if cloud_name in failed_clouds:
+            continue
+        if not cloud_data['projects']:
+            cloud_data['project_quotas'] = {}
+        else:
+            quota_commands.append(backend.prepare(
+                'project_quotas',
+                environments[cloud_name],
+                key=(cloud_name, 'project_quotas'),
+                project_names=[project['Name'] for project in cloud_data['projects']]
+            ))
+    with metrics.METRICS.phase('collect project quotas'):
+        run_collection_commands(quota_commands, workers, collected_data, failed_clouds)
+
+    dataset = {}
+    for cloud_name, cloud_data in collected_data.items():
+        if cloud_name not in failed_clouds:
+            dataset[cloud_name] = cloud_data
+    LOG.info("Collected openstack data from %d of %d clouds", len(dataset), len(openstack_envs))
+    return dataset
+
+
+def run_collection_commands(cli_commands, workers, collected_data, failed_clouds):
+    """
+    Run the given cli commands, keyed by cloud name and data name.
+
+    The result of each is added to the collected_data of its cloud,
+    and the clouds whose commands failed are added to failed_clouds
+    """
+    for cli_command in utils.run_cli_commands(cli_commands, workers, raise_on_failure=False):
+        cloud_name, data_name = cli_command.key
+        if cli_command.error is not None:
+            failed_clouds.add(cloud_name)
+        else:
+            collected_data.setdefault(cloud_name, {})[data_name] = cli_command.result
@@ -0,0 +1,172 @@
+"""
+This module contains the changeset planning behind --dry-run.
+
+In a dry run the capacity planner reads as usual, but every POST, PUT
+and DELETE is recorded in a ChangesetPlan instead of being sent, and
+answered with a made up response so that the run carries on as if it
+had been applied. The plan is exported as JSON along with a forecast of
+the number of requests and the time applying it would take, based on the
+latencies measured per endpoint by an earlier run
+"""
+
+import itertools
+import json
+import logging
+import sys
+import threading
+
+LOG = logging.getLogger(__name__)
+
+PLANNED_ID_PREFIX = 'dry-run-'
+
+
+class ChangesetPlan(object):
+    """The writes a run would send to the capacity planner, in the order they were planned."""
+
+    def __init__(self):
+        """Initialize an empty plan."""
+        self.lock = threading.Lock()
+        self.operations = []
+        self.planned_ids = itertools.count(1)
+
+    def add(self, method, endpoint, url_string, **kwargs):
+        """
+        Record a write and return the response the capacity planner would give.
+
+        The keyword arguments are the json_data sent, and the item_count of
+        a bulk write, 1 by default. Created items are given a made up _id,
+        so that the writes planned after them can refer to them. A bulk
+        write is answered with a list of responses
+        """
+        json_data = kwargs.pop('json_data', None)
+        item_count = kwargs.pop('item_count', 1)
+
+        if kwargs:
+            raise TypeError('Unexpected **kwargs: %r' % kwargs)
+
+        with self.lock:
+            self.operations.append({
+                'method': method,
+                'endpoint': endpoint,
+                'url': url_string,
+                'items': item_count,
+                'body': json.loads(json_data) if json_data else None
+            })
+            if method != 'POST':
+                responses = [{} for _ in range(item_count)]
+            else:
+                responses = [
+                    {'_id': PLANNED_ID_PREFIX + str(next(self.planned_ids))}
+                    for _ in range(item_count)
+                ]
+        return responses if endpoint.endswith('/bulk/') else responses[0]
+
+    def requests_by_endpoint(self):
+        """Return the number of requests planned per endpoint."""
+        counts = {}
+        with self.lock:
+            for operation in self.operations:
+                counts[operation['endpoint']] = counts.get(operation['endpoint'], 0) + 1
+        return counts
+
+    def to_dict(self, command, plan_forecast):
+        """Return the plan, and the given forecast of applying it, as a dictionary."""
+        with self.lock:
+            operations = list(self.operations)
+        items_by_method = {}
+        for operation in operations:
+            method = operation['method']
+            items_by_method[method] = items_by_method.get(method, 0) + operation['items']
+        return {
+            'command': command,
+            'items_by_method': items_by_method,
+            'forecast': plan_forecast,
+            'operations': operations
+        }
+
+    def write_file(self, command, plan_forecast, file_name=None):
+        """Write the plan as JSON to the given file, or print it if no file is given."""
+        text = json.dumps(
+            self.to_dict(command, plan_forecast), indent=2, sort_keys=True, separators=(',', ': ')
+        )
+        if not file_name:
+            sys.stdout.write(text + '\n')
+            return
+        with open(file_name, 'w') as plan_file:
+            plan_file.write(text + '\n')
+        LOG.info("Wrote the planned changeset to %s", file_name)
+
+
+def load_latencies(file_name):
+    """
+    Return the mean latency of each REST endpoint from a metrics summary written by --metrics-file.
+
+    Returns an empty dictionary if the file can't be read
+    """
+    try:
+        with open(file_name) as metrics_file:
+            data = json.load(metrics_file)
+    except (IOError, OSError, ValueError) as error:
+        LOG.warning("Could not read latencies from %s (%s)", file_name, error)
+        return {}
+    return mean_latencies(data.get('calls', {}).get('rest', {}))
+
+
+def mean_latencies(rest_calls):
+    """Return the mean latency of each endpoint in the given metrics summary of REST calls."""
+    latencies = {}
+    for endpoint, statistics in rest_calls.items():
+        if statistics.get('count'):
+            latencies[endpoint] = statistics['total_seconds'] / float(statistics['count'])
+    return latencies
+
+
+def forecast(requests_by_endpoint, latencies, workers, rate_limit=None):
+    """
+    Return a forecast of the number of requests and the time applying a plan takes.
+
+    Planned endpoints without a measured latency are assumed to take the
+    mean of the latencies measured for the other planned endpoints. If
+    none of them was measured, no time is estimated. Requests are assumed
+    to be spread over the given number of workers, or over as many
+    workers as there are requests if fewer, and no faster than
+    rate_limit per second if given
+    """
+    planned_latencies = [
+        latencies[endpoint] for endpoint in requests_by_endpoint if endpoint in latencies
+    ]
+    fallback_latency = None
+    if planned_latencies:
+        fallback_latency = sum(planned_latencies) / len(planned_latencies)
+    elif requests_by_endpoint:
+        LOG.warning(
+            "None of the %d endpoints planned has a measured latency, not estimating the time",
+            len(requests_by_endpoint)
+        )
+    total_requests = sum(requests_by_endpoint.values())
+    busy_seconds = 0.0
+    endpoints = {}
+    unmeasured_endpoints = []
+    for endpoint, count in sorted(requests_by_endpoint.items()):
+        latency = latencies.get(endpoint)
+        if latency is None:
+            unmeasured_endpoints.append(endpoint)
+            latency = fallback_latency
+        endpoints[endpoint] = {
+            'requests': count,
+            'mean_latency_seconds': round(latency, 6) if latency is not None else None
+        }
+        busy_seconds += count * (latency or 0.0)
+    estimated_seconds = busy_seconds / max(min(int(workers), total_requests), 1)
+    if rate_limit:
+        estimated_seconds = max(estimated_seconds, total_requests / float(rate_limit))
+    return {
+        'requests': total_requests,
+        'endpoints': endpoints,
+        'unmeasured_endpoints': unmeasured_endpoints,
+        'workers': workers,
+        'rate_limit': rate_limit,
+        'estimated_seconds': (
+            round(estimated_seconds, 3) if planned_latencies or not total_requests else None
+        )
+    }
@@ -0,0 +1,163 @@
+"""
+This module contains logic for running independent writes concurrently.
+
+Writes towards the capacity planner are bound by round trip latency,
+so independent writes are run on a bounded pool of worker threads,
+with an optional per host rate limit
+"""
+
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_PROGRESS_INTERVAL = 30.0
+
+
+class WriteErrorsException(Exception):
+    """
+    Custom exception for expressing failed writes.
+
+    This custom exception is used to convey that one or more writes
+    failed, after all the other writes have been attempted
+    """
+
+    pass
+
+
+class RateLimiter(object):  # pylint: disable=too-few-public-methods
+    """Spaces out calls towards each host so that no host gets more than the given rate."""
+
+    def __init__(self, requests_per_second=None):
+        """Initialize the rate limiter, no rate means unlimited."""
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        """Block until a call towards the given host is allowed."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class WriteTask(object):  # pylint: disable=too-few-public-methods
+    """Represents a single write, and its result or error once it has run."""
+
+    def __init__(self, description, function, *args):
+        """Initialize a write task that calls function with the given arguments."""
+        self.description = description
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+
+    def run(self):
+        """Run the write, keeping the result or error."""
+        try:
+            self.result = self.function(*self.args)
+        except Exception as error:  # pylint: disable=broad-except
+            self.error = error
+            LOG.error("Failed to %s: %s", self.description, error)
+        return self
+
+
+class ProgressReporter(object):
+    """
+    Counts finished writes, and logs a progress and throughput line every interval seconds.
+
+    This replaces logging each write, an interval of 0 only logs when
+    log_progress is called
+    """
+
+    def __init__(self, interval=DEFAULT_PROGRESS_INTERVAL):
+        """Initialize the reporter, logging at most every interval seconds."""
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.next_report_time = self.start_time + interval
+        self.completed = 0
+        self.failed = 0
+
+    def add(self, task):
+        """Count the given finished task, logging the progress if the interval has passed."""
+        with self.lock:
+            self.completed += 1
+            if task.error is not None:
+                self.failed += 1
+            if not self.interval or time.time() < self.next_report_time:
+                return
+            self.next_report_time = time.time() + self.interval
+        self.log_progress()
+
+    def log_progress(self):
+        """Log the number of writes done and failed so far, and the rate they were done at."""
+        with self.lock:
+            completed, failed = self.completed, self.failed
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        LOG.info(
+            "Progress: %d writes done, %d failed, %.1f writes/s over %.0fs",
+            completed, failed, completed / elapsed, elapsed
+        )
+
+
+class WriteExecutor(object):
+    """Runs batches of independent write tasks on a bounded pool of threads."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        """Initialize the executor with the given number of worker threads."""
+        self.workers = max(int(workers), 1)
+        self.progress = ProgressReporter(progress_interval)
+
+    def run_task(self, task):
+        """Run one task, counting it towards the progress."""
+        task.run()
+        self.progress.add(task)
+        return task
+
+    def run(self, tasks):
+        """
+        Run the given tasks and wait for them all to finish.
+
+        Tasks in one call must not depend on each other, callers order
+        dependent writes by making separate calls.
+        Returns the list of tasks that failed.
+        """
+        tasks = list(tasks)
+        if self.workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                self.run_task(task)
+        else:
+            pool = ThreadPool(min(self.workers, len(tasks)))
+            try:
+                pool.map(self.run_task, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        return [task for task in tasks if task.error is not None]
+
+
+def failed_task(description, error):
+    """Return a WriteTask that is left unrun, having failed with the given error."""
+    task = WriteTask(description, None)
+    task.error = error
+    LOG.error("Failed to %s: %s", description, error)
+    return task
+
+
+def raise_for_failed_tasks(failed_tasks):
+    """Raise a WriteErrorsException describing the failed tasks, if there are any."""
+    if failed_tasks:
+        raise WriteErrorsException(
+            str(len(failed_tasks)) + ' writes failed:\n' + '\n'.join(
+                task.description + ': ' + str(task.error) for task in failed_tasks
+            )
+        )
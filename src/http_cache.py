@@ -0,0 +1,163 @@
+"""
+This module contains a cache of GET responses for conditional requests.
+
+Responses carrying an ETag or Last-Modified header are kept, so that the
+next GET of the same url can send If-None-Match / If-Modified-Since and
+reuse the cached body when the server answers 304 Not Modified. Entries
+are kept in memory, and optionally in a directory so that they outlive
+the run, both bounded in size by evicting the least recently used
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+import utils
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_FILE_SUFFIX = '.json'
+
+
+class CacheEntry(object):
+    """Represents a cached response body and the validators it was sent with."""
+
+    __slots__ = ('url', 'etag', 'last_modified', 'body')
+
+    def __init__(self, url, etag, last_modified, body):
+        """Initialize a cache entry."""
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+
+    def conditional_headers(self):
+        """Return the headers that ask the server to only send the body if it has changed."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_dict(self):
+        """Return the entry as a dictionary, for storing on disk."""
+        return {
+            'url': self.url,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'body': self.body
+        }
+
+
+class HttpCache(object):
+    """
+    Keeps the bodies of GET responses that can be validated with the server.
+
+    With a directory, entries are also written there, one file per url,
+    and read back by later runs. Both the in memory and on disk entries
+    are kept under max_bytes of body text
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialize the cache, optionally persisted in the given directory."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, url):
+        """Return the cache entry of the given url, or None if there isn't one."""
+        with self.lock:
+            entry = self.entries.pop(url, None)
+            if entry is not None:
+                self.entries[url] = entry
+                return entry
+        entry = self.read_entry(url)
+        if entry is not None:
+            self.add_entry(entry)
+        return entry
+
+    def store(self, url, response):
+        """Keep the body of the given response, if it has an ETag or Last-Modified header."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        entry = CacheEntry(url, etag, last_modified, response.text)
+        if len(entry.body) > self.max_bytes:
+            return
+        self.add_entry(entry)
+        self.write_entry(entry)
+
+    def add_entry(self, entry):
+        """Add an entry to the in memory cache, evicting the least recently used past max_bytes."""
+        with self.lock:
+            previous = self.entries.pop(entry.url, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self.entries[entry.url] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def file_name(self, url):
+        """Return the name of the file the entry of the given url is stored in."""
+        return os.path.join(
+            self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + CACHE_FILE_SUFFIX
+        )
+
+    def read_entry(self, url):
+        """Return the entry of the given url stored on disk, or None if there isn't a usable one."""
+        if not self.directory:
+            return None
+        file_name = self.file_name(url)
+        try:
+            with open(file_name) as cache_file:
+                data = json.load(cache_file)
+            os.utime(file_name, None)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('url') != url:
+            return None
+        return CacheEntry(url, data.get('etag'), data.get('last_modified'), data.get('body') or '')
+
+    def write_entry(self, entry):
+        """Store the given entry on disk, if there is a directory, then evict past max_bytes."""
+        if not self.directory:
+            return
+        try:
+            utils.write_json_file(self.file_name(entry.url), entry.to_dict())
+        except (IOError, OSError) as error:
+            LOG.warning("Could not write the http cache entry of %s: %s", entry.url, error)
+            return
+        self.evict_files()
+
+    def evict_files(self):
+        """Remove the least recently used files from the cache until it is under max_bytes."""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            file_name = os.path.join(self.directory, name)
+            try:
+                file_stat = os.stat(file_name)
+            except OSError:
+                continue
+            files.append((file_stat.st_mtime, file_stat.st_size, file_name))
+        total_size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file_name in sorted(files):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(file_name)
+            except OSError:
+                continue
+            total_size -= file_size
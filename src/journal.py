@@ -0,0 +1,111 @@
+"""
+This module contains the checkpoint journal that makes create and delete runs resumable.
+
+Each write that completes is appended to the journal as one JSON line,
+with the _id the capacity planner gave the item. A rerun of the same
+command replays the journal and skips the writes already done, so that
+nothing is created twice. The journal is removed once a run completes
+"""
+
+import json
+import logging
+import os
+import threading
+
+LOG = logging.getLogger(__name__)
+
+
+def write_key(method, item_id, json_data):
+    """
+    Return the key a write is journalled under.
+
+    Writes of an existing item are keyed by its _id, creates by the
+    name, and pod_id if any, of the item created
+    """
+    if item_id is not None:
+        return item_id
+    item = json.loads(json_data) if json_data else {}
+    if method == 'POST' and 'pod_id' in item:
+        return item.get('name') + '@' + str(item.get('pod_id'))
+    return item.get('name')
+
+
+class Journal(object):
+    """An append only record of the writes completed by a run of a command."""
+
+    def __init__(self, file_name, command):
+        """Initialize the journal of the given command, replaying its file if of that command."""
+        self.file_name = file_name
+        self.command = command
+        self.lock = threading.Lock()
+        self.completed = {}
+        valid_size = self.replay()
+        if self.completed:
+            self.journal_file = open(file_name, 'r+')
+            self.journal_file.seek(valid_size)
+            self.journal_file.truncate()
+        else:
+            self.journal_file = open(file_name, 'w')
+            self.append({'command': command})
+
+    def replay(self):
+        """
+        Load the writes completed by an earlier run of the same command.
+
+        Returns the size of the journal up to its last complete line, a
+        run that died while appending can leave a partial line after it
+        """
+        if not os.path.exists(self.file_name):
+            return 0
+        valid_size = 0
+        with open(self.file_name) as journal_file:
+            header_line = journal_file.readline()
+            try:
+                header = json.loads(header_line)
+            except ValueError:
+                return 0
+            if not header_line.endswith('\n') or header.get('command') != self.command:
+                LOG.warning(
+                    "Journal %s is from a %s run, not %s, starting afresh",
+                    self.file_name, header.get('command'), self.command
+                )
+                return 0
+            valid_size = len(header_line)
+            for line in iter(journal_file.readline, ''):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith('\n'):
+                    break
+                write = (entry['method'], entry['collection'], entry['key'])
+                self.completed[write] = entry.get('id')
+                valid_size += len(line)
+        if self.completed:
+            LOG.info(
+                "Resuming from %s, %d writes already done", self.file_name, len(self.completed)
+            )
+        return valid_size
+
+    def append(self, entry):
+        """Append an entry to the journal file."""
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.journal_file.write(line)
+            self.journal_file.flush()
+
+    def is_done(self, method, collection_name, key):
+        """Return True if the given write was completed by an earlier run."""
+        return (method, collection_name, key) in self.completed
+
+    def record(self, method, collection_name, key, item_id):
+        """Record a completed write, with the _id of the item written."""
+        self.completed[(method, collection_name, key)] = item_id
+        self.append({'method': method, 'collection': collection_name, 'key': key, 'id': item_id})
+
+    def close(self, completed=False):
+        """Close the journal, removing it if the run completed."""
+        with self.lock:
+            self.journal_file.close()
+        if completed:
+            os.remove(self.file_name)
@@ -0,0 +1,96 @@
+"""
+This module contains logic for parsing JSON documents incrementally.
+
+It is used to read the items of a large JSON array one at a time, as
+the chunks of an HTTP response arrive, rather than holding the whole
+body and the whole decoded document in memory
+"""
+
+import codecs
+import json
+
+
+class TextStream(object):
+    """Represents text arriving in chunks, with a read position in the buffered part."""
+
+    def __init__(self, chunks):
+        """Initialize the stream over the given iterable of byte chunks."""
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = u''
+        self.position = 0
+
+    def read_more(self):
+        """
+        Add the next chunk to the buffer, dropping the text already read.
+
+        Returns False if there are no more chunks.
+        """
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buffer = self.buffer[self.position:] + text
+                self.position = 0
+                return True
+        return False
+
+    def next_char(self):
+        """Skip whitespace and return the next character without reading it, or '' at the end."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_more():
+                return ''
+
+    def expect(self, char):
+        """Read the given character, raising a ValueError if it is something else."""
+        found = self.next_char()
+        if found != char:
+            raise ValueError('Expected %r but found %r in JSON stream' % (char, found))
+        self.position += 1
+
+    def decode_value(self):
+        """Read and return the next complete JSON value."""
+        self.next_char()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            # A number at the very end of the buffer may carry on in the next chunk
+            if end == len(self.buffer) and self.read_more():
+                continue
+            self.position = end
+            return value
+
+
+def iter_json_array_items(chunks, key):
+    """
+    Yield the items of the array under the given key of a JSON object.
+
+    The chunks are read only as far as needed, other keys of the
+    object are skipped, and a KeyError is raised if the key isn't there
+    """
+    stream = TextStream(chunks)
+    stream.expect('{')
+    while stream.next_char() != '}':
+        name = stream.decode_value()
+        stream.expect(':')
+        if name == key and stream.next_char() == '[':
+            stream.expect('[')
+            if stream.next_char() == ']':
+                return
+            while True:
+                yield stream.decode_value()
+                if stream.next_char() == ']':
+                    return
+                stream.expect(',')
+        stream.decode_value()
+        if stream.next_char() == ',':
+            stream.expect(',')
+    raise KeyError(key)
@@ -0,0 +1,89 @@
+"""
+This module contains the functions reading projects and clouds from the Meteo API.
+
+The projects and clouds are yielded as records one at a time, as the
+response is parsed, invalid ones being logged and skipped
+"""
+
+import logging
+import urllib
+import records
+import snapshot
+
+LOG = logging.getLogger(__name__)
+
+METEO_PROJECTS_URL = "http://10.45.207.10/typhoon/get-project-list-api/"
+METEO_CLOUDS_URL = "http://10.45.207.10/typhoon/get-clouds-info-api/"
+
+
+def get_meteo_project_key(project):
+    """
+    Get the key of a Meteo project dictionary, its cloud and name, as in the snapshot.
+
+    Either part is None if the project doesn't have it.
+    """
+    cloud = project.get("cloud")
+    return (str(cloud) if cloud is not None else None, project.get("project_name") or None)
+
+
+def iter_project_data(cap_planner, skipped_keys=None):
+    """
+    Yield project data from Meteo one project at a time, as it is received.
+
+    Yields records.MeteoProject objects, invalid projects are logged and
+    skipped, their keys being added to skipped_keys if given.
+    """
+    LOG.info("Getting project data from Meteo")
+    for project in cap_planner.iter_get_request_items(METEO_PROJECTS_URL, 'projects'):
+        try:
+            yield records.MeteoProject.from_meteo(project)
+        except records.InvalidRecordException as error:
+            LOG.error("Skipping project: %s", error)
+            if skipped_keys is not None:
+                skipped_keys.add(get_meteo_project_key(project))
+
+
+def iter_cloud_data(cap_planner):
+    """
+    Yield cloud data from Meteo one cloud at a time, as it is received.
+
+    Yields records.MeteoCloud objects, invalid clouds are logged and skipped.
+    """
+    LOG.info("Getting cloud data from Meteo")
+    for pod in cap_planner.iter_get_request_items(METEO_CLOUDS_URL, 'clouds'):
+        try:
+            yield records.MeteoCloud.from_meteo(pod)
+        except records.InvalidRecordException as error:
+            LOG.error("Skipping cloud: %s", error)
+
+
+def iter_project_changes(cap_planner, since_parameter, since, skipped_keys=None):
+    """
+    Yield the Meteo projects changed since the given UTC timestamp, using Meteo's since parameter.
+
+    Yields (key, project) pairs, keyed as in the snapshot, the project
+    being None for projects Meteo reports as deleted. Invalid projects are
+    logged and skipped, their keys being added to skipped_keys if given.
+    """
+    LOG.info("Getting project changes since %s from Meteo", since)
+    url = METEO_PROJECTS_URL + ('&' if '?' in METEO_PROJECTS_URL else '?') + urllib.urlencode(
+        {since_parameter: since}
+    )
+    for project in cap_planner.iter_get_request_items(url, 'projects'):
+        if project.get("deleted"):
+            yield (str(project.get("cloud")), project.get("project_name")), None
+            continue
+        try:
+            record = records.MeteoProject.from_meteo(project)
+        except records.InvalidRecordException as error:
+            LOG.error("Skipping project: %s", error)
+            if skipped_keys is not None:
+                skipped_keys.add(get_meteo_project_key(project))
+            continue
+        yield snapshot.project_key(record), record
+
+
+def iter_all_project_changes(cap_planner, skipped_keys=None):
+    """Yield every valid Meteo project as a (key, project) pair, see iter_project_data."""
+    for project in iter_project_data(cap_planner, skipped_keys):
+        yield snapshot.project_key(project), project
@@ -0,0 +1,203 @@
+"""
+This module contains the instrumentation of REST calls, cli commands and run phases.
+
+Metrics are off by default, and while off, recording a call costs one
+attribute check. Once enabled, call counts, latency histograms, payload
+sizes and errors are kept per endpoint or command, along with the time
+spent in each phase, and can be exported as JSON or Prometheus text
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+MAX_PHASES = 1000
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class CallStatistics(object):
+    """Holds the statistics of the calls towards one endpoint or command."""
+
+    __slots__ = ('count', 'errors', 'total_seconds', 'max_seconds', 'bytes_sent',
+                 'bytes_received', 'bucket_counts')
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, bytes_sent, bytes_received, error):
+        """Add one call to the statistics."""
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        for position, bucket in enumerate(LATENCY_BUCKETS):
+            if seconds <= bucket:
+                self.bucket_counts[position] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def to_dict(self):
+        """Return the statistics as a dictionary, with cumulative latency buckets."""
+        cumulative_buckets = {}
+        running_count = 0
+        for bucket, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), self.bucket_counts):
+            running_count += bucket_count
+            cumulative_buckets[str(bucket)] = running_count
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_seconds': round(self.total_seconds, 6),
+            'max_seconds': round(self.max_seconds, 6),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'latency_buckets': cumulative_buckets
+        }
+
+
+class Metrics(object):
+    """Collects the metrics of a run."""
+
+    def __init__(self):
+        """Initialize disabled, empty metrics."""
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.phases = collections.deque(maxlen=MAX_PHASES)
+
+    def enable(self):
+        """Start collecting metrics."""
+        self.enabled = True
+
+    def start_timer(self):
+        """Return the start time of a call, or None if metrics are disabled."""
+        if not self.enabled:
+            return None
+        return time.time()
+
+    def record_call(self, kind, name, start_time, **kwargs):
+        """
+        Record a call of the given kind (rest or cli) towards the given name.
+
+        The start_time is the value returned by start_timer, nothing is
+        recorded if it is None. The keyword arguments bytes_sent,
+        bytes_received and error describe the call
+        """
+        if start_time is None:
+            return
+        seconds = time.time() - start_time
+        with self.lock:
+            statistics = self.calls.setdefault((kind, name), CallStatistics())
+            statistics.add(
+                seconds,
+                kwargs.get('bytes_sent', 0),
+                kwargs.get('bytes_received', 0),
+                kwargs.get('error', False)
+            )
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the code inside the with block as the given phase, keeping the last MAX_PHASES."""
+        if not self.enabled:
+            yield
+            return
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.append((name, time.time() - start_time))
+
+    def to_dict(self):
+        """Return the metrics as a dictionary."""
+        with self.lock:
+            calls = {}
+            for (kind, name), statistics in sorted(self.calls.items()):
+                calls.setdefault(kind, {})[name] = statistics.to_dict()
+            return {
+                'calls': calls,
+                'phases': [
+                    {'name': name, 'seconds': round(seconds, 6)} for name, seconds in self.phases
+                ]
+            }
+
+    def to_json(self):
+        """Return the metrics as a JSON summary."""
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True, separators=(',', ': '))
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP importer_call_duration_seconds Duration of REST calls and cli commands.',
+            '# TYPE importer_call_duration_seconds histogram'
+        ]
+        with self.lock:
+            calls = sorted(self.calls.items())
+            phases = collections.OrderedDict()
+            for name, seconds in self.phases:
+                phases.pop(name, None)
+                phases[name] = seconds
+        for (kind, name), statistics in calls:
+            labels = 'kind="%s",name="%s"' % (kind, escape_label(name))
+            for bucket, bucket_count in sorted(
+                    statistics.to_dict()['latency_buckets'].items(),
+                    key=lambda item: float(item[0])):
+                lines.append('importer_call_duration_seconds_bucket{%s,le="%s"} %d' % (
+                    labels, bucket, bucket_count
+                ))
+            lines.append('importer_call_duration_seconds_sum{%s} %f' % (
+                labels, statistics.total_seconds
+            ))
+            lines.append('importer_call_duration_seconds_count{%s} %d' % (labels, statistics.count))
+        for metric_name, attribute_name, help_text in (
+                ('importer_call_errors_total', 'errors', 'Failed REST calls and cli commands.'),
+                ('importer_call_bytes_sent_total', 'bytes_sent', 'Payload bytes sent.'),
+                ('importer_call_bytes_received_total', 'bytes_received',
+                 'Payload bytes received.')):
+            lines.append('# HELP %s %s' % (metric_name, help_text))
+            lines.append('# TYPE %s counter' % metric_name)
+            for (kind, name), statistics in calls:
+                lines.append('%s{kind="%s",name="%s"} %d' % (
+                    metric_name, kind, escape_label(name), getattr(statistics, attribute_name)
+                ))
+        lines.append(
+            '# HELP importer_phase_duration_seconds Duration of the last run of each phase.'
+        )
+        lines.append('# TYPE importer_phase_duration_seconds gauge')
+        for name, seconds in phases.items():
+            lines.append('importer_phase_duration_seconds{phase="%s"} %f' % (
+                escape_label(name), seconds
+            ))
+        return '\n'.join(lines) + '\n'
+
+    def write_files(self, json_file_name=None, prometheus_file_name=None):
+        """Write the metrics to the given JSON and Prometheus text files, if given."""
+        if json_file_name:
+            with open(json_file_name, 'w') as json_file:
+                json_file.write(self.to_json())
+            LOG.info("Wrote metrics summary to %s", json_file_name)
+        if prometheus_file_name:
+            with open(prometheus_file_name, 'w') as prometheus_file:
+                prometheus_file.write(self.to_prometheus())
+            LOG.info("Wrote Prometheus metrics to %s", prometheus_file_name)
+
+
+def escape_label(value):
+    """Return the given value escaped for use as a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = Metrics()
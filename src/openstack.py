@@ -4,13 +4,32 @@ This module contains functions relating specifically to openstack.
 It contains logic relating to interaction with the openstack clients
 """
 
+import functools
 import json
 import os
 import logging
+import pipes
+import token_cache
 import utils
 
 LOG = logging.getLogger(__name__)
-logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+
+
+def get_openstack_env_variables(openstack_env):
+    """
+    Return the required openstack environment variables.
+
+    This function returns the openstack environment variables that
+    are necessary for running openstack cli commands, so that they
+    can be passed to a single command rather than set process wide
+    """
+    return {
+        "OS_AUTH_URL": openstack_env['os_auth_url'],
+        "OS_TENANT_NAME": openstack_env['os_project_name'],
+        "OS_PROJECT_NAME": openstack_env['os_project_name'],
+        "OS_USERNAME": openstack_env['os_username'],
+        "OS_PASSWORD": openstack_env['os_password']
+    }
 
 
 def setup_openstack_env_variables(openstack_env):
@@ -20,21 +39,131 @@ def setup_openstack_env_variables(openstack_env):
     This function sets the required openstack environment variables
     that are necessary for running openstack cli commands
     """
-    os.environ["OS_AUTH_URL"] = openstack_env['os_auth_url']
-    os.environ["OS_TENANT_NAME"] = openstack_env['os_project_name']
-    os.environ["OS_PROJECT_NAME"] = openstack_env['os_project_name']
-    os.environ["OS_USERNAME"] = openstack_env['os_username']
-    os.environ["OS_PASSWORD"] = openstack_env['os_password']
+    os.environ.update(get_openstack_env_variables(openstack_env))
+
+
+def get_command_environment(environment, command_requires_region):
+    """
+    Return the environment to run an openstack cli command in.
+
+    This is a copy of the environment of this process, with the given
+    openstack environment variables and the region applied to it
+    """
+    command_environment = dict(os.environ)
+    if environment:
+        command_environment.update(environment)
+    if command_requires_region:
+        command_environment["OS_REGION_NAME"] = "RegionOne"
+    else:
+        command_environment.pop("OS_REGION_NAME", None)
+    return command_environment
+
+
+def parse_json_documents(text):
+    """Return the list of JSON documents found one after another in the given text."""
+    decoder = json.JSONDecoder()
+    documents = []
+    position = 0
+    while True:
+        starts = [
+            start for start in (text.find('{', position), text.find('[', position)) if start != -1
+        ]
+        if not starts:
+            return documents
+        position = min(starts)
+        try:
+            document, position = decoder.raw_decode(text, position)
+        except ValueError:
+            position += 1
+        else:
+            documents.append(document)
+
+
+def iter_table_records(lines):
+    """
+    Yield a dictionary for each property table in the given lines of cli output.
+
+    The nova and cinder clients print each record as a table with a
+    header row, then one "| key | value |" row per property. Some print
+    several tables one after the other, cinder get-pools --detail prints
+    one per pool. Values wrapped over several rows are joined with new
+    lines. A ValueError is raised for a row that isn't part of a table
+    """
+    record = None
+    borders = 0
+    key = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('+'):
+            borders += 1
+            if borders == 3:
+                yield record
+                record, borders = None, 0
+            continue
+        if not line.startswith('|') or borders == 0:
+            raise ValueError('Unexpected line outside a table: %r' % line)
+        if borders == 1:
+            record, key = {}, None
+            continue
+        row_key, _, row_value = line[1:-1].partition('|')
+        row_key, row_value = row_key.strip(), row_value.strip()
+        if row_key:
+            key = row_key
+            record[key] = row_value
+        elif key is not None:
+            record[key] += '\n' + row_value
+    if record is not None:
+        raise ValueError('The output ended inside a table')
+
+
+def parse_table_lines(multiple_records, lines):
+    """
+    Return the records parsed from the given lines of nova or cinder output, see iter_table_records.
+
+    With multiple_records set, a list of all the records is returned,
+    otherwise the single record, or an empty dictionary if there isn't one
+    """
+    records = list(iter_table_records(lines))
+    if multiple_records:
+        return records
+    if len(records) > 1:
+        raise ValueError('Expected one table, found %d' % len(records))
+    return records[0] if records else {}
+
+
+def parse_client_output(return_an_object, cli_command_output):
+    """Return the object parsed from the output of an openstack client cli command."""
+    if return_an_object:
+        if 'parsed_output' in cli_command_output:
+            return cli_command_output['parsed_output']
+        return json.loads(cli_command_output['standard_output'])
 
 
 def openstack_client_command(**kwargs):
-    """Run the openstack client cli command, with the given action and arguments."""
+    """
+    Run the openstack client cli command, with the given action and arguments.
+
+    The openstack client is asked for JSON output, the table output of
+    the nova and cinder clients is parsed as it is read, into a
+    dictionary, or a list of them with multiple_records set.
+    Only the openstack client is given the cached keystone token, the
+    nova and cinder clients authenticate with the password.
+    With prepare_only set, the command isn't run, instead a utils.CliCommand
+    is returned that can be run alongside others with utils.run_cli_commands
+    """
     command_type = kwargs.pop('command_type')
     object_type = kwargs.pop('object_type')
     action = kwargs.pop('action')
     command_requires_region = kwargs.pop('command_requires_region', False)
     arguments = kwargs.pop('arguments')
     return_an_object = kwargs.pop('return_an_object', True)
+    environment = kwargs.pop('environment', None)
+    timeout = kwargs.pop('timeout', None)
+    prepare_only = kwargs.pop('prepare_only', False)
+    key = kwargs.pop('key', None)
+    multiple_records = kwargs.pop('multiple_records', False)
 
     if kwargs:
         raise TypeError('Unexpected **kwargs: %r' % kwargs)
@@ -47,73 +176,171 @@ def openstack_client_command(**kwargs):
     if return_an_object and command_type == 'openstack':
         command_and_arguments += " -f json"
 
-    if command_requires_region:
-        os.environ["OS_REGION_NAME"] = "RegionOne"
-    else:
-        if "OS_REGION_NAME" in os.environ:
-            del os.environ["OS_REGION_NAME"]
+    parse_lines = None
+    if return_an_object and command_type != 'openstack':
+        parse_lines = functools.partial(parse_table_lines, multiple_records)
 
-    cli_command_output = utils.run_cli_command(command_and_arguments)
-    cli_command_standard_output = cli_command_output['standard_output']
+    # The nova and cinder clients can't authenticate with a token from their environment
+    resolve_env = None
+    if command_type == 'openstack':
+        resolve_env = token_cache.TOKEN_CACHE.get_command_environment
 
-    if return_an_object:
-        if command_type != 'openstack':
-            output_list = {}
-            lines = cli_command_standard_output.split('\n')[3:-2]
-            for line in lines:
-                line_parts = line.split('|')
-                output_list[line_parts[1].strip()] = line_parts[2].strip()
-        else:
-            output_list = json.loads(cli_command_standard_output)
+    cli_command = utils.CliCommand(
+        command_and_arguments,
+        env=get_command_environment(environment, command_requires_region),
+        resolve_env=resolve_env,
+        timeout=timeout,
+        parse_lines=parse_lines,
+        parse_output=functools.partial(parse_client_output, return_an_object),
+        key=key
+    )
+    if prepare_only:
+        return cli_command
 
-        return output_list
+    return cli_command.parse_output(utils.run_cli_command(
+        cli_command.command,
+        env=cli_command.get_env(),
+        timeout=cli_command.timeout,
+        parse_lines=cli_command.parse_lines
+    ))
 
 
-def get_cinder_pool_details():
-    """Run the cinder client cli command, to get details about the available pools."""
+def get_cinder_pool_details(**kwargs):
+    """
+    Run the cinder client cli command, to get details about the available pools.
+
+    Returns a list with a dictionary per pool.
+    Other keyword arguments, such as environment, timeout and
+    prepare_only, are passed on to openstack_client_command
+    """
     return openstack_client_command(
         command_type="cinder",
         object_type="--os_volume_api_version=2 get",
         action="pools",
         arguments="--detail",
-        return_an_object=True
+        return_an_object=True,
+        multiple_records=True,
+        **kwargs
     )
 
 
-def get_nova_hypervisor_stats():
-    """Run the nova client cli command, to get details about the nova hypervisor stats."""
+def get_nova_hypervisor_stats(**kwargs):
+    """
+    Run the openstack client cli command, to get details about the nova hypervisor stats.
+
+    Other keyword arguments, such as environment, timeout and
+    prepare_only, are passed on to openstack_client_command
+    """
     return openstack_client_command(
-        command_type="nova",
-        object_type="hypervisor",
-        action="stats",
+        command_type="openstack",
+        object_type="hypervisor stats",
+        action="show",
         arguments="",
-        return_an_object=True
+        return_an_object=True,
+        **kwargs
     )
 
 
-def get_project_list():
-    """Return the list of projects."""
+def get_project_list(**kwargs):
+    """
+    Return the list of projects.
+
+    Other keyword arguments, such as environment, timeout and
+    prepare_only, are passed on to openstack_client_command
+    """
     return openstack_client_command(
         command_type="openstack",
         object_type="project",
         action="list",
         arguments="",
         command_requires_region=True,
-        return_an_object=True
+        return_an_object=True,
+        **kwargs
     )
 
 
-def get_project_quotas(**kwargs):
-    """Return the quota details for the given project name."""
-    project_name = kwargs.pop('project_name', '')
+def parse_all_project_quotas(project_names, cli_command_output):
+    """
+    Return the quota details by project name, from the output of an interactive openstack client.
+
+    The quota documents are matched to the projects in the order they
+    were asked for, or by the project_name they hold if some are missing
+    """
+    quotas_list = [
+        quotas for quotas in parse_json_documents(cli_command_output['standard_output'])
+        if isinstance(quotas, dict)
+    ]
+
+    if len(quotas_list) == len(project_names):
+        return dict(zip(project_names, quotas_list))
+
+    all_project_quotas = {}
+    for quotas in quotas_list:
+        if quotas.get('project_name') in project_names:
+            all_project_quotas[quotas['project_name']] = quotas
+    LOG.warning(
+        "Quotas were only returned for %d of %d projects: %s",
+        len(all_project_quotas),
+        len(project_names),
+        cli_command_output['standard_error']
+    )
+    return all_project_quotas
+
+
+def get_all_project_quotas(**kwargs):
+    """
+    Return the quota details for the given project names, keyed by project name.
+
+    All the quotas are fetched by one openstack client process, running
+    in interactive mode with the commands on its standard input, so the
+    client starts up and authenticates only once.
+    With prepare_only set, a utils.CliCommand is returned instead
+    """
+    project_names = list(kwargs.pop('project_names'))
+    environment = kwargs.pop('environment', None)
+    timeout = kwargs.pop('timeout', None)
+    prepare_only = kwargs.pop('prepare_only', False)
+    key = kwargs.pop('key', None)
 
     if kwargs:
         raise TypeError('Unexpected **kwargs: %r' % kwargs)
 
-    return openstack_client_command(
-        command_type="openstack",
-        object_type="quota",
-        action="show",
-        arguments=project_name,
-        return_an_object=True
+    cli_command = utils.CliCommand(
+        'openstack',
+        env=get_command_environment(environment, False),
+        resolve_env=token_cache.TOKEN_CACHE.get_command_environment,
+        timeout=timeout,
+        input_data=''.join(
+            'quota show ' + pipes.quote(project_name) + ' -f json\n'
+            for project_name in project_names
+        ),
+        parse_output=functools.partial(parse_all_project_quotas, project_names),
+        key=key
     )
+    if prepare_only:
+        return cli_command
+
+    if not project_names:
+        return {}
+
+    return cli_command.parse_output(utils.run_cli_command(
+        cli_command.command,
+        env=cli_command.get_env(),
+        input_data=cli_command.input_data,
+        timeout=cli_command.timeout
+    ))
+
+
+def get_project_quotas(**kwargs):
+    """
+    Return the quota details for the given project name.
+
+    Other keyword arguments, such as environment and timeout,
+    are passed on to get_all_project_quotas
+    """
+    project_name = kwargs.pop('project_name', '')
+
+    all_project_quotas = get_all_project_quotas(project_names=[project_name], **kwargs)
+    if project_name not in all_project_quotas:
+        raise RuntimeError("No quota details were returned for project '" + project_name + "'")
+    return all_project_quotas[project_name]
@@ -0,0 +1,280 @@
+"""
+This module contains the backends the openstack data of a cloud is collected with.
+
+The cli backend runs the openstack, nova and cinder clients as
+subprocesses, each of which starts an interpreter and authenticates
+anew. The sdk backend calls the same client libraries in process, on the
+keystone sessions of token_cache, whose token is shared with the cli
+clients and reused until it expires. The fake backend serves canned data,
+for testing without a cloud.
+Each backend prepares calls that are run alongside others with
+utils.run_cli_commands, and hold their result or error once run
+"""
+
+import copy
+import functools
+import json
+import logging
+import metrics
+import openstack
+import resilience
+import token_cache
+import utils
+
+try:
+    from cinderclient import client as cinder_client
+    from cinderclient import exceptions as cinder_exceptions
+    from keystoneauth1 import exceptions as keystone_exceptions
+    from keystoneclient.v3 import client as keystone_client
+    from novaclient import client as nova_client
+    from novaclient import exceptions as nova_exceptions
+except ImportError:
+    keystone_client = None
+
+LOG = logging.getLogger(__name__)
+
+BACKEND_NAMES = ('sdk', 'cli', 'fake')
+DEFAULT_BACKEND = 'sdk'
+NOVA_API_VERSION = '2'
+CINDER_API_VERSION = '2'
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class BackendException(Exception):
+    """
+    Custom exception for expressing failed backend calls.
+
+    This custom exception is used to convey that an in process call
+    for openstack data failed, or that the fake backend has no data
+    for it
+    """
+
+    pass
+
+
+class BackendCall(utils.CliCommand):  # pylint: disable=too-few-public-methods
+    """
+    Represents a call to an in process backend, to be run by utils.run_cli_commands.
+
+    Like a utils.CliCommand, it holds its result, or the BackendException
+    it raised, once run. Any other exception the call raises is kept as a
+    BackendException too, failing this call rather than the ones run
+    alongside it. The command describes the call for logging
+    """
+
+    def __init__(self, command, function, key=None):
+        """Initialize a call of the given function, taking no arguments."""
+        super(BackendCall, self).__init__(command, key=key)
+        self.function = function
+
+    def run(self):
+        """Call the function, keeping its result or error."""
+        try:
+            self.result = self.function()
+        except (BackendException, resilience.CircuitOpenException) as error:
+            self.error = error
+            LOG.error("%s failed: %s", self.command, error)
+        except Exception as error:  # pylint: disable=broad-except
+            self.error = BackendException('The call failed unexpectedly: ' + repr(error))
+            LOG.exception("%s failed: %s", self.command, self.error)
+        return self
+
+
+class CliBackend(object):  # pylint: disable=too-few-public-methods
+    """Collects openstack data by running the openstack, nova and cinder cli clients."""
+
+    name = 'cli'
+
+    getters = {
+        'hypervisor_stats': openstack.get_nova_hypervisor_stats,
+        'cinder_pools': openstack.get_cinder_pool_details,
+        'projects': openstack.get_project_list,
+        'project_quotas': openstack.get_all_project_quotas
+    }
+
+    def prepare(self, data_name, environment, key=None, **arguments):
+        """Return a utils.CliCommand collecting the given data with the given environment."""
+        return self.getters[data_name](
+            environment=environment, prepare_only=True, key=key, **arguments
+        )
+
+
+def get_sdk_hypervisor_stats(session):
+    """Return the nova hypervisor stats, as the cli backend does."""
+    nova = nova_client.Client(NOVA_API_VERSION, session=session)
+    return nova.hypervisor_stats.statistics().to_dict()
+
+
+def get_sdk_cinder_pools(session):
+    """Return a dictionary per cinder pool, its capabilities alongside its name, as with cli."""
+    pools = []
+    for pool in cinder_client.Client(CINDER_API_VERSION, session=session).pools.list(detailed=True):
+        pool_data = pool.to_dict()
+        pool_details = dict(pool_data.pop('capabilities', None) or {})
+        pool_details.update(pool_data)
+        pools.append(pool_details)
+    return pools
+
+
+def get_keystone_client(session):
+    """Return a keystone client on the given session, on the public endpoint as the cli uses."""
+    return keystone_client.Client(session=session, interface='public')
+
+
+def get_sdk_projects(session):
+    """Return the projects, with the ID and Name keys the cli backend has."""
+    return [
+        {'ID': project.id, 'Name': project.name}
+        for project in get_keystone_client(session).projects.list()
+    ]
+
+
+def get_sdk_project_quotas(session, project_names):
+    """Return the nova and cinder quotas of the given project names, keyed by project name."""
+    project_ids = dict(
+        (project.name, project.id) for project in get_keystone_client(session).projects.list()
+    )
+    nova = nova_client.Client(NOVA_API_VERSION, session=session)
+    cinder = cinder_client.Client(CINDER_API_VERSION, session=session)
+    all_project_quotas = {}
+    for project_name in project_names:
+        project_id = project_ids.get(project_name)
+        if project_id is None:
+            LOG.warning("No project named '%s' to get the quotas of", project_name)
+            continue
+        quotas = nova.quotas.get(project_id).to_dict()
+        quotas.update(cinder.quotas.get(project_id).to_dict())
+        quotas['project'] = project_id
+        quotas['project_name'] = project_name
+        all_project_quotas[project_name] = quotas
+    return all_project_quotas
+
+
+def is_transient_sdk_error(error):
+    """Return True if the given client library error is likely to be transient."""
+    if keystone_client is None:
+        return False
+    if isinstance(error, (keystone_exceptions.ConnectFailure,
+                          keystone_exceptions.RetriableConnectionFailure)):
+        return True
+    status_code = getattr(error, 'http_status', None) or getattr(error, 'code', None)
+    return status_code in TRANSIENT_STATUS_CODES
+
+
+class SdkBackend(object):
+    """
+    Collects openstack data by calling the openstack client libraries in process.
+
+    The calls towards a cloud share the keystone session of its project
+    and user in token_cache.TOKEN_CACHE, and so its token and connections
+    """
+
+    name = 'sdk'
+
+    getters = {
+        'hypervisor_stats': get_sdk_hypervisor_stats,
+        'cinder_pools': get_sdk_cinder_pools,
+        'projects': get_sdk_projects,
+        'project_quotas': get_sdk_project_quotas
+    }
+
+    def __init__(self, cache=None, attempts=utils.DEFAULT_CLI_ATTEMPTS):
+        """Initialize the backend on the given token_cache.TokenCache, by default the shared one."""
+        self.cache = cache or token_cache.TOKEN_CACHE
+        self.retry_policy = resilience.RetryPolicy(attempts=attempts)
+
+    def get_session(self, environment):
+        """Return the keystone session of the given environment, with an unexpired token."""
+        self.cache.get_access(environment)
+        return self.cache.get_session(environment)
+
+    def prepare(self, data_name, environment, key=None, **arguments):
+        """Return a BackendCall collecting the given data with the given environment."""
+        return BackendCall(
+            self.name + ' ' + data_name + ' (' + environment['OS_AUTH_URL'] + ')',
+            functools.partial(self.call, data_name, environment, **arguments),
+            key=key
+        )
+
+    def call(self, data_name, environment, **arguments):
+        """Return the given data, retrying calls that fail transiently."""
+        getter = self.getters[data_name]
+        start_time = metrics.METRICS.start_timer()
+        try:
+            result = resilience.call(
+                lambda: getter(self.get_session(environment), **arguments),
+                host=utils.command_host(environment),
+                idempotent=True,
+                retry_policy=self.retry_policy,
+                is_transient=is_transient_sdk_error,
+                description='get ' + data_name + ' from ' + environment['OS_AUTH_URL']
+            )
+        except (keystone_exceptions.ClientException,
+                nova_exceptions.ClientException,
+                cinder_exceptions.ClientException) as error:
+            metrics.METRICS.record_call(self.name, data_name, start_time, error=True)
+            raise BackendException(str(error))
+        except Exception:
+            metrics.METRICS.record_call(self.name, data_name, start_time, error=True)
+            raise
+        metrics.METRICS.record_call(self.name, data_name, start_time)
+        return result
+
+
+class FakeBackend(object):
+    """
+    Serves canned openstack data, for testing.
+
+    The data is a dictionary keyed by auth url, of dictionaries keyed by
+    data name, hypervisor_stats, cinder_pools, projects or project_quotas,
+    the project quotas being keyed by project name
+    """
+
+    name = 'fake'
+
+    def __init__(self, data):
+        """Initialize the backend with the given data."""
+        self.data = data
+
+    @classmethod
+    def load(cls, file_name):
+        """Return a fake backend serving the data in the given JSON file."""
+        with open(file_name) as data_file:
+            return cls(json.load(data_file))
+
+    def prepare(self, data_name, environment, key=None, **arguments):
+        """Return a BackendCall returning the given data of the cloud in the given environment."""
+        return BackendCall(
+            self.name + ' ' + data_name + ' (' + environment['OS_AUTH_URL'] + ')',
+            functools.partial(self.get, data_name, environment['OS_AUTH_URL'], **arguments),
+            key=key
+        )
+
+    def get(self, data_name, auth_url, project_names=None):
+        """Return a copy of the given data of the cloud with the given auth url."""
+        cloud_data = self.data.get(auth_url, {})
+        if data_name not in cloud_data:
+            raise BackendException('No fake ' + data_name + ' for ' + auth_url)
+        data = copy.deepcopy(cloud_data[data_name])
+        if project_names is not None:
+            data = dict((name, quotas) for name, quotas in data.items() if name in project_names)
+        return data
+
+
+def get_backend(name=DEFAULT_BACKEND, fake_data_file=None):
+    """
+    Return the backend of the given name, sdk, cli or fake.
+
+    The sdk backend falls back to the cli backend if the openstack client
+    libraries aren't installed, the fake backend serves the data in
+    fake_data_file
+    """
+    if name == 'fake':
+        return FakeBackend.load(fake_data_file)
+    if name == 'sdk':
+        if keystone_client is not None and token_cache.is_available():
+            return SdkBackend()
+        LOG.warning(
+            "The openstack client libraries aren't installed, running the cli clients instead"
+        )
+    return CliBackend()
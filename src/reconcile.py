@@ -0,0 +1,117 @@
+"""
+This module contains the logic for reconciling Meteo data with the capacity planner.
+
+It compares the desired state (from Meteo) with the actual state
+(from the capacity planner), both keyed on their natural keys, and
+works out the minimal set of changes needed to bring them in line
+"""
+
+import records
+
+
+class ChangeSet(object):
+    """Represents the changes needed to bring the capacity planner in line with Meteo."""
+
+    def __init__(self):
+        """Initialize an empty change set."""
+        self.teams_to_create = []
+        self.teams_to_delete = []
+        self.projects_to_create = []
+        self.projects_to_update = []
+        self.projects_to_delete = []
+        self.projects_unchanged = []
+        self.projects_kept = []
+
+    def is_empty(self):
+        """Return True if there is nothing to write to the capacity planner."""
+        return not (
+            self.teams_to_create or self.teams_to_delete or
+            self.projects_to_create or self.projects_to_update or
+            self.projects_to_delete
+        )
+
+    def summary(self):
+        """Return a one line description of the change set."""
+        return (
+            "teams: %d to create, %d to delete; "
+            "projects: %d to create, %d to update, %d to delete, %d unchanged, "
+            "%d kept as their Meteo record is invalid" % (
+                len(self.teams_to_create),
+                len(self.teams_to_delete),
+                len(self.projects_to_create),
+                len(self.projects_to_update),
+                len(self.projects_to_delete),
+                len(self.projects_unchanged),
+                len(self.projects_kept)
+            )
+        )
+
+
+def diff_projects(desired_projects, actual_projects, changeset, kept_keys=()):
+    """
+    Add the project creates, updates and deletes to the change set.
+
+    Both arguments are dictionaries of records.ProjectState keyed by
+    their natural key, the desired states are from Meteo, and the actual
+    states are from the capacity planner. Actual projects that aren't
+    desired are deleted, unless their key is in kept_keys, the keys of
+    the projects whose Meteo record was skipped as invalid
+    """
+    for key, desired in desired_projects.items():
+        actual = actual_projects.get(key)
+        if actual is None:
+            changeset.projects_to_create.append(desired)
+        elif desired.compared_fields() != actual.compared_fields():
+            changeset.projects_to_update.append((desired, actual))
+        else:
+            changeset.projects_unchanged.append(desired)
+    for key, actual in actual_projects.items():
+        if key in desired_projects:
+            continue
+        if key in kept_keys:
+            changeset.projects_kept.append(actual)
+        else:
+            changeset.projects_to_delete.append(actual)
+
+
+def diff_teams(desired_team_names, actual_team_names, changeset):
+    """Add the team creates and deletes to the change set."""
+    desired_team_names = set(desired_team_names)
+    actual_team_names = set(actual_team_names)
+    changeset.teams_to_create.extend(sorted(desired_team_names - actual_team_names))
+    changeset.teams_to_delete.extend(sorted(actual_team_names - desired_team_names))
+
+
+def compute_changeset(desired_projects, actual_projects, actual_team_names, kept_keys=()):
+    """
+    Return the change set between the desired and actual state.
+
+    The actual projects whose key is in kept_keys are kept as they are,
+    see diff_projects. The desired teams are the teams used by the
+    desired projects and by the kept projects
+    """
+    changeset = ChangeSet()
+    diff_projects(desired_projects, actual_projects, changeset, kept_keys)
+    diff_teams(
+        [project.team_name for project in desired_projects.values()] +
+        [project.team_name for project in changeset.projects_kept if project.team_name is not None],
+        actual_team_names,
+        changeset
+    )
+    return changeset
+
+
+def join_pod_stats(clouds, live_stats, planner_pods):
+    """
+    Yield a records.EnrichedPod for each of the given records.MeteoCloud.
+
+    Each cloud is joined on its name with its records.LiveCloudStats,
+    given as a dictionary keyed by cloud name, and on its pod name with
+    the capacity planner pod of that name, through a hash table of the
+    pods built once, so that the join is linear in the size of the estate
+    """
+    planner_ids = dict((pod.get("name"), pod.get("_id")) for pod in planner_pods)
+    for cloud in clouds:
+        yield records.EnrichedPod(
+            cloud, planner_ids.get(cloud.pod_name), live_stats.get(cloud.cloud_name)
+        )
@@ -0,0 +1,256 @@
+"""
+This module contains compact record types for Meteo and Capacity Planner data.
+
+Records are validated and normalised once, when the data is read,
+so the rest of the pipeline can use their fields directly
+"""
+
+
+class InvalidRecordException(Exception):
+    """
+    Custom exception for expressing invalid input records.
+
+    This custom exception is used to convey that a record read from
+    Meteo or the capacity planner is missing a field or has a field
+    that can't be normalised
+    """
+
+    pass
+
+
+def parse_number(value):
+    """
+    Return the given value as an int, or a float if it has a fractional part.
+
+    '4', 4 and 4.0 all give 4, a ValueError is raised if the value isn't numeric
+    """
+    number = float(value)
+    if number.is_integer():
+        return int(number)
+    return number
+
+
+def get_numbers(record_type, data, field_names):
+    """Return the numeric values of the given fields, or raise an InvalidRecordException."""
+    numbers = []
+    for field_name in field_names:
+        try:
+            numbers.append(parse_number(data.get(field_name)))
+        except (TypeError, ValueError):
+            raise InvalidRecordException(
+                "%s has an invalid %s: %r" % (record_type, field_name, data)
+            )
+    return numbers
+
+
+class MeteoProject(object):
+    """Represents a project from Meteo."""
+
+    __slots__ = ('name', 'cloud', 'team_name', 'cpu', 'memory_mb', 'cinder_gb')
+
+    def __init__(self, name, cloud, team_name, capacity):
+        """Initialize a Meteo project record, its capacity being cpu, memory_mb and cinder_gb."""
+        self.name = name
+        self.cloud = cloud
+        self.team_name = team_name
+        self.cpu, self.memory_mb, self.cinder_gb = capacity
+
+    @classmethod
+    def from_meteo(cls, project):
+        """
+        Return a record for the given project dictionary from Meteo.
+
+        The team name is the team stored in Meteo, or if there isn't one,
+        the project name without its last '_' separated part
+        """
+        name = project.get("project_name")
+        if not name or project.get("cloud") is None:
+            raise InvalidRecordException("Meteo project has no project_name or cloud: %r" % project)
+        team_name = project.get("team") or name.rsplit("_", 1)[0]
+        capacity = get_numbers(
+            "Meteo project", project, ("allocated_cpu", "allocated_ram", "allocated_storage")
+        )
+        return cls(name, str(project.get("cloud")), team_name, capacity)
+
+    @property
+    def pod_name(self):
+        """Return the name of the capacity planner pod this project lives in."""
+        return "cloud" + self.cloud
+
+
+class MeteoCloud(object):  # pylint: disable=too-many-instance-attributes
+    """Represents a cloud from Meteo."""
+
+    __slots__ = (
+        'cloud_name', 'auth_url', 'cpu', 'memory_mb', 'cinder_gb', 'cinder_iops',
+        'enfs_gb', 'enfs_iops', 'cpu_contention_ratio'
+    )
+
+    def __init__(self, cloud_name, auth_url, *capacity):
+        """
+        Initialize a Meteo cloud record.
+
+        The capacity is the cpu, memory_mb, cinder_gb, cinder_iops,
+        enfs_gb, enfs_iops and cpu_contention_ratio, in that order
+        """
+        self.cloud_name = cloud_name
+        self.auth_url = auth_url
+        (self.cpu, self.memory_mb, self.cinder_gb, self.cinder_iops,
+         self.enfs_gb, self.enfs_iops, self.cpu_contention_ratio) = capacity
+
+    @classmethod
+    def from_meteo(cls, cloud):
+        """Return a record for the given cloud dictionary from Meteo."""
+        if cloud.get("cloud_name") is None or not cloud.get("auth_url"):
+            raise InvalidRecordException("Meteo cloud has no cloud_name or auth_url: %r" % cloud)
+        capacity = get_numbers("Meteo cloud", cloud, (
+            "total_cpu", "total_ram", "total_cinder_storage", "cinder_iops",
+            "total_enfs_storage", "total_enfs_iops", "cpu_ratio"
+        ))
+        return cls(str(cloud.get("cloud_name")), cloud.get("auth_url"), *capacity)
+
+    @property
+    def pod_name(self):
+        """Return the name of the capacity planner pod for this cloud."""
+        return "cloud" + self.cloud_name
+
+    def usage(self):  # pylint: disable=no-self-use
+        """Return the live usage fields to write to the pod, none for a cloud as Meteo has it."""
+        return {}
+
+
+class LiveCloudStats(object):  # pylint: disable=too-few-public-methods
+    """
+    Represents the usage of a cloud, as collected from its nova hypervisor stats and cinder pools.
+
+    The cinder capacity is summed over the pools, pools reporting an
+    'infinite' or 'unknown' capacity are left out of the sums
+    """
+
+    __slots__ = ('cloud_name', 'vcpus', 'vcpus_used', 'memory_mb', 'memory_mb_used',
+                 'cinder_total_gb', 'cinder_free_gb')
+
+    def __init__(self, cloud_name, *usage):
+        """
+        Initialize a live cloud stats record.
+
+        The usage is the vcpus, vcpus_used, memory_mb, memory_mb_used,
+        cinder_total_gb and cinder_free_gb, in that order
+        """
+        self.cloud_name = cloud_name
+        (self.vcpus, self.vcpus_used, self.memory_mb, self.memory_mb_used,
+         self.cinder_total_gb, self.cinder_free_gb) = usage
+
+    @classmethod
+    def from_collected(cls, cloud_name, cloud_data):
+        """Return a record for the data collected from a cloud by collector.collect_cloud_stats."""
+        hypervisor_usage = get_numbers(
+            "Hypervisor stats of cloud " + cloud_name,
+            cloud_data.get("hypervisor_stats") or {},
+            ("vcpus", "vcpus_used", "memory_mb", "memory_mb_used")
+        )
+        cinder_pools = cloud_data.get("cinder_pools") or []
+        if isinstance(cinder_pools, dict):
+            cinder_pools = [cinder_pools]
+        cinder_total_gb = cinder_free_gb = 0
+        for pool in cinder_pools:
+            try:
+                total_gb = parse_number(pool.get("total_capacity_gb"))
+                free_gb = parse_number(pool.get("free_capacity_gb"))
+            except (TypeError, ValueError):
+                continue
+            cinder_total_gb += total_gb
+            cinder_free_gb += free_gb
+        return cls(cloud_name, *(hypervisor_usage + [cinder_total_gb, cinder_free_gb]))
+
+
+class EnrichedPod(MeteoCloud):  # pylint: disable=too-many-instance-attributes
+    """
+    Represents a Meteo cloud joined with its capacity planner pod and its live usage.
+
+    The planner_id is None for clouds without a pod in the capacity
+    planner, and the stats None for clouds whose usage wasn't collected
+    """
+
+    __slots__ = ('planner_id', 'stats')
+
+    def __init__(self, cloud, planner_id=None, stats=None):
+        """Initialize the given MeteoCloud joined with its pod's _id and its LiveCloudStats."""
+        super(EnrichedPod, self).__init__(
+            cloud.cloud_name, cloud.auth_url, cloud.cpu, cloud.memory_mb, cloud.cinder_gb,
+            cloud.cinder_iops, cloud.enfs_gb, cloud.enfs_iops, cloud.cpu_contention_ratio
+        )
+        self.planner_id = planner_id
+        self.stats = stats
+
+    def usage(self):
+        """Return the live usage fields to write to the capacity planner pod."""
+        if self.stats is None:
+            return {}
+        return {
+            "vcpus_used": self.stats.vcpus_used,
+            "memory_mb_used": self.stats.memory_mb_used,
+            "cinder_free_gb": self.stats.cinder_free_gb
+        }
+
+
+class ProjectState(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Represents the state of a project, as Meteo wants it or as the capacity planner has it.
+
+    The planner_id is only set for projects in the capacity planner,
+    and the source is the MeteoProject a wanted state comes from
+    """
+
+    __slots__ = (
+        'name', 'pod_id', 'team_name', 'cpu', 'memory_mb', 'cinder_gb', 'planner_id', 'source'
+    )
+
+    def __init__(self, name, pod_id, team_name, capacity, **kwargs):
+        """Initialize a project state, the capacity being the cpu, memory_mb and cinder_gb."""
+        self.name = name
+        self.pod_id = pod_id
+        self.team_name = team_name
+        self.cpu, self.memory_mb, self.cinder_gb = capacity
+        self.planner_id = kwargs.pop('planner_id', None)
+        self.source = kwargs.pop('source', None)
+
+        if kwargs:
+            raise TypeError('Unexpected **kwargs: %r' % kwargs)
+
+    @classmethod
+    def from_meteo(cls, project, pod_id):
+        """Return the state Meteo wants the given MeteoProject to be in, in the given pod."""
+        return cls(
+            project.name,
+            pod_id,
+            project.team_name,
+            (project.cpu, project.memory_mb, project.cinder_gb),
+            source=project
+        )
+
+    @classmethod
+    def from_planner(cls, project, team_name):
+        """Return the state of the given capacity planner project dictionary."""
+        try:
+            capacity = get_numbers(
+                "Capacity Planner project", project, ("cpu", "memory_mb", "cinder_gb")
+            )
+        except InvalidRecordException:
+            capacity = (project.get("cpu"), project.get("memory_mb"), project.get("cinder_gb"))
+        return cls(
+            project.get("name"),
+            project.get("pod_id"),
+            team_name,
+            capacity,
+            planner_id=project.get("_id")
+        )
+
+    @property
+    def key(self):
+        """Return the natural key of the project, its name and the pod it lives in."""
+        return (self.name, self.pod_id)
+
+    def compared_fields(self):
+        """Return the fields that decide whether a project needs updating."""
+        return (self.team_name, self.pod_id, self.cpu, self.memory_mb, self.cinder_gb)
@@ -0,0 +1,248 @@
+"""
+This module contains the retry, circuit breaker and concurrency logic of REST and cli calls.
+
+Idempotent calls that fail in a way that is likely to be transient are
+retried after a jittered, exponentially growing delay. A circuit breaker
+per target host stops calls towards a host that keeps failing, so that a
+run fails fast instead of piling retries onto a struggling service. The
+adaptive limiter lowers the number of concurrent calls when latency or
+errors rise, and raises it again as they recover
+"""
+
+import logging
+import random
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+LATENCY_TOLERANCE = 3.0
+MIN_SLOW_LATENCY = 0.1
+
+
+class CircuitOpenException(Exception):
+    """
+    Custom exception for expressing an open circuit.
+
+    This custom exception is used to convey that a call was not made
+    because too many of the latest calls towards its host failed
+    """
+
+    pass
+
+
+class RetryPolicy(object):  # pylint: disable=too-few-public-methods
+    """Decides how many times a call is attempted, and how long to wait in between."""
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        """Initialize the policy, an attempts of 1 turns retries off."""
+        self.attempts = max(int(attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Return the number of seconds to wait after the given failed attempt, counting from 0."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls towards a host after failure_threshold failures in a row.
+
+    After reset_timeout seconds, one call is let through, closing the
+    circuit again if it succeeds
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        """Initialize a closed circuit breaker."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def before_call(self, host):
+        """Raise a CircuitOpenException if no call towards the host should be made now."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.trial_running or time.time() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenException(
+                    'Not calling ' + host + ' after ' + str(self.failures) + ' failures in a row'
+                )
+            self.trial_running = True
+
+    def record_success(self):
+        """Close the circuit."""
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self, host):
+        """Count a failure, opening the circuit once the threshold is reached."""
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    LOG.warning(
+                        "Opening the circuit towards %s after %d failures", host, self.failures
+                    )
+                self.opened_at = time.time()
+
+
+class CircuitBreakerRegistry(object):  # pylint: disable=too-few-public-methods
+    """Holds a circuit breaker per host."""
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        """Initialize the registry, its breakers using the given settings."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def get(self, host):
+        """Return the circuit breaker of the given host."""
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return breaker
+
+
+class AdaptiveLimiter(object):
+    """
+    Limits the number of concurrent calls, adapting the limit to latency and errors.
+
+    The limit grows by one per limit successful calls, and halves on an
+    error or a call slower than both MIN_SLOW_LATENCY and LATENCY_TOLERANCE
+    times the fastest recent call of the same kind, at most once per limit
+    calls, staying between 1 and max_limit
+    """
+
+    def __init__(self, max_limit):
+        """Initialize the limiter at its maximum limit."""
+        self.max_limit = max(int(max_limit), 1)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.calls_since_decrease = 0
+        self.fastest_latencies = {}
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Block until a call may start."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, error, kind=None):
+        """Finish a call of the given kind that took latency seconds, adapting the limit."""
+        with self.condition:
+            self.in_flight -= 1
+            fastest_latency = self.fastest_latencies.get(kind)
+            if not error:
+                if fastest_latency is None or latency < fastest_latency:
+                    fastest_latency = latency
+                else:
+                    fastest_latency += (latency - fastest_latency) * 0.01
+                self.fastest_latencies[kind] = fastest_latency
+            previous_limit = int(self.limit)
+            self.calls_since_decrease += 1
+            if error or latency > max(fastest_latency * LATENCY_TOLERANCE, MIN_SLOW_LATENCY):
+                if self.calls_since_decrease >= previous_limit:
+                    self.limit = max(self.limit / 2, 1.0)
+                    self.calls_since_decrease = 0
+            else:
+                self.limit = min(self.limit + 1 / self.limit, float(self.max_limit))
+            if int(self.limit) != previous_limit:
+                LOG.debug("Concurrency limit now %d", int(self.limit))
+            self.condition.notify_all()
+
+
+def limited_call(function, limiter, kind, is_transient):
+    """Call the function within the concurrency limit of the limiter, if one is given."""
+    if limiter is None:
+        return function()
+    limiter.acquire()
+    start_time = time.time()
+    try:
+        result = function()
+    except Exception as error:
+        limiter.release(time.time() - start_time, is_transient(error), kind)
+        raise
+    limiter.release(time.time() - start_time, False, kind)
+    return result
+
+
+def call(function, **kwargs):
+    """
+    Call the function, retrying it as the retry policy allows, and return its result.
+
+    Only transient failures count towards the circuit breaker and the
+    limiter, and only idempotent calls, or calls that failed without
+    being processed, are retried.
+    The keyword arguments are:
+        host (str): the host called, for its circuit breaker
+        idempotent (bool): whether the call can safely be repeated, defaults to False
+        retry_policy (RetryPolicy): defaults to a single attempt
+        is_transient (function): given the exception raised, returns True
+            if it is likely to be transient, defaults to never
+        is_unprocessed (function): given the exception raised, returns True
+            if the call certainly wasn't processed, defaults to never
+        breakers (CircuitBreakerRegistry): defaults to CIRCUIT_BREAKERS
+        limiter (AdaptiveLimiter): optional
+        kind (str): the kind of call, for the limiter to compare latencies within
+        description (str): what the call does, for logging
+    """
+    host = kwargs.pop('host')
+    idempotent = kwargs.pop('idempotent', False)
+    retry_policy = kwargs.pop('retry_policy', None) or RetryPolicy(attempts=1)
+    is_transient = kwargs.pop('is_transient', lambda error: False)
+    is_unprocessed = kwargs.pop('is_unprocessed', lambda error: False)
+    breaker = (kwargs.pop('breakers', None) or CIRCUIT_BREAKERS).get(host)
+    limiter = kwargs.pop('limiter', None)
+    kind = kwargs.pop('kind', None)
+    description = kwargs.pop('description', 'call ' + host)
+
+    if kwargs:
+        raise TypeError('Unexpected **kwargs: %r' % kwargs)
+
+    attempt = 0
+    while True:
+        breaker.before_call(host)
+        try:
+            result = limited_call(function, limiter, kind, is_transient)
+        # Any exception may be transient, is_transient decides, and the others are raised again
+        except Exception as error:  # pylint: disable=broad-except
+            if not is_transient(error):
+                breaker.record_success()
+                raise
+            breaker.record_failure(host)
+            attempt += 1
+            if not (idempotent or is_unprocessed(error)) or attempt >= retry_policy.attempts:
+                raise
+            delay = retry_policy.delay(attempt - 1)
+            LOG.warning(
+                "Attempt %d to %s failed (%s), retrying in %.1fs",
+                attempt, description, error, delay
+            )
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+CIRCUIT_BREAKERS = CircuitBreakerRegistry()
@@ -0,0 +1,206 @@
+"""
+This module contains the scheduler of the long running daemon mode of the importer.
+
+The daemon runs a sync on an interval, with some jitter so that several
+daemons don't all hit the same services at once, keeping whatever the
+sync holds on to warm between runs. A local HTTP server reports its
+health and metrics, and can trigger a sync straight away
+"""
+
+import BaseHTTPServer
+import SocketServer
+import json
+import logging
+import random
+import threading
+import time
+import metrics
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 300.0
+DEFAULT_JITTER = 30.0
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+
+class SyncDaemon(object):  # pylint: disable=too-many-instance-attributes
+    """Runs a sync function every interval seconds, give or take the jitter, until stopped."""
+
+    def __init__(self, sync_function, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER):
+        """Initialize the daemon with the function to run on each sync."""
+        self.sync_function = sync_function
+        self.interval = interval
+        self.jitter = min(jitter, interval)
+        self.trigger_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.running = False
+        self.last_run_started = None
+        self.last_run_finished = None
+        self.last_run_seconds = None
+        self.last_success = None
+        self.last_error = None
+        self.next_run_time = None
+
+    def trigger(self):
+        """Start a sync as soon as the current one, if any, has finished."""
+        self.trigger_event.set()
+
+    def stop(self):
+        """Stop the daemon once the current sync, if any, has finished."""
+        self.stop_event.set()
+        self.trigger_event.set()
+
+    def next_delay(self):
+        """Return the number of seconds to wait before the next sync."""
+        return max(self.interval + random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def run_once(self):
+        """Run one sync, keeping its outcome, errors are logged rather than raised."""
+        with self.lock:
+            self.running = True
+            self.last_run_started = time.time()
+        error = None
+        try:
+            with metrics.METRICS.phase('sync'):
+                self.sync_function()
+        except Exception as sync_error:  # pylint: disable=broad-except
+            error = sync_error
+            LOG.exception("Sync failed")
+        with self.lock:
+            self.running = False
+            self.runs += 1
+            self.last_run_finished = time.time()
+            self.last_run_seconds = self.last_run_finished - self.last_run_started
+            if error is None:
+                self.last_success = self.last_run_finished
+                self.last_error = None
+            else:
+                self.failures += 1
+                self.last_error = str(error)
+        LOG.info(
+            "Sync %s in %.1fs",
+            'failed' if error is not None else 'completed',
+            self.last_run_seconds
+        )
+
+    def run_forever(self):
+        """Run syncs until stopped, the first one straight away."""
+        LOG.info("Syncing every %.0fs, give or take %.0fs", self.interval, self.jitter)
+        while not self.stop_event.is_set():
+            self.trigger_event.clear()
+            self.run_once()
+            delay = self.next_delay()
+            with self.lock:
+                self.next_run_time = time.time() + delay
+            self.trigger_event.wait(delay)
+
+    def is_healthy(self):
+        """Return True unless the last sync failed."""
+        with self.lock:
+            return self.last_error is None
+
+    def status(self):
+        """Return the state of the daemon as a dictionary."""
+        with self.lock:
+            return {
+                'healthy': self.last_error is None,
+                'running': self.running,
+                'runs': self.runs,
+                'failures': self.failures,
+                'last_run_started': self.last_run_started,
+                'last_run_finished': self.last_run_finished,
+                'last_run_seconds': self.last_run_seconds,
+                'last_success': self.last_success,
+                'last_error': self.last_error,
+                'next_run_time': self.next_run_time
+            }
+
+    def to_prometheus(self):
+        """Return the state of the daemon in the Prometheus text exposition format."""
+        status = self.status()
+        lines = []
+        for metric_name, metric_type, value in (
+                ('importer_sync_runs_total', 'counter', status['runs']),
+                ('importer_sync_failures_total', 'counter', status['failures']),
+                ('importer_sync_healthy', 'gauge', 1 if status['healthy'] else 0),
+                ('importer_sync_last_success_timestamp_seconds', 'gauge',
+                 status['last_success'] or 0)):
+            lines.append('# TYPE %s %s' % (metric_name, metric_type))
+            lines.append('%s %s' % (metric_name, value))
+        return '\n'.join(lines) + '\n'
+
+
+class StatusRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the daemon's endpoints.
+
+    GET /health gives the daemon's status as JSON, with a 503 if the
+    last sync failed, GET /metrics gives the metrics in the Prometheus
+    text format, and POST /trigger starts a sync straight away
+    """
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Log requests at DEBUG, health checks are frequent."""
+        LOG.debug("Status server: " + args[0], *args[1:])
+
+    def send_body(self, status, content_type, body):
+        """Send a response with the given status and body."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the health and metrics endpoints."""
+        sync_daemon = self.server.sync_daemon
+        if self.path == '/health':
+            self.send_body(
+                200 if sync_daemon.is_healthy() else 503,
+                'application/json',
+                json.dumps(sync_daemon.status())
+            )
+        elif self.path == '/metrics':
+            self.send_body(
+                200,
+                'text/plain; version=0.0.4',
+                metrics.METRICS.to_prometheus() + sync_daemon.to_prometheus()
+            )
+        else:
+            self.send_body(404, 'application/json', '{}')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Serve the trigger endpoint."""
+        if self.path == '/trigger':
+            self.server.sync_daemon.trigger()
+            self.send_body(202, 'application/json', json.dumps({'triggered': True}))
+        else:
+            self.send_body(404, 'application/json', '{}')
+
+
+class StatusServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A threaded HTTP server for the daemon's endpoints."""
+
+    daemon_threads = True
+
+    def __init__(self, sync_daemon, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Initialize the server for the given daemon, listening on the given host and port."""
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), StatusRequestHandler)
+        self.sync_daemon = sync_daemon
+        self.thread = None
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        LOG.info("Serving /health, /metrics and /trigger on %s:%d", *self.server_address[:2])
+
+    def stop(self):
+        """Stop serving."""
+        self.shutdown()
+        self.server_close()
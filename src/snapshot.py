@@ -0,0 +1,75 @@
+"""
+This module contains the local snapshot used for incremental Meteo syncs.
+
+After each successful sync, a content hash of every Meteo project is
+stored along with the _id the project has in the capacity planner, and
+the Meteo change cursor if one was used. The next sync only needs to
+process the projects whose hash changed, that appeared or that
+disappeared since
+"""
+
+import hashlib
+import json
+import logging
+import utils
+
+LOG = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def project_key(project):
+    """Return the key of a records.MeteoProject in the snapshot, its cloud and name."""
+    return (project.cloud, project.name)
+
+
+def project_hash(project):
+    """Return a hash of the fields of a records.MeteoProject written to the capacity planner."""
+    return hashlib.sha1(json.dumps([
+        project.name, project.cloud, project.team_name,
+        project.cpu, project.memory_mb, project.cinder_gb
+    ]).encode('utf-8')).hexdigest()
+
+
+class Snapshot(object):
+    """
+    Represents the Meteo projects as they were at the end of the last successful sync.
+
+    The projects are a dictionary of (hash, planner_id) keyed by
+    project_key, the cursor is the Meteo change cursor to sync from
+    next, if Meteo offers one
+    """
+
+    def __init__(self, projects=None, cursor=None):
+        """Initialize a snapshot."""
+        self.projects = projects if projects is not None else {}
+        self.cursor = cursor
+
+    @classmethod
+    def load(cls, file_name):
+        """Return the snapshot stored in the given file, or None if there isn't a usable one."""
+        try:
+            with open(file_name) as snapshot_file:
+                data = json.load(snapshot_file)
+        except (IOError, OSError, ValueError) as error:
+            LOG.info("No usable snapshot in %s (%s), syncing everything", file_name, error)
+            return None
+        if data.get('version') != SNAPSHOT_VERSION:
+            LOG.info("Snapshot in %s is of another version, syncing everything", file_name)
+            return None
+        projects = {}
+        for cloud, name, content_hash, planner_id in data.get('projects', []):
+            projects[(cloud, name)] = (content_hash, planner_id)
+        return cls(projects, data.get('cursor'))
+
+    def save(self, file_name):
+        """Store the snapshot in the given file, replacing it in one step."""
+        utils.write_json_file(file_name, {
+            'version': SNAPSHOT_VERSION,
+            'cursor': self.cursor,
+            'projects': [
+                [cloud, name, content_hash, planner_id]
+                for (cloud, name), (content_hash, planner_id) in sorted(self.projects.items())
+            ]
+        }, separators=(',', ':'))
+        LOG.info("Stored a snapshot of %d projects in %s", len(self.projects), file_name)
@@ -0,0 +1,141 @@
+"""
+This module contains the keystone token cache shared by the openstack backends.
+
+A keystone session is kept per auth url, project and user, holding the
+token and service catalog it was given, and authenticating again only
+once the token is about to expire. The sdk backend calls the client
+libraries on these sessions, and the openstack cli client is passed the
+cached token with OS_AUTH_TYPE token rather than the password, so that
+keystone checks a password once per cloud, project and user rather than
+once per command. The nova and cinder cli clients don't take a token
+from their environment, so they keep the password, as do all the cli
+clients without the keystoneauth library
+"""
+
+import logging
+import threading
+import metrics
+
+try:
+    from keystoneauth1 import exceptions as keystone_exceptions
+    from keystoneauth1 import session as keystone_session
+    from keystoneauth1.identity import generic as keystone_identity
+except ImportError:
+    keystone_session = None
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TIMEOUT = 120
+DEFAULT_EXPIRY_MARGIN = 600
+DEFAULT_DOMAIN_NAME = 'Default'
+
+
+def is_available():
+    """Return True if the keystoneauth library is installed, and tokens can be cached."""
+    return keystone_session is not None
+
+
+def cache_key(environment):
+    """Return the auth url, project and user of the given openstack environment variables."""
+    return (environment['OS_AUTH_URL'], environment['OS_PROJECT_NAME'], environment['OS_USERNAME'])
+
+
+class TokenCache(object):
+    """
+    Holds a keystone session per auth url, project and user, with its token and service catalog.
+
+    A token is renewed when less than expiry_margin seconds are left
+    before it expires, so that it outlives the cli commands it is given to
+    """
+
+    def __init__(self, timeout=DEFAULT_SESSION_TIMEOUT, expiry_margin=DEFAULT_EXPIRY_MARGIN):
+        """Initialize an empty cache."""
+        self.enabled = True
+        self.timeout = timeout
+        self.expiry_margin = expiry_margin
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.session_locks = {}
+
+    def disable(self):
+        """Stop passing tokens to the cli clients, leaving them to use the password."""
+        self.enabled = False
+
+    def get_session(self, environment):
+        """Return the keystone session of the cloud, project and user of the given environment."""
+        session_key = cache_key(environment)
+        with self.lock:
+            session = self.sessions.get(session_key)
+            if session is None:
+                session = self.sessions[session_key] = keystone_session.Session(
+                    auth=keystone_identity.Password(
+                        auth_url=environment['OS_AUTH_URL'],
+                        username=environment['OS_USERNAME'],
+                        password=environment['OS_PASSWORD'],
+                        project_name=environment['OS_PROJECT_NAME'],
+                        user_domain_name=DEFAULT_DOMAIN_NAME,
+                        project_domain_name=DEFAULT_DOMAIN_NAME
+                    ),
+                    timeout=self.timeout
+                )
+                self.session_locks[session_key] = threading.Lock()
+            return session
+
+    def get_access(self, environment):
+        """
+        Return the keystone access, with the token and service catalog, of the given environment.
+
+        Keystone is only asked for a token if there isn't one yet, or if
+        the one held expires within expiry_margin seconds. Raises a
+        keystoneauth1 ClientException if it can't be had
+        """
+        session = self.get_session(environment)
+        with self.session_locks[cache_key(environment)]:
+            access = session.auth.auth_ref
+            if access is not None and not access.will_expire_soon(self.expiry_margin):
+                return access
+            session.auth.invalidate()
+            start_time = metrics.METRICS.start_timer()
+            try:
+                access = session.auth.get_access(session)
+            except keystone_exceptions.ClientException:
+                metrics.METRICS.record_call('keystone', 'token', start_time, error=True)
+                raise
+            metrics.METRICS.record_call('keystone', 'token', start_time)
+            LOG.debug(
+                "Got a keystone token for %s, expiring at %s",
+                environment['OS_AUTH_URL'],
+                access.expires
+            )
+            return access
+
+    def get_command_environment(self, environment):
+        """
+        Return the openstack cli environment given, with the token in place of the password.
+
+        The environment is returned unchanged if the cache is disabled, if
+        it has no openstack credentials, if keystoneauth isn't installed, or
+        if no token could be had, for the cli client to authenticate with
+        the password
+        """
+        if not self.enabled or not is_available():
+            return environment
+        if 'OS_PASSWORD' not in environment or 'OS_AUTH_URL' not in environment:
+            return environment
+        try:
+            access = self.get_access(environment)
+        except keystone_exceptions.ClientException as error:
+            LOG.warning(
+                "Could not get a keystone token for %s, the cli clients will use the password (%s)",
+                environment['OS_AUTH_URL'], error
+            )
+            return environment
+        token_environment = dict(environment)
+        del token_environment['OS_PASSWORD']
+        token_environment['OS_AUTH_TYPE'] = 'token'
+        token_environment['OS_TOKEN'] = access.auth_token
+        token_environment.setdefault('OS_PROJECT_DOMAIN_NAME', DEFAULT_DOMAIN_NAME)
+        return token_environment
+
+
+TOKEN_CACHE = TokenCache()
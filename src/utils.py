@@ -1,11 +1,70 @@
 """This module contains common utility functions used by other modules."""
 
+import json
 import logging
+import operator
+import os
 import subprocess
 import shlex
+import tempfile
+import threading
+import urlparse
+from multiprocessing.pool import ThreadPool
+import metrics
+import resilience
 
 LOG = logging.getLogger(__name__)
-logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+
+DEFAULT_MAX_PARALLEL_COMMANDS = 8
+DEFAULT_CLI_ATTEMPTS = 3
+CLI_CONNECTION_ERROR_MARKERS = (
+    'Unable to establish connection', 'Failed to establish a new connection',
+    'Connection refused', 'Connection reset', 'Connection aborted', 'Max retries exceeded',
+    'Temporary failure in name resolution', 'timed out', 'Gateway Timeout (HTTP 504)'
+)
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+DEFAULT_PAYLOAD_LOG_LIMIT = 200
+PAYLOAD_LOG_LIMIT = DEFAULT_PAYLOAD_LOG_LIMIT
+
+
+def configure_logging(level=logging.INFO, payload_log_limit=DEFAULT_PAYLOAD_LOG_LIMIT):
+    """
+    Configure logging for the whole process, once, from the entry point.
+
+    The logs of the requests and urllib3 libraries are kept to warnings,
+    and payloads logged through PayloadPreview are cut to payload_log_limit
+    characters, 0 leaving them out altogether
+    """
+    global PAYLOAD_LOG_LIMIT  # pylint: disable=global-statement
+    PAYLOAD_LOG_LIMIT = payload_log_limit
+    logging.basicConfig(format=LOG_FORMAT, level=level)
+    logging.getLogger().setLevel(level)
+    for library_name in ("requests", "urllib3"):
+        logging.getLogger(library_name).setLevel(max(level, logging.WARNING))
+
+
+class PayloadPreview(object):  # pylint: disable=too-few-public-methods
+    """
+    Wraps a payload so that it is only turned into text if it is logged.
+
+    The text is cut to utils.PAYLOAD_LOG_LIMIT characters, with the full
+    length noted at the end
+    """
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        """Initialize the preview of the given payload."""
+        self.payload = payload
+
+    def __str__(self):
+        """Return the payload text, cut to the payload log limit."""
+        if not PAYLOAD_LOG_LIMIT:
+            return '<payload not logged>'
+        text = self.payload if isinstance(self.payload, basestring) else str(self.payload)
+        if len(text) <= PAYLOAD_LOG_LIMIT:
+            return text
+        return text[:PAYLOAD_LOG_LIMIT] + '... (' + str(len(text)) + ' characters)'
 
 
 class CliNonZeroExitCodeException(Exception):
@@ -19,37 +78,381 @@ class CliNonZeroExitCodeException(Exception):
     pass
 
 
-def run_cli_command(command):
+class CliTransientException(CliNonZeroExitCodeException):
+    """
+    Custom exception for expressing cli failures likely to be transient.
+
+    This custom exception is used to convey when a cli command timed
+    out, or failed to connect to its cloud, so that it is worth retrying
+    """
+
+    pass
+
+
+class CliOutputException(Exception):
+    """
+    Custom exception for expressing cli output that can't be parsed.
+
+    This custom exception is used to convey when a cli command
+    has exited with a zero exit code, but its output couldn't be
+    parsed as it was read
+    """
+
+    pass
+
+
+class CliCommandsFailedException(Exception):
+    """
+    Custom exception for expressing failures in a batch of cli commands.
+
+    This custom exception is used to convey that one or more cli
+    commands run by run_cli_commands failed, after all the others
+    have been run. The failed commands are kept in failed_commands
+    """
+
+    def __init__(self, failed_commands):
+        """Initialize the exception with the list of failed CliCommand objects."""
+        super(CliCommandsFailedException, self).__init__(
+            str(len(failed_commands)) + ' cli commands failed:\n' + '\n'.join(
+                cli_command.command + ': ' + str(cli_command.error)
+                for cli_command in failed_commands
+            )
+        )
+        self.failed_commands = failed_commands
+
+
+class CliCommand(object):  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Represents a cli command to be run by run_cli_commands.
+
+    Once run, it holds the result, passed through parse_output if
+    one was given, or the CliNonZeroExitCodeException it raised, or a
+    CliOutputException if parse_output couldn't parse the output.
+    With parse_lines, the output is parsed as it is read, see run_cli_command.
+    With resolve_env, the env is passed through it when the command is
+    run rather than when it is prepared.
+    The key is not used here, it is for callers to tell the
+    results apart
+    """
+
+    def __init__(self, command, **kwargs):
+        """
+        Initialize a cli command.
+
+        The keyword arguments are its env, resolve_env, timeout,
+        input_data, parse_lines, parse_output and key
+        """
+        self.command = command
+        self.env = kwargs.pop('env', None)
+        self.resolve_env = kwargs.pop('resolve_env', None)
+        self.timeout = kwargs.pop('timeout', None)
+        self.input_data = kwargs.pop('input_data', None)
+        self.parse_lines = kwargs.pop('parse_lines', None)
+        self.parse_output = kwargs.pop('parse_output', None)
+        self.key = kwargs.pop('key', None)
+
+        if kwargs:
+            raise TypeError('Unexpected **kwargs: %r' % kwargs)
+
+        self.result = None
+        self.error = None
+
+    def get_env(self):
+        """Return the environment to run the command in, passed through resolve_env if given."""
+        if self.resolve_env is not None and self.env is not None:
+            return self.resolve_env(self.env)
+        return self.env
+
+    def run(self):
+        """Run the command, keeping its result or error."""
+        try:
+            cli_command_output = run_cli_command(
+                self.command,
+                env=self.get_env(),
+                input_data=self.input_data,
+                timeout=self.timeout,
+                parse_lines=self.parse_lines
+            )
+        except (CliNonZeroExitCodeException, CliOutputException,
+                resilience.CircuitOpenException) as error:
+            self.error = error
+            LOG.error("cli command (%s) failed: %s", self.command, error)
+            return self
+        if self.parse_output is None:
+            self.result = cli_command_output
+            return self
+        try:
+            self.result = self.parse_output(cli_command_output)
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            self.error = CliOutputException(
+                'The output of the command could not be parsed: ' + repr(error)
+            )
+            LOG.error("cli command (%s) failed: %s", self.command, self.error)
+        return self
+
+
+def write_json_file(file_name, data, separators=None):
+    """Write the data as JSON to the given file, replacing it in one step."""
+    directory = os.path.dirname(os.path.abspath(file_name))
+    file_descriptor, temporary_file_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as json_file:
+        json.dump(data, json_file, separators=separators)
+    os.rename(temporary_file_name, file_name)
+
+
+def run_cli_commands(cli_commands, max_parallel=DEFAULT_MAX_PARALLEL_COMMANDS,
+                     raise_on_failure=True):
+    """
+    Run the given cli commands, at most max_parallel at a time.
+
+    Args:
+        cli_commands (list): The CliCommand objects to run
+        max_parallel (int): The maximum number of commands to run at once
+        raise_on_failure (bool): Whether to raise once all commands have run,
+            if any of them failed
+
+    Yields:
+        each CliCommand, in the order the commands complete
+
+    Raises:
+        CliCommandsFailedException: if raise_on_failure is set and any command
+            exited with a non zero exit code
+
+    """
+    cli_commands = list(cli_commands)
+    failed_commands = []
+    if cli_commands:
+        pool = ThreadPool(max(min(max_parallel, len(cli_commands)), 1))
+        try:
+            for cli_command in pool.imap_unordered(operator.methodcaller('run'), cli_commands):
+                if cli_command.error is not None:
+                    failed_commands.append(cli_command)
+                yield cli_command
+        finally:
+            pool.close()
+            pool.join()
+    if failed_commands and raise_on_failure:
+        raise CliCommandsFailedException(failed_commands)
+
+
+def kill_timed_out_process(process, timed_out):
+    """Kill the given process, flagging that it timed out."""
+    timed_out.set()
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+def command_name(command):
+    """
+    Return the name of the given cli command, for metrics.
+
+    The name is the command and its sub commands, without arguments,
+    'cinder get-pools --detail' gives 'cinder get-pools'
+    """
+    words = []
+    for word in shlex.split(command):
+        if word.startswith('-') or len(words) == 3:
+            break
+        words.append(word)
+    return ' '.join(words)
+
+
+def command_host(env):
+    """Return the host of the OS_AUTH_URL a cli command talks to, for its circuit breaker."""
+    auth_url = (env if env is not None else os.environ).get('OS_AUTH_URL')
+    if not auth_url:
+        return 'localhost'
+    return urlparse.urlparse(auth_url).netloc or auth_url
+
+
+def is_connection_error(standard_error):
+    """Return True if the standard error of a failed cli command shows it couldn't reach a cloud."""
+    return any(marker in standard_error for marker in CLI_CONNECTION_ERROR_MARKERS)
+
+
+class OutputLines(object):  # pylint: disable=too-few-public-methods
+    """Iterates over the lines of a process's output as they are written, counting characters."""
+
+    __slots__ = ('output_file', 'size')
+
+    def __init__(self, output_file):
+        """Initialize the lines of the given output file."""
+        self.output_file = output_file
+        self.size = 0
+
+    def __iter__(self):
+        """Yield the lines of the output, until it is closed."""
+        for line in iter(self.output_file.readline, ''):
+            self.size += len(line)
+            yield line
+
+
+def write_input(process, input_data):
+    """Write the input data to the standard input of the process, then close it."""
+    try:
+        process.stdin.write(input_data)
+        process.stdin.close()
+    except IOError:
+        pass
+
+
+def stream_output(process, input_data, parse_lines):
+    """
+    Parse the standard output of the process line by line, as it is written.
+
+    The standard error is read, and the input data written, by other
+    threads meanwhile. Returns the standard error, the number of characters
+    of standard output, the result of parse_lines, and the ValueError it
+    raised if the output couldn't be parsed, once the process has ended
+    """
+    standard_error = []
+    threads = [threading.Thread(target=lambda: standard_error.append(process.stderr.read()))]
+    if input_data is not None:
+        threads.append(threading.Thread(target=write_input, args=(process, input_data)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    output_lines = OutputLines(process.stdout)
+    parsed_output = parse_error = None
+    try:
+        parsed_output = parse_lines(output_lines)
+    except ValueError as error:
+        parse_error = error
+    finally:
+        for _ in output_lines:
+            pass
+        process.stdout.close()
+        process.wait()
+        for thread in threads:
+            thread.join()
+    return ''.join(standard_error), output_lines.size, parsed_output, parse_error
+
+
+def run_cli_command(command, **kwargs):
     """
     Run the given cli command and return the result.
 
+    The commands run are reads, so a command that timed out or couldn't
+    reach its cloud is retried after a jittered, growing delay, and a
+    circuit breaker per OS_AUTH_URL host stops commands towards a cloud
+    that keeps failing that way. Any other failure is raised at once.
+
     Args:
         command (str): The first parameter
+        env (dict): The environment to run the command in, defaults
+            to the environment of this process
+        input_data (str): Text to write to the standard input of the command
+        timeout (float): The number of seconds after which the command is killed
+        attempts (int): The number of times to try the command
+        parse_lines (function): Optional, given an iterable of the lines of
+            standard output, returns them parsed, raising a ValueError if it
+            can't. The output is then parsed as it is read, and not kept
 
     Returns:
         dictionary containing two keys,
-        the standard_error, and standard_output strings
+        the standard_error, and standard_output strings,
+        with parse_lines, the standard_output is None and
+        the parsed_output key holds what it returned
 
     Raises:
-        Exception: if the return code is not 0
+        CliNonZeroExitCodeException: if the return code is not 0, or the
+            command timed out or couldn't connect on every attempt, in
+            which case it is a CliTransientException
+        resilience.CircuitOpenException: if the circuit towards its cloud is open
+        CliOutputException: if parse_lines couldn't parse the output
 
     """
-    LOG.info("Running cli command (" + command + ")")
+    env = kwargs.pop('env', None)
+    input_data = kwargs.pop('input_data', None)
+    timeout = kwargs.pop('timeout', None)
+    attempts = kwargs.pop('attempts', DEFAULT_CLI_ATTEMPTS)
+    parse_lines = kwargs.pop('parse_lines', None)
+
+    if kwargs:
+        raise TypeError('Unexpected **kwargs: %r' % kwargs)
+
+    return resilience.call(
+        lambda: run_cli_command_once(command, env, input_data, timeout, parse_lines),
+        host=command_host(env),
+        idempotent=True,
+        retry_policy=resilience.RetryPolicy(attempts=attempts),
+        is_transient=lambda error: isinstance(error, CliTransientException),
+        description='run cli command (' + command + ')'
+    )
+
+
+def run_cli_command_once(command, env=None, input_data=None, timeout=None, parse_lines=None):
+    """Run the given cli command once, as run_cli_command does, and return the result."""
+    LOG.debug("Running cli command (%s)", command)
+    start_time = metrics.METRICS.start_timer()
     process = subprocess.Popen(
         shlex.split(command),
+        stdin=subprocess.PIPE if input_data is not None else None,
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
+        stderr=subprocess.PIPE,
+        env=env
+    )
+    timed_out = threading.Event()
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill_timed_out_process, (process, timed_out))
+        timer.start()
+    parsed_output = parse_error = None
+    try:
+        if parse_lines is None:
+            process_standard_output, process_standard_error = process.communicate(input_data)
+            output_size = len(process_standard_output)
+        else:
+            process_standard_output = None
+            process_standard_error, output_size, parsed_output, parse_error = stream_output(
+                process, input_data, parse_lines
+            )
+    finally:
+        if timer is not None:
+            timer.cancel()
+    metrics.METRICS.record_call(
+        'cli', command_name(command), start_time,
+        bytes_sent=len(input_data or ''),
+        bytes_received=output_size,
+        error=timed_out.is_set() or process.returncode != 0 or parse_error is not None
     )
-    process_standard_output, process_standard_error = process.communicate()
+    if timed_out.is_set():
+        raise CliTransientException(
+            'The command timed out after ' + str(timeout) + ' seconds' +
+            '. Heres the output: ' + (process_standard_output or '<parsed as it was read>') +
+            '\nError: ' + process_standard_error
+        )
     if process.returncode != 0:
-        raise CliNonZeroExitCodeException(
+        exception_class = CliNonZeroExitCodeException
+        if is_connection_error(process_standard_error):
+            exception_class = CliTransientException
+        raise exception_class(
             'The command failed with exit code ' + str(process.returncode) +
-            '. Heres the output: ' + process_standard_output +
+            '. Heres the output: ' + (process_standard_output or '<parsed as it was read>') +
             '\nError: ' + process_standard_error
         )
-    LOG.debug(process_standard_output)
-    LOG.debug(process_standard_error)
-    LOG.info("cli command completed")
+    if parse_error is not None:
+        raise CliOutputException(
+            'The output of the command could not be parsed: ' + str(parse_error)
+        )
+    if parse_lines is not None:
+        LOG.debug(
+            "cli command completed, parsed output: %s, error: %s",
+            PayloadPreview(parsed_output),
+            PayloadPreview(process_standard_error)
+        )
+        return {
+            'standard_output': None,
+            'standard_error': process_standard_error,
+            'parsed_output': parsed_output
+        }
+    LOG.debug(
+        "cli command completed, output: %s, error: %s",
+        PayloadPreview(process_standard_output),
+        PayloadPreview(process_standard_error)
+    )
     return {
         'standard_output': process_standard_output,
         'standard_error': process_standard_error
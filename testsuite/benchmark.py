@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+Benchmark the importer end to end against local stand-in servers.
+
+For each estate size, a fresh Capacity Planner and Meteo stand-in is
+started, and create, update and delete are run against it in a child
+process. The wall time, requests per endpoint, bytes transferred and
+peak RSS of each run are reported, and compared with a stored baseline
+so that any increase in the number of requests is caught
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (os.path.join(TESTSUITE_DIR, '..', 'src'), TESTSUITE_DIR):
+    if os.path.isdir(path) and path not in sys.path:
+        sys.path.insert(0, path)
+
+import api_data  # noqa: E402  pylint: disable=wrong-import-position
+import capacity_planner  # noqa: E402  pylint: disable=wrong-import-position
+import meteo  # noqa: E402  pylint: disable=wrong-import-position
+import mock_servers  # noqa: E402  pylint: disable=wrong-import-position
+import utils  # noqa: E402  pylint: disable=wrong-import-position
+
+DEFAULT_SIZES = '10,1000'
+DEFAULT_BASELINE = os.path.join(TESTSUITE_DIR, 'benchmark_baseline.json')
+DEFAULT_CHANGED_FRACTION = 0.02
+REQUEST_COUNT_TOLERANCE = 0.05
+
+
+def run_phase(state, name, function):
+    """Run one phase of the benchmark, returning its measurements."""
+    before = state.statistics.snapshot()
+    start = time.time()
+    function()
+    wall_time = time.time() - start
+    after = state.statistics.snapshot()
+    requests = {}
+    for endpoint, count in after['requests'].items():
+        if count - before['requests'].get(endpoint, 0):
+            requests[endpoint] = count - before['requests'].get(endpoint, 0)
+    logging.getLogger(__name__).warning("%s took %.2fs", name, wall_time)
+    return {
+        'wall_time': round(wall_time, 3),
+        'requests': requests,
+        'bytes_transferred': (after['bytes_received'] - before['bytes_received'] +
+                              after['bytes_sent'] - before['bytes_sent'])
+    }
+
+
+def run_size(args):
+    """Run create, update and delete against an estate of args.size projects, return the results."""
+    state = mock_servers.MockState(
+        latency=args.latency, bulk=args.bulk, failure_rate=args.failure_rate
+    )
+    clouds, projects = mock_servers.generate_estate(args.size)
+    state.set_meteo_estate(clouds, projects)
+    server = mock_servers.MockServer(state)
+    server.start()
+    meteo.METEO_PROJECTS_URL = server.base_url + mock_servers.METEO_PROJECTS_PATH.lstrip('/')
+    meteo.METEO_CLOUDS_URL = server.base_url + mock_servers.METEO_CLOUDS_PATH.lstrip('/')
+
+    results = {}
+    try:
+        cap_planner = [None]
+
+        def connect():
+            """Initialise the Capacity Planner, as main() does."""
+            cap_planner[0] = capacity_planner.CapacityPlanner({
+                'base_url': server.base_url,
+                'default_team_name': 'default',
+                'default_deployment_type_name': '5K',
+                'workers': args.workers
+            })
+
+        results['init'] = run_phase(state, 'init', connect)
+        results['create'] = run_phase(state, 'create', lambda: api_data.upload_cap_planner_data(
+            cap_planner[0],
+            meteo.iter_cloud_data(cap_planner[0]),
+            meteo.iter_project_data(cap_planner[0])
+        ))
+        state.set_meteo_estate(clouds, mock_servers.change_estate(projects, args.changed_fraction))
+        results['update'] = run_phase(state, 'update', lambda: api_data.update_cap_planner_data(
+            cap_planner[0],
+            meteo.iter_project_data(cap_planner[0])
+        ))
+        results['delete'] = run_phase(state, 'delete', lambda: api_data.delete_cap_planner_data(
+            cap_planner[0]
+        ))
+    finally:
+        server.stop()
+    results['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def run_size_in_child(args, size):
+    """Run one estate size in a child process, so that its peak RSS is its own."""
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        '--child-size', str(size),
+        '--latency', str(args.latency),
+        '--workers', str(args.workers),
+        '--changed-fraction', str(args.changed_fraction),
+        '--failure-rate', str(args.failure_rate)
+    ]
+    if args.bulk:
+        command.append('--bulk')
+    return json.loads(subprocess.check_output(command))
+
+
+def compare_with_baseline(results, baseline):
+    """
+    Return the list of request count regressions compared with the baseline.
+
+    Only sizes and phases found in both are compared.
+    """
+    regressions = []
+    for size, size_results in sorted(results.items()):
+        for phase, phase_results in sorted(size_results.items()):
+            baseline_phase = baseline.get(size, {}).get(phase)
+            if not isinstance(phase_results, dict) or not baseline_phase:
+                continue
+            for endpoint, count in sorted(phase_results['requests'].items()):
+                allowed = (
+                    baseline_phase['requests'].get(endpoint, 0) * (1 + REQUEST_COUNT_TOLERANCE)
+                )
+                if count > allowed:
+                    regressions.append('%s projects, %s, %s: %d requests, baseline %d' % (
+                        size, phase, endpoint, count, baseline_phase['requests'].get(endpoint, 0)
+                    ))
+    return regressions
+
+
+def print_report(results):
+    """Print a summary table of the results."""
+    print('%-8s %-8s %10s %10s %14s %12s' % (
+        'size', 'phase', 'wall (s)', 'requests', 'bytes', 'peak rss kb'
+    ))
+    for size, size_results in sorted(results.items(), key=lambda item: int(item[0])):
+        for phase in ('init', 'create', 'update', 'delete'):
+            phase_results = size_results[phase]
+            print('%-8s %-8s %10.2f %10d %14d %12d' % (
+                size, phase, phase_results['wall_time'],
+                sum(phase_results['requests'].values()),
+                phase_results['bytes_transferred'],
+                size_results['peak_rss_kb']
+            ))
+
+
+def main():
+    """Run the benchmark and compare it with, or store it as, the baseline."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes',
+        help="""This is the comma separated list of estate sizes, in projects, to run
+        """,
+        default=DEFAULT_SIZES
+    )
+    parser.add_argument(
+        '--latency',
+        help="""This is the number of seconds of latency to add to each request
+        """,
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--workers',
+        help="""This is the number of concurrent writes the importer makes
+        """,
+        type=int,
+        default=8
+    )
+    parser.add_argument(
+        '--changed-fraction',
+        help="""This is the fraction of Meteo projects changed before the update
+        """,
+        type=float,
+        default=DEFAULT_CHANGED_FRACTION
+    )
+    parser.add_argument(
+        '--failure-rate',
+        help="""This is the fraction of Capacity Planner requests to fail with a 503
+        """,
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--bulk',
+        help="""Serve bulk routes from the Capacity Planner stand-in
+        """,
+        action='store_true'
+    )
+    parser.add_argument(
+        '--baseline',
+        help="""This is the baseline file to compare with, or to store the results in
+        """,
+        default=DEFAULT_BASELINE
+    )
+    parser.add_argument(
+        '--update-baseline',
+        help="""Store the results as the new baseline instead of comparing with it
+        """,
+        action='store_true'
+    )
+    parser.add_argument('--child-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    utils.configure_logging(logging.WARNING)
+
+    if args.child_size is not None:
+        args.size = args.child_size
+        json.dump(run_size(args), sys.stdout)
+        return 0
+
+    results = {}
+    for size in args.sizes.split(','):
+        results[size] = run_size_in_child(args, int(size))
+    print_report(results)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True, separators=(',', ': '))
+        print('Stored the results as the baseline in ' + args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline found at ' + args.baseline + ', run with --update-baseline to store one')
+        return 0
+    with open(args.baseline) as baseline_file:
+        regressions = compare_with_baseline(results, json.load(baseline_file))
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+This module contains local stand-ins for the Capacity Planner and Meteo REST APIs.
+
+They keep their data in memory, can add latency to every request,
+page collections, answer conditional GETs with 304 Not
+Modified, fail a fraction of requests, and count the requests and bytes
+seen per endpoint
+"""
+
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+import urlparse
+
+PLANNER_COLLECTIONS = ('deploymenttypes', 'teams', 'pods', 'projects')
+METEO_PROJECTS_PATH = '/typhoon/get-project-list-api/'
+METEO_CLOUDS_PATH = '/typhoon/get-clouds-info-api/'
+ITEM_ID_PATTERN = re.compile(r'^(/api/[a-z]+/)(?!bulk/)[^/]+/?$')
+
+
+def generate_estate(project_count):
+    """
+    Generate the Meteo clouds and projects of an estate with the given number of projects.
+
+    Returns a (clouds, projects) tuple of lists of Meteo style dictionaries.
+    """
+    cloud_count = min(max(project_count // 1000, 1), 50)
+    team_count = max(project_count // 20, 1)
+    clouds = [
+        {
+            'cloud_name': str(cloud_number),
+            'auth_url': 'http://cloud' + str(cloud_number) + '.example.com:5000/v2.0',
+            'total_cpu': '4096',
+            'total_ram': '16777216',
+            'total_cinder_storage': '1048576',
+            'cinder_iops': '100000',
+            'total_enfs_storage': '524288',
+            'total_enfs_iops': '50000',
+            'cpu_ratio': '4'
+        }
+        for cloud_number in range(cloud_count)
+    ]
+    projects = [
+        {
+            'project_name': 'team' + str(number % team_count) + '_project' + str(number),
+            'cloud': number % cloud_count,
+            'team': '',
+            'allocated_cpu': str(8 + number % 32),
+            'allocated_ram': str(16384 + number % 8 * 1024),
+            'allocated_storage': str(100 + number % 500)
+        }
+        for number in range(project_count)
+    ]
+    return clouds, projects
+
+
+def change_estate(projects, changed_fraction):
+    """
+    Return a copy of the Meteo projects with the given fraction changed.
+
+    Half of the changed projects get a new cpu allocation, a quarter
+    are removed and a quarter are replaced by new projects
+    """
+    projects = [dict(project) for project in projects]
+    changed_count = max(int(len(projects) * changed_fraction), 4)
+    step = max(len(projects) // changed_count, 1)
+    changed = projects[::step][:changed_count]
+    for project in changed[:changed_count // 2]:
+        project['allocated_cpu'] = str(int(project['allocated_cpu']) + 1)
+    removed = set(id(project) for project in changed[changed_count // 2:changed_count * 3 // 4])
+    for project in changed[changed_count * 3 // 4:]:
+        project['project_name'] = project['project_name'] + '_new'
+    return [project for project in projects if id(project) not in removed]
+
+
+class Statistics(object):
+    """Counts the requests and bytes seen per endpoint."""
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def record(self, endpoint, bytes_received, bytes_sent):
+        """Record one request towards the given endpoint."""
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_received += bytes_received
+            self.bytes_sent += bytes_sent
+
+    def snapshot(self):
+        """Return a copy of the statistics as a dictionary."""
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent
+            }
+
+
+class MockState(object):
+    """Holds the data served by the stand-in servers."""
+
+    def __init__(self, latency=0.0, bulk=False, failure_rate=0.0):
+        """
+        Initialize an empty Capacity Planner, with the 5K deployment type, and no Meteo data.
+
+        The failure_rate is the fraction of Capacity Planner requests
+        answered with a 503 without being handled
+        """
+        self.latency = latency
+        self.bulk = bulk
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.collections = dict((name, {}) for name in PLANNER_COLLECTIONS)
+        self.add_item('deploymenttypes', {'name': '5K'})
+        self.meteo = {METEO_PROJECTS_PATH: {'projects': []}, METEO_CLOUDS_PATH: {'clouds': []}}
+        self.statistics = Statistics()
+
+    def add_item(self, collection_name, item):
+        """Add an item to a Capacity Planner collection, giving it a new _id."""
+        with self.lock:
+            item = dict(item, _id='%024x' % next(self.ids))
+            self.collections[collection_name][item['_id']] = item
+        return item
+
+    def set_meteo_estate(self, clouds, projects):
+        """Set the clouds and projects served by the Meteo stand-in."""
+        self.meteo[METEO_CLOUDS_PATH] = {'clouds': clouds}
+        self.meteo[METEO_PROJECTS_PATH] = {'projects': projects}
+
+
+class MockRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the Capacity Planner and Meteo stand-in endpoints."""
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the request log quiet."""
+        pass
+
+    def handle_request(self):
+        """Handle a request of any method."""
+        state = self.server.state
+        if state.latency:
+            time.sleep(state.latency)
+        path = urlparse.urlparse(self.path).path
+        query = dict(urlparse.parse_qsl(urlparse.urlparse(self.path).query))
+        request_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if path.startswith('/api/') and random.random() < state.failure_rate:
+            status, headers, response_body = 503, [], '{}'
+        else:
+            status, headers, response_body = self.route(state, path, query, request_body)
+        if self.command == 'GET' and status == 200:
+            etag = '"' + hashlib.sha1(response_body).hexdigest() + '"'
+            headers = headers + [('ETag', etag)]
+            if self.headers.get('If-None-Match') == etag:
+                status, response_body = 304, ''
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+        state.statistics.record(
+            self.command + ' ' + ITEM_ID_PATTERN.sub(r'\1{id}', path),
+            len(request_body),
+            len(response_body)
+        )
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = handle_request
+
+    def route(self, state, path, query, request_body):
+        """Return the status, extra headers and body of the response to a request."""
+        if path in state.meteo:
+            return 200, [], json.dumps(state.meteo[path])
+        parts = [part for part in path.split('/') if part]
+        if len(parts) < 2 or parts[0] != 'api' or parts[1] not in state.collections:
+            return 404, [], '{}'
+        collection = state.collections[parts[1]]
+        item_id = parts[2] if len(parts) > 2 else None
+        if item_id == 'bulk':
+            return self.route_bulk(state, parts[1], request_body)
+        if self.command == 'GET' and item_id is None:
+            with state.lock:
+                return 200, [], json.dumps(page_items(collection.values(), query))
+        if self.command == 'GET' and item_id in collection:
+            with state.lock:
+                return 200, [], json.dumps(collection[item_id])
+        if self.command == 'POST' and item_id is None:
+            return 200, [], json.dumps(state.add_item(parts[1], json.loads(request_body)))
+        if item_id not in collection:
+            return 404, [], '{}'
+        if self.command == 'PUT':
+            with state.lock:
+                collection[item_id] = dict(json.loads(request_body), _id=item_id)
+                return 200, [], json.dumps(collection[item_id])
+        if self.command == 'DELETE':
+            with state.lock:
+                del collection[item_id]
+            return 200, [], '{}'
+        return 405, [], '{}'
+
+    def route_bulk(self, state, collection_name, request_body):
+        """Return the response to a request towards a bulk route."""
+        if not state.bulk:
+            return 404, [], '{}'
+        if self.command == 'OPTIONS':
+            return 200, [('Allow', 'OPTIONS, POST, PUT, DELETE')], '{}'
+        collection = state.collections[collection_name]
+        items = json.loads(request_body)
+        if self.command == 'POST':
+            return 200, [], json.dumps([state.add_item(collection_name, item) for item in items])
+        with state.lock:
+            if self.command == 'PUT':
+                for item in items:
+                    collection[item['_id']] = item
+                return 200, [], json.dumps(items)
+            if self.command == 'DELETE':
+                for item_id in items:
+                    collection.pop(item_id, None)
+                return 200, [], '{}'
+        return 405, [], '{}'
+
+
+def page_items(items, query):
+    """
+    Return the items on the page given by the page / limit parameters of a Capacity Planner query.
+
+    Pages start at 1
+    """
+    items = sorted(items, key=lambda item: item['_id'])
+    if 'limit' in query:
+        limit = int(query['limit'])
+        start = (int(query.get('page', 1)) - 1) * limit
+        items = items[start:start + limit]
+    return items
+
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A threaded HTTP server serving both stand-ins, on a free local port."""
+
+    def __init__(self, state):
+        """Initialize the server with the given state."""
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), MockRequestHandler)
+        self.state = state
+        self.thread = None
+        self.requests_lock = threading.Lock()
+        self.request_threads = {}
+
+    @property
+    def base_url(self):
+        """Return the base url of the server."""
+        return 'http://127.0.0.1:' + str(self.server_address[1]) + '/'
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def process_request(self, request, client_address):
+        """Handle the connection in a thread of its own, kept until the connection is closed."""
+        thread = threading.Thread(
+            target=self.process_request_thread, args=(request, client_address)
+        )
+        thread.daemon = True
+        with self.requests_lock:
+            self.request_threads[request] = thread
+        thread.start()
+
+    def shutdown_request(self, request):
+        """Close the connection, forgetting its thread."""
+        with self.requests_lock:
+            self.request_threads.pop(request, None)
+        SocketServer.TCPServer.shutdown_request(self, request)
+
+    def stop(self):
+        """Stop serving, closing the connections still open and waiting for their threads."""
+        self.shutdown()
+        self.server_close()
+        with self.requests_lock:
+            request_threads = self.request_threads.items()
+        for request, thread in request_threads:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join(1)
+
+    def handle_error(self, request, client_address):
+        """Ignore clients dropping their connections."""
+        pass
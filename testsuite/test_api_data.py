@@ -0,0 +1,265 @@
+"""Unit tests of the api_data module."""
+
+import json
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import api_data  # noqa: E402  pylint: disable=wrong-import-position
+import capacity_planner  # noqa: E402  pylint: disable=wrong-import-position
+import executor  # noqa: E402  pylint: disable=wrong-import-position
+import openstack_backends  # noqa: E402  pylint: disable=wrong-import-position
+import records  # noqa: E402  pylint: disable=wrong-import-position
+import snapshot  # noqa: E402  pylint: disable=wrong-import-position
+
+METEO_PROJECTS = [
+    records.MeteoProject('alpha_1', '1', 'alpha', (4, 8192, 100)),
+    records.MeteoProject('beta_1', '1', 'beta', (2, 4096, 50)),
+    records.MeteoProject('gamma_1', '1', 'alpha', (1, 2048, 10))
+]
+
+PLANNER_PROJECTS = [
+    {'_id': 'p1', 'name': 'alpha_1', 'pod_id': 'pod1', 'team_id': 't1',
+     'cpu': 4, 'memory_mb': 8192, 'cinder_gb': 100},
+    {'_id': 'p2', 'name': 'beta_1', 'pod_id': 'pod1', 'team_id': 't2',
+     'cpu': 2, 'memory_mb': 4096, 'cinder_gb': 50},
+    {'_id': 'p3', 'name': 'gamma_1', 'pod_id': 'pod1', 'team_id': 't1',
+     'cpu': 1, 'memory_mb': 2048, 'cinder_gb': 10}
+]
+
+METEO_CLOUDS = [
+    records.MeteoCloud('1', 'http://cloud1:5000/v3', 64, 262144, 2000, 1000, 0, 0, 4),
+    records.MeteoCloud('2', 'http://cloud2:5000/v3', 32, 131072, 1000, 500, 0, 0, 4)
+]
+
+CLOUD_STATS = {
+    'http://cloud1:5000/v3': {
+        'hypervisor_stats': {
+            'vcpus': 64, 'vcpus_used': 40, 'memory_mb': 262144, 'memory_mb_used': 131072
+        },
+        'cinder_pools': [
+            {'name': 'host1@lvm#pool1', 'total_capacity_gb': '500', 'free_capacity_gb': '120.5'},
+            {'name': 'host2@lvm#pool2', 'total_capacity_gb': '300', 'free_capacity_gb': '100'}
+        ]
+    }
+}
+
+
+class FakeCapacityPlanner(object):  # pylint: disable=too-few-public-methods
+    """Stands in for capacity_planner.CapacityPlanner, with its collection indexes only."""
+
+    def __init__(self):
+        """Initialize the indexes with pod1, the alpha and beta teams and the planner projects."""
+        self.cap_pods = capacity_planner.CollectionIndex([{'_id': 'pod1', 'name': 'cloud1'}])
+        self.cap_teams = capacity_planner.CollectionIndex([
+            {'_id': 't1', 'name': 'alpha'},
+            {'_id': 't2', 'name': 'beta'}
+        ])
+        self.cap_projects = capacity_planner.CollectionIndex(PLANNER_PROJECTS)
+
+
+def get_previous_snapshot():
+    """Return the snapshot of a sync that left Meteo and the planner projects in line."""
+    return snapshot.Snapshot(dict(
+        (snapshot.project_key(project), (snapshot.project_hash(project), planner_project['_id']))
+        for project, planner_project in zip(METEO_PROJECTS, PLANNER_PROJECTS)
+    ))
+
+
+def get_changes(*projects):
+    """Return the (key, project) changes of the given Meteo projects."""
+    return [(snapshot.project_key(project), project) for project in projects]
+
+
+class GetIncrementalChangesetTest(unittest.TestCase):
+    """Tests of the deletion rules of api_data.get_incremental_changeset."""
+
+    def setUp(self):
+        """Set up a capacity planner and snapshot in line with Meteo."""
+        self.cap_planner = FakeCapacityPlanner()
+        self.previous = get_previous_snapshot()
+
+    def get_changeset(self, changes, complete):
+        """Return the change set and project hashes of the given changes."""
+        return api_data.get_incremental_changeset(
+            self.cap_planner, self.previous, changes, complete
+        )
+
+    def test_complete_listing_deletes_missing_projects(self):
+        """Projects of the snapshot missing from a complete listing are deleted, with their team."""
+        changeset, project_hashes = self.get_changeset(
+            get_changes(METEO_PROJECTS[0], METEO_PROJECTS[2]), True
+        )
+
+        self.assertEqual([project.planner_id for project in changeset.projects_to_delete], ['p2'])
+        self.assertEqual(changeset.teams_to_delete, ['beta'])
+        self.assertEqual(changeset.projects_to_create + changeset.projects_to_update, [])
+        self.assertNotIn(('1', 'beta_1'), project_hashes)
+
+    def test_partial_changes_delete_nothing_unlisted(self):
+        """Projects missing from a list of changes are left as they are."""
+        changeset, project_hashes = self.get_changeset(get_changes(METEO_PROJECTS[0]), False)
+
+        self.assertTrue(changeset.is_empty())
+        self.assertEqual(sorted(project_hashes), sorted(self.previous.projects))
+
+    def test_deleted_change_deletes_the_project(self):
+        """A project given as deleted is deleted, found by the _id held in the snapshot."""
+        self.cap_planner.cap_projects.get_by_id('p2')['name'] = 'beta_1_renamed'
+
+        changeset, project_hashes = self.get_changeset([(('1', 'beta_1'), None)], False)
+
+        self.assertEqual([project.planner_id for project in changeset.projects_to_delete], ['p2'])
+        self.assertNotIn(('1', 'beta_1'), project_hashes)
+
+    def test_team_still_used_is_not_deleted(self):
+        """The team of a deleted project is kept while another project uses it."""
+        changeset, _ = self.get_changeset([(('1', 'gamma_1'), None)], False)
+
+        self.assertEqual([project.planner_id for project in changeset.projects_to_delete], ['p3'])
+        self.assertEqual(changeset.teams_to_delete, [])
+
+    def test_skipped_project_is_kept(self):
+        """A project skipped as invalid in a complete listing is kept, with its previous hash."""
+        changeset, project_hashes = api_data.get_incremental_changeset(
+            self.cap_planner, self.previous,
+            get_changes(METEO_PROJECTS[0], METEO_PROJECTS[2]), True, set([('1', 'beta_1')])
+        )
+
+        self.assertTrue(changeset.is_empty())
+        self.assertEqual(
+            project_hashes[('1', 'beta_1')], self.previous.projects[('1', 'beta_1')][0]
+        )
+
+    def test_skipped_project_without_name_fails(self):
+        """A complete listing with a skipped project that has no name updates nothing."""
+        with self.assertRaises(records.InvalidRecordException):
+            api_data.get_incremental_changeset(
+                self.cap_planner, self.previous,
+                get_changes(METEO_PROJECTS[0]), True, set([('1', None)])
+            )
+
+
+class WritingCapacityPlanner(FakeCapacityPlanner):
+    """A fake capacity planner that keeps the writes asked of it, which all succeed."""
+
+    def __init__(self):
+        """Initialize the indexes, with the 5K deployment type, and no writes."""
+        super(WritingCapacityPlanner, self).__init__()
+        self.cap_deployment_types = capacity_planner.CollectionIndex([{'_id': 'd1', 'name': '5K'}])
+        self.write_executor = executor.WriteExecutor(workers=1, progress_interval=0)
+        self.writes = []
+
+    def get_write_tasks(self, method, collection_name, writes):
+        """Return a write task per write, each of which keeps the write when run."""
+        return [
+            executor.WriteTask(write[0], self.writes.append, (method, collection_name, write))
+            for write in writes
+        ]
+
+
+class CreateProjectsTest(unittest.TestCase):
+    """Tests of api_data.create_projects."""
+
+    def test_projects_without_pod_or_team_are_failed(self):
+        """Projects whose pod or team is missing fail unwritten, the others are written."""
+        cap_planner = WritingCapacityPlanner()
+        projects = [
+            METEO_PROJECTS[0],
+            records.MeteoProject('alpha_2', '2', 'alpha', (1, 1024, 10)),
+            records.MeteoProject('delta_1', '1', 'delta', (1, 1024, 10))
+        ]
+
+        failed_tasks = api_data.create_projects(cap_planner, projects)
+
+        self.assertEqual(
+            [task.description for task in failed_tasks],
+            ['create project alpha_2', 'create project delta_1']
+        )
+        self.assertEqual(
+            [(method, collection_name, write[0])
+             for method, collection_name, write in cap_planner.writes],
+            [('POST', 'projects', 'create project alpha_1')]
+        )
+        with self.assertRaises(executor.WriteErrorsException):
+            executor.raise_for_failed_tasks(failed_tasks)
+
+
+class GetEnrichedPodsTest(unittest.TestCase):
+    """Tests of api_data.get_enriched_pods, against the fake openstack backend."""
+
+    def test_stats_joined_onto_pods(self):
+        """Each Meteo cloud is joined with its pod's _id and its live stats, if collected."""
+        pods = api_data.get_enriched_pods(
+            FakeCapacityPlanner(), METEO_CLOUDS, backend=openstack_backends.FakeBackend(CLOUD_STATS)
+        )
+
+        self.assertEqual([pod.pod_name for pod in pods], ['cloud1', 'cloud2'])
+        self.assertEqual(pods[0].planner_id, 'pod1')
+        self.assertEqual(pods[0].usage(), {
+            'vcpus_used': 40, 'memory_mb_used': 131072, 'cinder_free_gb': 220.5
+        })
+        self.assertEqual(pods[0].cpu_contention_ratio, 4)
+
+    def test_missing_cloud(self):
+        """A cloud without a pod, whose stats couldn't be collected, is kept without them."""
+        pods = api_data.get_enriched_pods(
+            FakeCapacityPlanner(), METEO_CLOUDS, backend=openstack_backends.FakeBackend(CLOUD_STATS)
+        )
+
+        self.assertIsNone(pods[1].planner_id)
+        self.assertIsNone(pods[1].stats)
+        self.assertEqual(pods[1].usage(), {})
+
+
+class UpdatePodUsageTest(unittest.TestCase):
+    """Tests of api_data.update_pod_usage."""
+
+    def setUp(self):
+        """Set up a capacity planner with pod1 for cloud1, and cloud1's live stats."""
+        self.cap_planner = WritingCapacityPlanner()
+        self.stats = records.LiveCloudStats('1', 64, 40, 262144, 131072, 800, 220.5)
+
+    def test_put_payload(self):
+        """The pod is PUT with its Meteo capacity and its live usage."""
+        pod = records.EnrichedPod(METEO_CLOUDS[0], 'pod1', self.stats)
+
+        self.assertEqual(api_data.update_pod_usage(self.cap_planner, [pod]), [])
+
+        (method, collection_name, (description, item_id, json_data)), = self.cap_planner.writes
+        self.assertEqual(
+            (method, collection_name, description, item_id),
+            ('PUT', 'pods', 'update pod usage cloud1', 'pod1')
+        )
+        item = json.loads(json_data)
+        self.assertEqual(
+            (item['name'], item['authUrl'], item['cpu'], item['cpu_contention_ratio']),
+            ('cloud1', 'http://cloud1:5000/v3', 64, 4)
+        )
+        self.assertEqual(
+            (item['vcpus_used'], item['memory_mb_used'], item['cinder_free_gb']),
+            (40, 131072, 220.5)
+        )
+
+    def test_unchanged_usage_is_not_written(self):
+        """Pods whose usage is unchanged, without a pod or without stats aren't written."""
+        self.cap_planner.cap_pods.get_by_id('pod1').update(
+            vcpus_used=40, memory_mb_used=131072, cinder_free_gb=220.5
+        )
+        pods = [
+            records.EnrichedPod(METEO_CLOUDS[0], 'pod1', self.stats),
+            records.EnrichedPod(METEO_CLOUDS[1], None, self.stats),
+            records.EnrichedPod(METEO_CLOUDS[1], 'pod2')
+        ]
+
+        self.assertEqual(api_data.update_pod_usage(self.cap_planner, pods), [])
+        self.assertEqual(self.cap_planner.writes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Unit tests of the capacity_analytics module."""
+
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import capacity_analytics  # noqa: E402  pylint: disable=wrong-import-position
+import records  # noqa: E402  pylint: disable=wrong-import-position
+
+CLOUDS = [
+    records.MeteoCloud('1', 'http://cloud1:5000/v3', 10, 1000, 100, 1000, 0, 0, 2),
+    records.MeteoCloud('2', 'http://cloud2:5000/v3', 0, 0, 0, 0, 0, 0, 1),
+    records.MeteoCloud('3', 'http://cloud3:5000/v3', 0, 0, 0, 0, 0, 0, 1),
+    records.MeteoCloud('4', 'http://cloud4:5000/v3', 100, 10000, 1000, 5000, 0, 0, 1)
+]
+
+PROJECTS = [
+    records.MeteoProject('alpha_1', '1', 'alpha', (15, 500, 50)),
+    records.MeteoProject('beta_1', '1', 'beta', (10, 200, 10)),
+    records.MeteoProject('alpha_2', '2', 'alpha', (1, 1024, 10)),
+    records.MeteoProject('alpha_4', '4', 'alpha', (50, 2500, 500)),
+    records.MeteoProject('alpha_9', '9', 'alpha', (1, 1024, 10)),
+    records.MeteoProject('beta_9', '9', 'beta', (1, 1024, 10))
+]
+
+
+@unittest.skipUnless(capacity_analytics.is_available(), 'NumPy is not installed')
+class AnalyseTest(unittest.TestCase):
+    """Tests of capacity_analytics.analyse."""
+
+    def setUp(self):
+        """Analyse the clouds and projects, as a dictionary per pod."""
+        self.report = capacity_analytics.analyse(CLOUDS, PROJECTS)
+        self.pods = dict((pod['name'], pod) for pod in self.report.to_dict()['pods'])
+
+    def test_allocations_and_headroom(self):
+        """The allocations of each pod's projects are summed, and compared with its capacity."""
+        pod = self.pods['cloud1']
+
+        self.assertEqual(pod['projects'], 2)
+        self.assertEqual((pod['allocated_cpu'], pod['cpu_capacity']), (25, 20))
+        self.assertEqual((pod['cpu_headroom'], pod['memory_headroom_mb']), (-5, 300))
+        self.assertEqual(pod['cpu_utilisation'], 1.25)
+        self.assertEqual(pod['cinder_iops_per_allocated_gb'], 1000.0 / 60)
+
+    def test_overcommitted_pods(self):
+        """Pods allocated more than max_utilisation of any of their capacities are overcommitted."""
+        self.assertEqual(self.report.overcommitted_pod_names(), ['cloud1', 'cloud2'])
+        self.assertEqual(
+            [self.pods[pod_name]['overcommitted'] for pod_name in ('cloud3', 'cloud4')],
+            [False, False]
+        )
+        self.assertEqual(
+            capacity_analytics.analyse(CLOUDS, PROJECTS, max_utilisation=0.4)
+            .overcommitted_pod_names(),
+            ['cloud1', 'cloud2', 'cloud4']
+        )
+
+    def test_zero_capacity(self):
+        """A zero capacity has no utilisation with projects allocated on it, and 0 without."""
+        self.assertEqual(
+            [self.pods['cloud2'][column_name]
+             for column_name in capacity_analytics.UTILISATION_COLUMNS],
+            [None, None, None]
+        )
+        self.assertEqual(
+            [self.pods['cloud3'][column_name]
+             for column_name in capacity_analytics.UTILISATION_COLUMNS],
+            [0.0, 0.0, 0.0]
+        )
+
+    def test_unmatched_projects(self):
+        """Projects of a cloud that isn't in the list are counted, and allocated to no pod."""
+        self.assertEqual(self.report.to_dict()['unmatched_projects'], 2)
+        self.assertEqual(sum(pod['projects'] for pod in self.pods.values()), 4)
+
+    def test_no_projects(self):
+        """Without projects, nothing is allocated and no pod is overcommitted."""
+        report = capacity_analytics.analyse(CLOUDS, []).to_dict()
+
+        self.assertEqual(report['overcommitted_pods'], [])
+        self.assertEqual(report['unmatched_projects'], 0)
+        self.assertEqual([pod['allocated_cpu'] for pod in report['pods']], [0, 0, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
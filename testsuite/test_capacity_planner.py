@@ -0,0 +1,244 @@
+"""Unit tests of the capacity_planner module, against the local Capacity Planner stand-in."""
+
+import json
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import capacity_planner  # noqa: E402  pylint: disable=wrong-import-position
+import mock_servers  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class CollectionIndexTest(unittest.TestCase):
+    """Tests of the lookups of capacity_planner.CollectionIndex."""
+
+    def setUp(self):
+        """Index two projects of the same name in different pods, and a team."""
+        self.index = capacity_planner.CollectionIndex([
+            {'_id': 'p1', 'name': 'project1', 'pod_id': 'pod1'},
+            {'_id': 'p2', 'name': 'project1', 'pod_id': 'pod2'},
+            {'_id': 't1', 'name': 'team1'},
+            {'name': 'no id'}
+        ])
+
+    def test_lookups(self):
+        """Items are found by id, by name, the last added first, and by name and pod."""
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.get_by_id('t1')['name'], 'team1')
+        self.assertEqual(self.index.get_by_name('project1')['_id'], 'p2')
+        self.assertEqual(self.index.get_by_name_and_pod('project1', 'pod1')['_id'], 'p1')
+        self.assertIsNone(self.index.get_by_name('no id'))
+        self.assertIsNone(self.index.get_by_name_and_pod('team1', None))
+        self.assertIsNone(self.index.get_by_name_and_pod('project1', 'pod3'))
+
+    def test_replaced_item(self):
+        """An item added again under its _id replaces the old one in every lookup."""
+        self.index.add({'_id': 'p1', 'name': 'project2', 'pod_id': 'pod1'})
+
+        self.assertEqual(self.index.get_by_name('project1')['_id'], 'p2')
+        self.assertEqual(self.index.get_by_name('project2')['_id'], 'p1')
+        self.assertIsNone(self.index.get_by_name_and_pod('project1', 'pod1'))
+        self.assertEqual(len(self.index), 3)
+
+    def test_removed_item(self):
+        """A removed item is no longer found, and others of the same name are."""
+        self.assertEqual(self.index.remove('p2')['_id'], 'p2')
+
+        self.assertIsNone(self.index.get_by_id('p2'))
+        self.assertIsNone(self.index.get_by_name_and_pod('project1', 'pod2'))
+        self.assertEqual(self.index.get_by_name('project1')['_id'], 'p1')
+        self.assertIsNone(self.index.remove('p2'))
+
+        self.index.remove('p1')
+
+        self.assertIsNone(self.index.get_by_name('project1'))
+        self.assertNotIn('project1', self.index.by_name)
+
+
+class CapacityPlannerTestCase(unittest.TestCase):
+    """Runs each test against a stand-in Capacity Planner with bulk routes."""
+
+    def setUp(self):
+        """Start the stand-in and connect a CapacityPlanner to it."""
+        self.state = mock_servers.MockState(bulk=True)
+        self.server = mock_servers.MockServer(self.state)
+        self.server.start()
+        self.cap_planner = capacity_planner.CapacityPlanner({
+            'base_url': self.server.base_url,
+            'default_team_name': 'default',
+            'default_deployment_type_name': '5K'
+        })
+
+    def tearDown(self):
+        """Stop the stand-in."""
+        self.cap_planner.session.close()
+        self.server.stop()
+
+    def count_requests(self, endpoint):
+        """Return the number of requests the stand-in got for the given endpoint."""
+        return self.state.statistics.snapshot()['requests'].get(endpoint, 0)
+
+
+class UpdateIndexItemsTest(CapacityPlannerTestCase):
+    """Tests of CapacityPlanner.update_index_items after bulk POSTs."""
+
+    def test_reply_with_ids(self):
+        """The items created are indexed from the reply, without reading the collection."""
+        item = self.state.add_item('teams', {'name': 'team1'})
+        get_count = self.count_requests('GET /api/teams/')
+
+        self.cap_planner.update_index_items(
+            'POST', 'teams', [('team1', None, json.dumps({'name': 'team1'}))], [item]
+        )
+
+        self.assertEqual(self.cap_planner.cap_teams.get_by_name('team1')['_id'], item['_id'])
+        self.assertEqual(self.count_requests('GET /api/teams/'), get_count)
+
+    def test_reply_without_ids(self):
+        """The collection is read again when the reply doesn't give the _id of the items created."""
+        team = self.state.add_item('teams', {'name': 'team1'})
+        project = self.state.add_item('projects', {'name': 'project1', 'pod_id': 'pod1'})
+
+        self.cap_planner.update_index_items(
+            'POST', 'teams', [('team1', None, json.dumps({'name': 'team1'}))], {}
+        )
+        self.cap_planner.update_index_items(
+            'POST', 'projects',
+            [('project1', None, json.dumps({'name': 'project1', 'pod_id': 'pod1'}))],
+            [{'name': 'project1'}]
+        )
+
+        self.assertEqual(self.cap_planner.get_team_id('team1'), team['_id'])
+        self.assertEqual(
+            self.cap_planner.cap_projects.get_by_name_and_pod('project1', 'pod1')['_id'],
+            project['_id']
+        )
+
+    def test_updated_and_deleted_items(self):
+        """Updated items are indexed with the values written, deleted items are removed."""
+        self.cap_planner.update_index_items(
+            'POST', 'projects',
+            [('project1', None, json.dumps({'name': 'project1', 'pod_id': 'pod1'}))],
+            [{'_id': 'p1', 'name': 'project1', 'pod_id': 'pod1'}]
+        )
+
+        self.cap_planner.update_index_items(
+            'PUT', 'projects',
+            [('project1', 'p1', json.dumps({'name': 'project1', 'pod_id': 'pod1', 'cpu': 8}))],
+            {}
+        )
+
+        index = self.cap_planner.cap_projects
+        self.assertEqual(index.get_by_name_and_pod('project1', 'pod1'), {
+            '_id': 'p1', 'name': 'project1', 'pod_id': 'pod1', 'cpu': 8
+        })
+
+        self.cap_planner.update_index_items('DELETE', 'projects', [('project1', 'p1', None)], {})
+
+        self.assertIsNone(index.get_by_id('p1'))
+        self.assertIsNone(index.get_by_name('project1'))
+
+    def test_created_items_not_found(self):
+        """A RuntimeError is raised if the items created can't be found in the collection."""
+        with self.assertRaises(RuntimeError):
+            self.cap_planner.update_index_items(
+                'POST', 'teams', [('team1', None, json.dumps({'name': 'team1'}))], []
+            )
+
+
+class PooledSessionTest(CapacityPlannerTestCase):
+    """Tests of the connection reuse of capacity_planner.PooledSession."""
+
+    def test_connection_is_reused(self):
+        """Requests one after another on a session share one connection, and are counted."""
+        session = capacity_planner.PooledSession(pool_size=2)
+        self.addCleanup(session.close)
+
+        for _ in range(5):
+            session.get(self.server.base_url + 'api/teams/').raise_for_status()
+
+        self.assertEqual(session.connection_stats(), {
+            'requests': 5,
+            'connections_opened': 1,
+            'connections_reused': 4
+        })
+
+    def test_planner_requests_are_counted(self):
+        """The requests of a CapacityPlanner are counted on its session."""
+        requests_sent = self.cap_planner.session.connection_stats()['requests']
+
+        self.cap_planner.execute_cap_get_rest_call('/api/teams/')
+        self.cap_planner.execute_cap_get_rest_call('/api/pods/')
+
+        connection_stats = self.cap_planner.session.connection_stats()
+        self.assertEqual(connection_stats['requests'], requests_sent + 2)
+        self.assertEqual(connection_stats['connections_opened'], 1)
+
+
+class ConditionalGetTest(CapacityPlannerTestCase):
+    """Tests of the revalidation of cached GETs by CapacityPlanner.execute_cap_get_rest_call."""
+
+    def get_teams(self):
+        """Return the teams, and the number of response bytes the stand-in sent for them."""
+        bytes_sent = self.state.statistics.snapshot()['bytes_sent']
+        teams = self.cap_planner.execute_cap_get_rest_call('/api/teams/')
+        return teams, self.state.statistics.snapshot()['bytes_sent'] - bytes_sent
+
+    def test_not_modified_uses_the_cached_body(self):
+        """A collection that hasn't changed is answered with a 304, and read from the cache."""
+        teams, _ = self.get_teams()
+
+        cached_teams, bytes_sent = self.get_teams()
+
+        self.assertEqual(cached_teams, teams)
+        self.assertEqual(bytes_sent, 0)
+
+    def test_modified_collection_is_read_again(self):
+        """A collection that has changed is sent again, and replaces the cached body."""
+        teams, _ = self.get_teams()
+        self.state.add_item('teams', {'name': 'team1'})
+
+        changed_teams, bytes_sent = self.get_teams()
+
+        self.assertEqual(len(changed_teams), len(teams) + 1)
+        self.assertGreater(bytes_sent, 0)
+        self.assertEqual(self.get_teams(), (changed_teams, 0))
+
+
+class IterCollectionPagesTest(CapacityPlannerTestCase):
+    """Tests of CapacityPlanner.iter_collection_pages."""
+
+    def setUp(self):
+        """Add five projects to the stand-in."""
+        super(IterCollectionPagesTest, self).setUp()
+        self.projects = [
+            self.state.add_item('projects', {'name': 'project' + str(number), 'pod_id': pod_id})
+            for number, pod_id in enumerate(['pod1', 'pod2', 'pod1', 'pod2', 'pod1'])
+        ]
+
+    def test_pages(self):
+        """Every item is yielded, one page per request."""
+        get_count = self.count_requests('GET /api/projects/')
+
+        items = list(self.cap_planner.iter_collection_pages('projects', page_size=2))
+
+        self.assertEqual(items, self.projects)
+        self.assertEqual(self.count_requests('GET /api/projects/') - get_count, 3)
+
+    def test_last_page_full(self):
+        """A full last page is followed by a request for an empty page."""
+        get_count = self.count_requests('GET /api/projects/')
+
+        items = list(self.cap_planner.iter_collection_pages('projects', page_size=5))
+
+        self.assertEqual(items, self.projects)
+        self.assertEqual(self.count_requests('GET /api/projects/') - get_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+"""Unit tests of the collector module, run against the fake openstack backend."""
+
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import collector  # noqa: E402  pylint: disable=wrong-import-position
+import openstack  # noqa: E402  pylint: disable=wrong-import-position
+import openstack_backends  # noqa: E402  pylint: disable=wrong-import-position
+import records  # noqa: E402  pylint: disable=wrong-import-position
+
+CINDER_POOLS_OUTPUT = """
++-------------------+-----------------+
+| Property          | Value           |
++-------------------+-----------------+
+| name              | host1@lvm#pool1 |
+| free_capacity_gb  | 120.5           |
+| total_capacity_gb | 500             |
++-------------------+-----------------+
++-------------------+-----------------+
+| Property          | Value           |
++-------------------+-----------------+
+| name              | host2@nfs#pool2 |
+| free_capacity_gb  | infinite        |
+| total_capacity_gb | infinite        |
++-------------------+-----------------+
+"""
+
+HYPERVISOR_STATS = {
+    'count': 2, 'vcpus': 64, 'vcpus_used': 40, 'memory_mb': 262144, 'memory_mb_used': 131072,
+    'local_gb': 2000, 'local_gb_used': 500, 'running_vms': 12
+}
+
+FAKE_DATA = {
+    'http://cloud1:5000/v3': {
+        'hypervisor_stats': HYPERVISOR_STATS,
+        'cinder_pools': openstack.parse_table_lines(True, CINDER_POOLS_OUTPUT.splitlines()),
+        'projects': [{'ID': 'id1', 'Name': 'project1'}, {'ID': 'id2', 'Name': 'project2'}],
+        'project_quotas': {
+            'project1': {'project': 'id1', 'project_name': 'project1', 'cores': 8},
+            'project2': {'project': 'id2', 'project_name': 'project2', 'cores': 16},
+            'other': {'project': 'id3', 'project_name': 'other', 'cores': 4}
+        }
+    },
+    'http://cloud2:5000/v3': {
+        'hypervisor_stats': HYPERVISOR_STATS,
+        'cinder_pools': [],
+        'projects': []
+    },
+    'http://cloud3:5000/v3': {
+        'hypervisor_stats': HYPERVISOR_STATS
+    },
+    'http://cloud4:5000/v3': {
+        'hypervisor_stats': HYPERVISOR_STATS,
+        'cinder_pools': [],
+        'projects': [{'ID': 'id4', 'Name': 'project4'}]
+    }
+}
+
+
+def get_openstack_env(cloud_name):
+    """Return the openstack_env of the given fake cloud."""
+    return {
+        'cloud_name': cloud_name,
+        'os_auth_url': 'http://' + cloud_name + ':5000/v3',
+        'os_project_name': 'admin',
+        'os_username': 'admin',
+        'os_password': 'secret'
+    }
+
+
+class CollectCloudsTest(unittest.TestCase):
+    """Tests of collector.collect_clouds."""
+
+    def setUp(self):
+        """Set up the fake backend."""
+        self.backend = openstack_backends.FakeBackend(FAKE_DATA)
+
+    def test_collected_data(self):
+        """Each cloud's data is collected, with the quotas of its own projects only."""
+        dataset = collector.collect_clouds(
+            [get_openstack_env('cloud1'), get_openstack_env('cloud2')], backend=self.backend
+        )
+
+        self.assertEqual(sorted(dataset), ['cloud1', 'cloud2'])
+        self.assertEqual(dataset['cloud1']['hypervisor_stats'], HYPERVISOR_STATS)
+        self.assertEqual(len(dataset['cloud1']['cinder_pools']), 2)
+        self.assertEqual(
+            dataset['cloud1']['projects'], FAKE_DATA['http://cloud1:5000/v3']['projects']
+        )
+        self.assertEqual(sorted(dataset['cloud1']['project_quotas']), ['project1', 'project2'])
+        self.assertEqual(dataset['cloud2']['project_quotas'], {})
+
+    def test_failed_clouds_are_left_out(self):
+        """Clouds whose stats, projects or quotas fail are left out, the others are kept."""
+        dataset = collector.collect_clouds(
+            [get_openstack_env(cloud_name) for cloud_name in ('cloud1', 'cloud3', 'cloud4')],
+            workers=2,
+            backend=self.backend
+        )
+
+        self.assertEqual(sorted(dataset), ['cloud1'])
+
+    def test_unknown_cloud(self):
+        """A cloud the backend knows nothing of gives nothing."""
+        self.assertIsNone(collector.collect_cloud(get_openstack_env('cloud5'), self.backend))
+
+
+class CollectCloudStatsTest(unittest.TestCase):
+    """Tests of collector.collect_cloud_stats, and the records made of what it collects."""
+
+    def setUp(self):
+        """Set up the fake backend."""
+        self.backend = openstack_backends.FakeBackend(FAKE_DATA)
+
+    def test_stats_of_each_cloud(self):
+        """Only the hypervisor stats and cinder pools are collected, failed clouds left out."""
+        dataset = collector.collect_cloud_stats(
+            [get_openstack_env(cloud_name) for cloud_name in ('cloud1', 'cloud2', 'cloud3')],
+            backend=self.backend
+        )
+
+        self.assertEqual(sorted(dataset), ['cloud1', 'cloud2'])
+        self.assertEqual(sorted(dataset['cloud1']), sorted(collector.CLOUD_STATS_DATA_NAMES))
+
+    def test_live_cloud_stats(self):
+        """The collected data, in the shape the cli clients give, makes a LiveCloudStats."""
+        dataset = collector.collect_cloud_stats([get_openstack_env('cloud1')], backend=self.backend)
+
+        stats = records.LiveCloudStats.from_collected('cloud1', dataset['cloud1'])
+
+        self.assertEqual(
+            (stats.vcpus, stats.vcpus_used, stats.memory_mb, stats.memory_mb_used),
+            (64, 40, 262144, 131072)
+        )
+        self.assertEqual((stats.cinder_total_gb, stats.cinder_free_gb), (500, 120.5))
+
+
+class BrokenFakeBackend(openstack_backends.FakeBackend):
+    """A fake backend whose calls towards one cloud fail with a TypeError."""
+
+    def __init__(self, data, broken_auth_url):
+        """Initialize the backend with the given data, and the auth url of the broken cloud."""
+        super(BrokenFakeBackend, self).__init__(data)
+        self.broken_auth_url = broken_auth_url
+
+    def get(self, data_name, auth_url, project_names=None):
+        """Return the given data, or fail as a client library bug would for the broken cloud."""
+        if auth_url == self.broken_auth_url:
+            raise TypeError("'NoneType' object is not iterable")
+        return super(BrokenFakeBackend, self).get(data_name, auth_url, project_names)
+
+
+class BackendCallTest(unittest.TestCase):
+    """Tests of the errors kept by openstack_backends.BackendCall."""
+
+    def test_backend_exception(self):
+        """A BackendException is kept as the error of the call."""
+        backend_call = openstack_backends.FakeBackend(FAKE_DATA).prepare(
+            'cinder_pools', {'OS_AUTH_URL': 'http://cloud3:5000/v3'}
+        ).run()
+
+        self.assertIsNone(backend_call.result)
+        self.assertIsInstance(backend_call.error, openstack_backends.BackendException)
+
+    def test_unexpected_exception(self):
+        """Any other exception is kept as a BackendException, rather than raised."""
+        def get_hypervisor_stats():
+            """Fail as a missing OS_* variable would."""
+            raise KeyError('OS_AUTH_URL')
+
+        backend_call = openstack_backends.BackendCall('hypervisor_stats', get_hypervisor_stats)
+
+        self.assertIs(backend_call.run(), backend_call)
+        self.assertIsInstance(backend_call.error, openstack_backends.BackendException)
+        self.assertIn('OS_AUTH_URL', str(backend_call.error))
+
+    def test_unexpected_exception_fails_its_cloud_only(self):
+        """A cloud whose call raises an unexpected exception is left out, the others kept."""
+        backend = BrokenFakeBackend(FAKE_DATA, 'http://cloud2:5000/v3')
+
+        dataset = collector.collect_clouds(
+            [get_openstack_env('cloud1'), get_openstack_env('cloud2')], backend=backend
+        )
+
+        self.assertEqual(sorted(dataset), ['cloud1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Unit tests of the dry_run module."""
+
+import json
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import dry_run  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class ChangesetPlanAddTest(unittest.TestCase):
+    """Tests of dry_run.ChangesetPlan.add."""
+
+    def setUp(self):
+        """Set up an empty plan."""
+        self.plan = dry_run.ChangesetPlan()
+
+    def test_post_gets_placeholder_ids(self):
+        """Each created item is given a new made up _id."""
+        first = self.plan.add('POST', 'POST /api/teams/', '/api/teams/', json_data='{"name": "a"}')
+        second = self.plan.add('POST', 'POST /api/teams/', '/api/teams/', json_data='{"name": "b"}')
+
+        self.assertTrue(first['_id'].startswith(dry_run.PLANNED_ID_PREFIX))
+        self.assertNotEqual(first['_id'], second['_id'])
+
+    def test_bulk_post_gets_a_list(self):
+        """A bulk POST is answered with a list of one response per item, each with an _id."""
+        responses = self.plan.add(
+            'POST', 'POST /api/projects/bulk/', '/api/projects/bulk/',
+            json_data=json.dumps([{'name': 'p1'}, {'name': 'p2'}, {'name': 'p3'}]), item_count=3
+        )
+
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(len(set(response['_id'] for response in responses)), 3)
+
+    def test_other_writes(self):
+        """PUT and DELETE are answered with empty responses, a list for a bulk route."""
+        self.assertEqual(
+            self.plan.add('PUT', 'PUT /api/teams/{id}', '/api/teams/t1', json_data='{}'), {}
+        )
+        self.assertEqual(
+            self.plan.add('DELETE', 'DELETE /api/teams/bulk/', '/api/teams/bulk/', item_count=2),
+            [{}, {}]
+        )
+
+    def test_operations_are_recorded(self):
+        """The writes are kept in order, counted per endpoint and per method by item."""
+        self.plan.add('POST', 'POST /api/teams/', '/api/teams/', json_data='{"name": "a"}')
+        self.plan.add(
+            'POST', 'POST /api/projects/bulk/', '/api/projects/bulk/',
+            json_data='[{"name": "p1"}, {"name": "p2"}]', item_count=2
+        )
+        self.plan.add('DELETE', 'DELETE /api/teams/{id}', '/api/teams/t1')
+
+        self.assertEqual(self.plan.requests_by_endpoint(), {
+            'POST /api/teams/': 1,
+            'POST /api/projects/bulk/': 1,
+            'DELETE /api/teams/{id}': 1
+        })
+        plan = self.plan.to_dict('update', None)
+        self.assertEqual(plan['items_by_method'], {'POST': 3, 'DELETE': 1})
+        self.assertEqual(plan['operations'][0]['body'], {'name': 'a'})
+        self.assertIsNone(plan['operations'][2]['body'])
+
+    def test_unexpected_keyword(self):
+        """Unknown keyword arguments are refused."""
+        with self.assertRaises(TypeError):
+            self.plan.add('PUT', 'PUT /api/teams/{id}', '/api/teams/t1', data='{}')
+
+
+class ForecastTest(unittest.TestCase):
+    """Tests of dry_run.forecast."""
+
+    def test_measured_endpoints(self):
+        """The requests are spread over the workers, each taking its endpoint's latency."""
+        result = dry_run.forecast(
+            {'POST /api/teams/': 4, 'DELETE /api/teams/{id}': 2},
+            {'POST /api/teams/': 0.5, 'DELETE /api/teams/{id}': 1.0},
+            workers=2
+        )
+
+        self.assertEqual(result['requests'], 6)
+        self.assertEqual(result['estimated_seconds'], 2.0)
+        self.assertEqual(result['unmeasured_endpoints'], [])
+
+    def test_fewer_requests_than_workers(self):
+        """With fewer requests than workers, each request gets a worker."""
+        result = dry_run.forecast({'POST /api/teams/': 2}, {'POST /api/teams/': 0.5}, workers=8)
+
+        self.assertEqual(result['estimated_seconds'], 0.5)
+
+    def test_rate_limit(self):
+        """The estimate is no less than the time the rate limit allows the requests in."""
+        result = dry_run.forecast(
+            {'POST /api/teams/': 10}, {'POST /api/teams/': 0.1}, workers=10, rate_limit=2
+        )
+
+        self.assertEqual(result['estimated_seconds'], 5.0)
+
+    def test_unmeasured_endpoint_uses_planned_latencies(self):
+        """An unmeasured endpoint takes the mean of the other planned endpoints, not of reads."""
+        result = dry_run.forecast(
+            {'POST /api/teams/': 1, 'PUT /api/teams/{id}': 1},
+            {'POST /api/teams/': 1.0, 'GET /api/teams/': 0.01, 'GET /typhoon/': 0.01},
+            workers=1
+        )
+
+        self.assertEqual(result['unmeasured_endpoints'], ['PUT /api/teams/{id}'])
+        self.assertEqual(result['endpoints']['PUT /api/teams/{id}']['mean_latency_seconds'], 1.0)
+        self.assertEqual(result['estimated_seconds'], 2.0)
+
+    def test_no_planned_endpoint_measured(self):
+        """No time is estimated if only other endpoints, such as reads, were measured."""
+        result = dry_run.forecast(
+            {'POST /api/teams/': 3}, {'GET /api/teams/': 0.01}, workers=2
+        )
+
+        self.assertIsNone(result['estimated_seconds'])
+        self.assertIsNone(result['endpoints']['POST /api/teams/']['mean_latency_seconds'])
+        self.assertEqual(result['requests'], 3)
+
+    def test_empty_plan(self):
+        """An empty plan takes no time."""
+        result = dry_run.forecast({}, {}, workers=4)
+
+        self.assertEqual(result['requests'], 0)
+        self.assertEqual(result['estimated_seconds'], 0.0)
+
+
+class MeanLatenciesTest(unittest.TestCase):
+    """Tests of dry_run.mean_latencies."""
+
+    def test_endpoints_without_calls_are_left_out(self):
+        """The mean is the total time over the count, for endpoints with calls."""
+        self.assertEqual(dry_run.mean_latencies({
+            'POST /api/teams/': {'count': 4, 'total_seconds': 2.0},
+            'PUT /api/teams/{id}': {'count': 0, 'total_seconds': 0.0}
+        }), {'POST /api/teams/': 0.5})
+
+
+if __name__ == '__main__':
+    unittest.main()
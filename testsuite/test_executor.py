@@ -0,0 +1,169 @@
+"""Unit tests of the executor module."""
+
+import logging
+import os
+import sys
+import threading
+import time
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import executor  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def write(number):
+    """Return the square of the given number, failing for multiples of three."""
+    time.sleep(0.01 * (number % 4))
+    if number % 3 == 0:
+        raise ValueError('write ' + str(number) + ' failed')
+    return number * number
+
+
+def get_tasks(count):
+    """Return count write tasks, numbered from 1."""
+    return [executor.WriteTask('write ' + str(number), write, number)
+            for number in range(1, count + 1)]
+
+
+class WriteExecutorTest(unittest.TestCase):
+    """Tests of executor.WriteExecutor."""
+
+    def test_failed_tasks_are_returned(self):
+        """Every task is run, and the failed ones returned in the order they were given."""
+        tasks = get_tasks(10)
+
+        failed_tasks = executor.WriteExecutor(workers=4, progress_interval=0).run(tasks)
+
+        self.assertEqual(
+            [task.description for task in failed_tasks], ['write 3', 'write 6', 'write 9']
+        )
+        self.assertTrue(all(isinstance(task.error, ValueError) for task in failed_tasks))
+        self.assertEqual(
+            [task.result for task in tasks], [1, 4, None, 16, 25, None, 49, 64, None, 100]
+        )
+
+    def test_single_worker(self):
+        """A single worker runs the tasks one after another, in the order given."""
+        order = []
+        tasks = [executor.WriteTask(str(number), order.append, number) for number in range(5)]
+
+        self.assertEqual(executor.WriteExecutor(workers=1, progress_interval=0).run(tasks), [])
+        self.assertEqual(order, range(5))
+
+    def test_workers_bound(self):
+        """No more than the given number of tasks run at once."""
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def count_running():
+            """Count the tasks running alongside this one."""
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        tasks = [executor.WriteTask('task', count_running) for _ in range(12)]
+
+        executor.WriteExecutor(workers=3, progress_interval=0).run(tasks)
+
+        self.assertLessEqual(most_running[0], 3)
+        self.assertGreater(most_running[0], 1)
+
+    def test_progress(self):
+        """The progress counts every task run, and the failed ones."""
+        write_executor = executor.WriteExecutor(workers=2, progress_interval=0)
+
+        write_executor.run(get_tasks(6))
+
+        progress = write_executor.progress
+        self.assertEqual((progress.completed, progress.failed), (6, 2))
+
+
+class ProgressReporterTest(unittest.TestCase):
+    """Tests of the progress lines of executor.ProgressReporter."""
+
+    def test_progress_line(self):
+        """The progress line gives the writes done and failed so far."""
+        progress = executor.ProgressReporter(interval=0)
+        for task in get_tasks(4):
+            progress.add(task.run())
+        messages = []
+        handler = logging.Handler()
+        handler.emit = lambda record: messages.append(record.getMessage())
+        executor.LOG.addHandler(handler)
+        self.addCleanup(executor.LOG.removeHandler, handler)
+        self.addCleanup(executor.LOG.setLevel, executor.LOG.level)
+        executor.LOG.setLevel(logging.INFO)
+
+        progress.log_progress()
+
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('Progress: 4 writes done, 1 failed, '))
+
+
+class RateLimiterTest(unittest.TestCase):
+    """Tests of executor.RateLimiter."""
+
+    def test_calls_are_spaced_out(self):
+        """Calls towards one host are spaced out by the interval of the rate."""
+        rate_limiter = executor.RateLimiter(requests_per_second=20)
+        start_time = time.time()
+
+        for _ in range(5):
+            rate_limiter.wait('planner')
+
+        self.assertGreaterEqual(time.time() - start_time, 0.19)
+
+    def test_hosts_are_limited_apart(self):
+        """Each host has its own rate, a call towards another host doesn't wait."""
+        rate_limiter = executor.RateLimiter(requests_per_second=2)
+        rate_limiter.wait('planner1')
+        start_time = time.time()
+
+        rate_limiter.wait('planner2')
+
+        self.assertLess(time.time() - start_time, 0.1)
+
+    def test_no_rate(self):
+        """Without a rate, calls don't wait."""
+        rate_limiter = executor.RateLimiter()
+        start_time = time.time()
+
+        for _ in range(100):
+            rate_limiter.wait('planner')
+
+        self.assertLess(time.time() - start_time, 0.1)
+
+
+class RaiseForFailedTasksTest(unittest.TestCase):
+    """Tests of executor.raise_for_failed_tasks."""
+
+    def test_no_failed_tasks(self):
+        """Nothing is raised without failed tasks."""
+        executor.raise_for_failed_tasks([])
+
+    def test_failed_tasks_are_described(self):
+        """The exception gives the number of failed writes, and the error of each."""
+        failed_tasks = [
+            executor.failed_task('create pod cloud1', RuntimeError('timed out')),
+            executor.failed_task('create team alpha', RuntimeError('409 Conflict'))
+        ]
+
+        with self.assertRaises(executor.WriteErrorsException) as context:
+            executor.raise_for_failed_tasks(failed_tasks)
+
+        self.assertEqual(
+            str(context.exception),
+            '2 writes failed:\ncreate pod cloud1: timed out\ncreate team alpha: 409 Conflict'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""Unit tests of the http_cache module."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import http_cache  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class StubResponse(object):  # pylint: disable=too-few-public-methods
+    """Stands in for a requests response, with its headers and text."""
+
+    def __init__(self, text, etag=None, last_modified=None):
+        """Initialize the response with the given body and validators."""
+        self.text = text
+        self.headers = {}
+        if etag:
+            self.headers['ETag'] = etag
+        if last_modified:
+            self.headers['Last-Modified'] = last_modified
+
+
+class HttpCacheTest(unittest.TestCase):
+    """Tests of the in memory http_cache.HttpCache."""
+
+    def test_response_without_validators(self):
+        """A response without an ETag or Last-Modified header isn't kept."""
+        cache = http_cache.HttpCache()
+
+        cache.store('http://planner/api/teams/', StubResponse('[]'))
+
+        self.assertIsNone(cache.get('http://planner/api/teams/'))
+
+    def test_conditional_headers(self):
+        """A kept response gives the headers of a conditional GET, and its body."""
+        cache = http_cache.HttpCache()
+        cache.store('http://planner/api/teams/', StubResponse(
+            '[{"name": "team1"}]', etag='"abc"', last_modified='Mon, 12 Oct 2026 10:00:00 GMT'
+        ))
+
+        entry = cache.get('http://planner/api/teams/')
+
+        self.assertEqual(entry.body, '[{"name": "team1"}]')
+        self.assertEqual(entry.conditional_headers(), {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Mon, 12 Oct 2026 10:00:00 GMT'
+        })
+
+    def test_least_recently_used_is_evicted(self):
+        """Past max_bytes, the least recently used entries are evicted."""
+        cache = http_cache.HttpCache(max_bytes=10)
+        cache.store('a', StubResponse('aaaa', etag='"a"'))
+        cache.store('b', StubResponse('bbbb', etag='"b"'))
+        cache.get('a')
+
+        cache.store('c', StubResponse('cccc', etag='"c"'))
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a').body, 'aaaa')
+        self.assertEqual(cache.get('c').body, 'cccc')
+        self.assertEqual(cache.size, 8)
+
+    def test_replaced_entry(self):
+        """Storing a url again replaces its entry, and its size."""
+        cache = http_cache.HttpCache()
+        cache.store('a', StubResponse('aaaa', etag='"1"'))
+
+        cache.store('a', StubResponse('aa', etag='"2"'))
+
+        self.assertEqual(cache.get('a').etag, '"2"')
+        self.assertEqual(cache.size, 2)
+
+    def test_body_larger_than_max_bytes(self):
+        """A body larger than max_bytes isn't kept, and evicts nothing."""
+        cache = http_cache.HttpCache(max_bytes=10)
+        cache.store('a', StubResponse('aaaa', etag='"a"'))
+
+        cache.store('b', StubResponse('b' * 11, etag='"b"'))
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a').body, 'aaaa')
+
+
+class HttpCacheDirectoryTest(unittest.TestCase):
+    """Tests of http_cache.HttpCache kept in a directory."""
+
+    def setUp(self):
+        """Create the cache directory."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the cache directory."""
+        shutil.rmtree(self.directory)
+
+    def cache_files(self):
+        """Return the names of the files in the cache directory."""
+        return sorted(os.listdir(self.directory))
+
+    def test_entries_outlive_the_cache(self):
+        """An entry stored by one cache is read back by another using the same directory."""
+        http_cache.HttpCache(self.directory).store('a', StubResponse('aaaa', etag='"a"'))
+
+        entry = http_cache.HttpCache(self.directory).get('a')
+
+        self.assertEqual((entry.url, entry.etag, entry.body), ('a', '"a"', 'aaaa'))
+
+    def test_unreadable_file(self):
+        """A cache file that isn't valid JSON is ignored."""
+        cache = http_cache.HttpCache(self.directory)
+        with open(cache.file_name('a'), 'w') as cache_file:
+            cache_file.write('{"url": "a", "bo')
+
+        self.assertIsNone(cache.get('a'))
+
+    def test_size_limit_evicts_least_recently_used_files(self):
+        """Past max_bytes on disk, the least recently used files are removed."""
+        cache = http_cache.HttpCache(self.directory)
+        for mtime, url in enumerate(['a', 'b', 'c']):
+            cache.store(url, StubResponse(url * 100, etag='"' + url + '"'))
+            os.utime(cache.file_name(url), (1000 + mtime, 1000 + mtime))
+        http_cache.HttpCache(self.directory).get('a')
+        file_size = os.path.getsize(cache.file_name('a'))
+
+        cache.max_bytes = file_size * 2
+        cache.evict_files()
+
+        self.assertFalse(os.path.exists(cache.file_name('b')))
+        self.assertTrue(os.path.exists(cache.file_name('a')))
+        self.assertTrue(os.path.exists(cache.file_name('c')))
+
+    def test_store_keeps_the_directory_under_max_bytes(self):
+        """Storing an entry evicts files until the directory is under max_bytes."""
+        cache = http_cache.HttpCache(self.directory, max_bytes=250)
+        cache.store('a', StubResponse('a' * 100, etag='"a"'))
+        os.utime(cache.file_name('a'), (1000, 1000))
+
+        cache.store('b', StubResponse('b' * 100, etag='"b"'))
+
+        self.assertEqual(self.cache_files(), [os.path.basename(cache.file_name('b'))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Unit tests of the journal module."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import journal  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class JournalReplayTest(unittest.TestCase):
+    """Tests of journal.Journal.replay."""
+
+    def setUp(self):
+        """Write a journal of two completed creates."""
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'create.journal')
+        run = journal.Journal(self.file_name, 'create')
+        run.record('POST', 'teams', 'team1', 't1')
+        run.record('POST', 'projects', 'project1@pod1', 'p1')
+        run.close()
+        self.complete_size = os.path.getsize(self.file_name)
+
+    def tearDown(self):
+        """Remove the journal."""
+        shutil.rmtree(self.directory)
+
+    def append_text(self, text):
+        """Append the given text to the journal file, as a run that died would."""
+        with open(self.file_name, 'a') as journal_file:
+            journal_file.write(text)
+
+    def assert_resumes_after_truncated_line(self):
+        """Check that the complete lines are replayed, and the rest is dropped."""
+        run = journal.Journal(self.file_name, 'create')
+        self.assertTrue(run.is_done('POST', 'teams', 'team1'))
+        self.assertTrue(run.is_done('POST', 'projects', 'project1@pod1'))
+        self.assertFalse(run.is_done('POST', 'projects', 'project2@pod1'))
+        run.record('POST', 'projects', 'project3@pod1', 'p3')
+        run.close()
+
+        run = journal.Journal(self.file_name, 'create')
+        self.assertEqual(run.completed, {
+            ('POST', 'teams', 'team1'): 't1',
+            ('POST', 'projects', 'project1@pod1'): 'p1',
+            ('POST', 'projects', 'project3@pod1'): 'p3'
+        })
+        run.close(completed=True)
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_partial_last_line(self):
+        """A last line cut short is ignored, and overwritten by the next write."""
+        self.append_text('{"method":"POST","collection":"projects","key":"proj')
+
+        self.assert_resumes_after_truncated_line()
+
+    def test_last_line_without_new_line(self):
+        """A last line missing its new line isn't trusted, even if it is valid JSON."""
+        self.append_text(
+            '{"method":"POST","collection":"projects","key":"project2@pod1","id":"p2"}'
+        )
+
+        self.assert_resumes_after_truncated_line()
+
+    def test_truncated_line_is_cut_off(self):
+        """The journal is cut back to its last complete line when it is reopened."""
+        self.append_text('{"method"')
+
+        journal.Journal(self.file_name, 'create').close()
+
+        self.assertEqual(os.path.getsize(self.file_name), self.complete_size)
+
+    def test_journal_of_another_command(self):
+        """A journal left by another command is started afresh."""
+        run = journal.Journal(self.file_name, 'delete')
+
+        self.assertEqual(run.completed, {})
+        run.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
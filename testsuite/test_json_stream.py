@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of the json_stream module."""
+
+import json
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import json_stream  # noqa: E402  pylint: disable=wrong-import-position
+
+DOCUMENT = {
+    'meta': {'next': [1, {'a': 'b'}], 'total': 3},
+    'items': [{'name': u'café', 'cpu': 12345}, 678, 'text, with [brackets]', [], None],
+    'after': True
+}
+
+
+def split_into(text, size):
+    """Return the given text as utf-8 chunks of the given number of bytes."""
+    data = text.encode('utf-8')
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class IterJsonArrayItemsTest(unittest.TestCase):
+    """Tests of json_stream.iter_json_array_items."""
+
+    def test_items_split_across_chunk_boundaries(self):
+        """The items are the same whatever the size of the chunks the document arrives in."""
+        text = json.dumps(DOCUMENT, ensure_ascii=False)
+        for size in range(1, len(text) + 2):
+            self.assertEqual(
+                list(json_stream.iter_json_array_items(split_into(text, size), 'items')),
+                DOCUMENT['items'],
+                'chunks of %d bytes' % size
+            )
+
+    def test_number_at_the_end_of_a_chunk(self):
+        """A number cut by the end of a chunk is read in full."""
+        chunks = [b'{"items": [12', b'34, 5', b'6]}']
+
+        self.assertEqual(list(json_stream.iter_json_array_items(chunks, 'items')), [1234, 56])
+
+    def test_empty_array(self):
+        """An empty array gives no items."""
+        chunks = [b'{"items": [', b' ]}']
+
+        self.assertEqual(list(json_stream.iter_json_array_items(chunks, 'items')), [])
+
+    def test_missing_key(self):
+        """A KeyError is raised if the object has no such key."""
+        chunks = [b'{"other": [1, 2]', b'}']
+
+        with self.assertRaises(KeyError):
+            list(json_stream.iter_json_array_items(chunks, 'items'))
+
+    def test_not_an_object(self):
+        """A ValueError is raised if the document isn't an object."""
+        with self.assertRaises(ValueError):
+            list(json_stream.iter_json_array_items([b'[1, 2]'], 'items'))
+
+
+if __name__ == '__main__':
+    unittest.main()
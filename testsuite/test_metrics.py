@@ -0,0 +1,127 @@
+"""Unit tests of the metrics module."""
+
+import json
+import os
+import sys
+import time
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import metrics  # noqa: E402  pylint: disable=wrong-import-position
+
+PROMETHEUS_TEXT = '''# HELP importer_call_duration_seconds Duration of REST calls and cli commands.
+# TYPE importer_call_duration_seconds histogram
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.005"} 0
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.01"} 0
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.025"} 0
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.05"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.1"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.25"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="0.5"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="1.0"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="2.5"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="5.0"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="10.0"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="30.0"} 1
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="60.0"} 2
+importer_call_duration_seconds_bucket{kind="rest",name="GET /api/\\"teams\\"/",le="+Inf"} 2
+importer_call_duration_seconds_sum{kind="rest",name="GET /api/\\"teams\\"/"} 45.030000
+importer_call_duration_seconds_count{kind="rest",name="GET /api/\\"teams\\"/"} 2
+# HELP importer_call_errors_total Failed REST calls and cli commands.
+# TYPE importer_call_errors_total counter
+importer_call_errors_total{kind="rest",name="GET /api/\\"teams\\"/"} 1
+# HELP importer_call_bytes_sent_total Payload bytes sent.
+# TYPE importer_call_bytes_sent_total counter
+importer_call_bytes_sent_total{kind="rest",name="GET /api/\\"teams\\"/"} 30
+# HELP importer_call_bytes_received_total Payload bytes received.
+# TYPE importer_call_bytes_received_total counter
+importer_call_bytes_received_total{kind="rest",name="GET /api/\\"teams\\"/"} 600
+# HELP importer_phase_duration_seconds Duration of the last run of each phase.
+# TYPE importer_phase_duration_seconds gauge
+importer_phase_duration_seconds{phase="init"} 1.500000
+importer_phase_duration_seconds{phase="create pods"} 2.000000
+'''
+
+
+class MetricsTest(unittest.TestCase):
+    """Tests of the recording and export of metrics.Metrics."""
+
+    def setUp(self):
+        """Set up enabled, empty metrics."""
+        self.metrics = metrics.Metrics()
+        self.metrics.enable()
+
+    def test_disabled_metrics_record_nothing(self):
+        """While disabled, there is no timer, and calls and phases aren't recorded."""
+        disabled_metrics = metrics.Metrics()
+
+        start_time = disabled_metrics.start_timer()
+        disabled_metrics.record_call('rest', 'GET /api/teams/', start_time)
+        with disabled_metrics.phase('init'):
+            pass
+
+        self.assertIsNone(start_time)
+        self.assertEqual(disabled_metrics.to_dict(), {'calls': {}, 'phases': []})
+
+    def test_record_call(self):
+        """Calls are counted per kind and name, with their bytes, errors and latency bucket."""
+        self.metrics.record_call(
+            'rest', 'GET /api/teams/', time.time() - 0.03, bytes_sent=10, bytes_received=200
+        )
+        self.metrics.record_call('rest', 'GET /api/teams/', time.time() - 45, error=True)
+        self.metrics.record_call('cli', 'openstack', self.metrics.start_timer())
+
+        calls = self.metrics.to_dict()['calls']
+
+        self.assertEqual(sorted(calls), ['cli', 'rest'])
+        statistics = calls['rest']['GET /api/teams/']
+        self.assertEqual(
+            (statistics['count'], statistics['errors'], statistics['bytes_sent'],
+             statistics['bytes_received']),
+            (2, 1, 10, 200)
+        )
+        self.assertGreaterEqual(statistics['max_seconds'], 45)
+        self.assertEqual(statistics['latency_buckets']['0.025'], 0)
+        self.assertEqual(statistics['latency_buckets']['0.05'], 1)
+        self.assertEqual(statistics['latency_buckets']['60.0'], 2)
+        self.assertEqual(statistics['latency_buckets']['+Inf'], 2)
+        self.assertEqual(calls['cli']['openstack']['count'], 1)
+
+    def test_phases(self):
+        """Each phase is timed, including one left by an exception."""
+        with self.metrics.phase('init'):
+            time.sleep(0.02)
+        with self.assertRaises(RuntimeError):
+            with self.metrics.phase('create pods'):
+                raise RuntimeError('failed')
+
+        phases = self.metrics.to_dict()['phases']
+
+        self.assertEqual([phase['name'] for phase in phases], ['init', 'create pods'])
+        self.assertGreaterEqual(phases[0]['seconds'], 0.02)
+
+    def test_json(self):
+        """The JSON summary holds the calls and phases."""
+        self.metrics.record_call('cli', 'nova', self.metrics.start_timer())
+        with self.metrics.phase('init'):
+            pass
+
+        self.assertEqual(json.loads(self.metrics.to_json()), self.metrics.to_dict())
+
+    def test_prometheus(self):
+        """The Prometheus text has a histogram and counters per call, and the last of each phase."""
+        statistics = metrics.CallStatistics()
+        statistics.add(0.03, 10, 200, False)
+        statistics.add(45.0, 20, 400, True)
+        self.metrics.calls[('rest', 'GET /api/"teams"/')] = statistics
+        self.metrics.phases.extend([('create pods', 1.0), ('init', 1.5), ('create pods', 2.0)])
+
+        self.assertEqual(self.metrics.to_prometheus(), PROMETHEUS_TEXT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+"""Unit tests of the openstack module."""
+
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import openstack  # noqa: E402  pylint: disable=wrong-import-position
+import token_cache  # noqa: E402  pylint: disable=wrong-import-position
+
+ENVIRONMENT = {
+    'OS_AUTH_URL': 'http://cloud1:5000/v3',
+    'OS_PROJECT_NAME': 'admin',
+    'OS_USERNAME': 'admin',
+    'OS_PASSWORD': 'secret'
+}
+
+POOLS_OUTPUT = """
++-----------------------------+------------------------------------+
+| Property                    | Value                              |
++-----------------------------+------------------------------------+
+| name                        | host1@lvm#pool1                    |
+| free_capacity_gb            | 120.5                              |
+| total_capacity_gb           | 500                                |
++-----------------------------+------------------------------------+
++-----------------------------+------------------------------------+
+| Property                    | Value                              |
++-----------------------------+------------------------------------+
+| name                        | host2@lvm#pool2                    |
+| capabilities                | thin_provisioning                  |
+|                             | multiattach                        |
+| free_capacity_gb            | 80                                 |
++-----------------------------+------------------------------------+
+"""
+
+
+class IterTableRecordsTest(unittest.TestCase):
+    """Tests of openstack.iter_table_records."""
+
+    def test_multiple_tables_and_wrapped_rows(self):
+        """Each table gives a record, and wrapped values are joined with new lines."""
+        self.assertEqual(list(openstack.iter_table_records(POOLS_OUTPUT.splitlines())), [
+            {
+                'name': 'host1@lvm#pool1',
+                'free_capacity_gb': '120.5',
+                'total_capacity_gb': '500'
+            },
+            {
+                'name': 'host2@lvm#pool2',
+                'capabilities': 'thin_provisioning\nmultiattach',
+                'free_capacity_gb': '80'
+            }
+        ])
+
+    def test_line_outside_a_table(self):
+        """A ValueError is raised for a line that isn't part of a table."""
+        lines = ['WARNING: something happened'] + POOLS_OUTPUT.splitlines()
+
+        with self.assertRaises(ValueError):
+            list(openstack.iter_table_records(lines))
+
+    def test_output_ending_inside_a_table(self):
+        """A ValueError is raised if the output stops before the table is closed."""
+        lines = POOLS_OUTPUT.strip().splitlines()[:-1]
+
+        with self.assertRaises(ValueError):
+            list(openstack.iter_table_records(lines))
+
+    def test_single_record(self):
+        """parse_table_lines returns the only table, or refuses several."""
+        lines = POOLS_OUTPUT.strip().splitlines()
+
+        self.assertEqual(openstack.parse_table_lines(False, lines[:7])['total_capacity_gb'], '500')
+        self.assertEqual(len(openstack.parse_table_lines(True, lines)), 2)
+        with self.assertRaises(ValueError):
+            openstack.parse_table_lines(False, lines)
+
+QUOTAS_OUTPUT = """(openstack) {
+  "cores": 8,
+  "project": "id1",
+  "project_name": "project1"
+}
+(openstack) {"cores": 16, "project": "id2", "project_name": "project2"}
+(openstack) """
+
+
+class ParseJsonDocumentsTest(unittest.TestCase):
+    """Tests of openstack.parse_json_documents."""
+
+    def test_concatenated_documents(self):
+        """Documents one after another are each parsed, the prompts between them skipped."""
+        self.assertEqual(
+            [document['cores'] for document in openstack.parse_json_documents(QUOTAS_OUTPUT)],
+            [8, 16]
+        )
+        self.assertEqual(openstack.parse_json_documents('[1, 2]{"a": [3]}'), [[1, 2], {'a': [3]}])
+
+    def test_text_around_documents(self):
+        """Text that isn't JSON, even if it has brackets, is skipped."""
+        self.assertEqual(
+            openstack.parse_json_documents('No project [x] found\n{"cores": 4}\n{"cores": '),
+            [{'cores': 4}]
+        )
+        self.assertEqual(openstack.parse_json_documents(''), [])
+
+
+class ParseAllProjectQuotasTest(unittest.TestCase):
+    """Tests of openstack.parse_all_project_quotas."""
+
+    def test_documents_matched_in_order(self):
+        """With a document per project, they are matched in the order the projects were given."""
+        all_project_quotas = openstack.parse_all_project_quotas(
+            ['first', 'second'], {'standard_output': QUOTAS_OUTPUT, 'standard_error': ''}
+        )
+
+        self.assertEqual(all_project_quotas['first']['project'], 'id1')
+        self.assertEqual(all_project_quotas['second']['project'], 'id2')
+
+    def test_missing_document_falls_back_to_project_name(self):
+        """With documents missing, each is matched by its project_name, the others left out."""
+        all_project_quotas = openstack.parse_all_project_quotas(
+            ['project1', 'project2', 'project3'], {
+                'standard_output': QUOTAS_OUTPUT,
+                'standard_error': "No project with a name or ID of 'project3' exists."
+            }
+        )
+
+        self.assertEqual(sorted(all_project_quotas), ['project1', 'project2'])
+        self.assertEqual(all_project_quotas['project2']['cores'], 16)
+
+    def test_unknown_project_names_are_left_out(self):
+        """Documents of projects that weren't asked for are left out."""
+        all_project_quotas = openstack.parse_all_project_quotas(
+            ['project1', 'project4', 'project5'],
+            {'standard_output': QUOTAS_OUTPUT, 'standard_error': ''}
+        )
+
+        self.assertEqual(list(all_project_quotas), ['project1'])
+
+
+class StubTokenCache(token_cache.TokenCache):
+    """A token cache that swaps in token1 for the password of every environment."""
+
+    def get_command_environment(self, environment):
+        """Return the environment with token1 in place of the password."""
+        command_environment = dict(environment, OS_AUTH_TYPE='token', OS_TOKEN='token1')
+        command_environment.pop('OS_PASSWORD')
+        return command_environment
+
+
+class CommandEnvironmentTest(unittest.TestCase):
+    """Tests of the environment the cli commands are run in."""
+
+    def setUp(self):
+        """Put a stub token cache in place of the shared one."""
+        self.token_cache = token_cache.TOKEN_CACHE
+        token_cache.TOKEN_CACHE = StubTokenCache()
+
+    def tearDown(self):
+        """Put the shared token cache back."""
+        token_cache.TOKEN_CACHE = self.token_cache
+
+    def test_cinder_keeps_the_password(self):
+        """The cinder client authenticates with the password, not the cached token."""
+        cli_command = openstack.get_cinder_pool_details(environment=ENVIRONMENT, prepare_only=True)
+
+        environment = cli_command.get_env()
+
+        self.assertTrue(cli_command.command.startswith('cinder '))
+        self.assertEqual(environment['OS_PASSWORD'], 'secret')
+        self.assertNotIn('OS_TOKEN', environment)
+        self.assertNotIn('OS_AUTH_TYPE', environment)
+
+    def test_openstack_gets_the_token(self):
+        """The openstack client is given the cached token in place of the password."""
+        cli_commands = [
+            openstack.get_nova_hypervisor_stats(environment=ENVIRONMENT, prepare_only=True),
+            openstack.get_all_project_quotas(
+                project_names=['project1'], environment=ENVIRONMENT, prepare_only=True
+            )
+        ]
+
+        for cli_command in cli_commands:
+            environment = cli_command.get_env()
+            self.assertNotIn('OS_PASSWORD', environment)
+            self.assertEqual((environment['OS_AUTH_TYPE'], environment['OS_TOKEN']), (
+                'token', 'token1'
+            ))
+
+
+if __name__ == '__main__':
+    unittest.main()
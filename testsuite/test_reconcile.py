@@ -0,0 +1,117 @@
+"""Unit tests of the reconcile module."""
+
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import records  # noqa: E402  pylint: disable=wrong-import-position
+import reconcile  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def project_state(name, team_name, cpu=1, planner_id=None):
+    """Return a records.ProjectState in pod1, with the given team and cpu."""
+    return records.ProjectState(name, 'pod1', team_name, (cpu, 2048, 10), planner_id=planner_id)
+
+
+def keyed(*projects):
+    """Return the given records.ProjectState keyed by their natural key."""
+    return dict((project.key, project) for project in projects)
+
+
+class ComputeChangesetTest(unittest.TestCase):
+    """Tests of reconcile.compute_changeset."""
+
+    def test_creates_updates_and_deletes(self):
+        """Only the projects that differ are written, and the unwanted ones are deleted."""
+        desired = keyed(
+            project_state('new_1', 'new'),
+            project_state('changed_1', 'changed', cpu=4),
+            project_state('same_1', 'same')
+        )
+        actual = keyed(
+            project_state('changed_1', 'changed', cpu=2, planner_id='p1'),
+            project_state('same_1', 'same', planner_id='p2'),
+            project_state('gone_1', 'gone', planner_id='p3')
+        )
+
+        changeset = reconcile.compute_changeset(desired, actual, ['changed', 'same', 'gone'])
+
+        self.assertEqual([project.name for project in changeset.projects_to_create], ['new_1'])
+        self.assertEqual(
+            [(wanted.cpu, had.planner_id) for wanted, had in changeset.projects_to_update],
+            [(4, 'p1')]
+        )
+        self.assertEqual([project.name for project in changeset.projects_unchanged], ['same_1'])
+        self.assertEqual(
+            [project.planner_id for project in changeset.projects_to_delete], ['p3']
+        )
+        self.assertEqual(changeset.teams_to_create, ['new'])
+        self.assertEqual(changeset.teams_to_delete, ['gone'])
+        self.assertFalse(changeset.is_empty())
+
+    def test_nothing_to_do(self):
+        """An estate already in line gives an empty change set."""
+        changeset = reconcile.compute_changeset(
+            keyed(project_state('same_1', 'same')),
+            keyed(project_state('same_1', 'same', planner_id='p1')),
+            ['same']
+        )
+
+        self.assertTrue(changeset.is_empty())
+        self.assertEqual(len(changeset.projects_unchanged), 1)
+
+    def test_numbers_are_compared_by_value(self):
+        """A capacity the planner holds as text is equal to the same number from Meteo."""
+        actual = records.ProjectState.from_planner({
+            '_id': 'p1', 'name': 'same_1', 'pod_id': 'pod1',
+            'cpu': '1', 'memory_mb': '2048.0', 'cinder_gb': 10
+        }, 'same')
+
+        changeset = reconcile.compute_changeset(
+            keyed(project_state('same_1', 'same')), keyed(actual), ['same']
+        )
+
+        self.assertTrue(changeset.is_empty())
+
+    def test_kept_projects_and_their_teams_are_not_deleted(self):
+        """Projects whose Meteo record was skipped are kept, and so is their team."""
+        kept = project_state('invalid_1', 'invalid', planner_id='p1')
+
+        changeset = reconcile.compute_changeset(
+            {}, keyed(kept), ['invalid'], kept_keys=set([kept.key])
+        )
+
+        self.assertEqual(changeset.projects_to_delete, [])
+        self.assertEqual(changeset.projects_kept, [kept])
+        self.assertEqual(changeset.teams_to_delete, [])
+        self.assertTrue(changeset.is_empty())
+
+
+class JoinPodStatsTest(unittest.TestCase):
+    """Tests of reconcile.join_pod_stats."""
+
+    def test_join(self):
+        """Clouds are joined with their pod on its name, and with their stats on the cloud name."""
+        clouds = [
+            records.MeteoCloud('1', 'http://cloud1:5000/v3', 64, 262144, 2000, 1000, 0, 0, 4),
+            records.MeteoCloud('2', 'http://cloud2:5000/v3', 32, 131072, 1000, 500, 0, 0, 4)
+        ]
+        stats = records.LiveCloudStats('2', 32, 8, 131072, 4096, 1000, 900)
+
+        pods = list(reconcile.join_pod_stats(
+            clouds, {'2': stats, '3': stats}, [{'_id': 'pod1', 'name': 'cloud1'}]
+        ))
+
+        self.assertEqual(
+            [(pod.cloud_name, pod.planner_id, pod.stats) for pod in pods],
+            [('1', 'pod1', None), ('2', None, stats)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+"""Unit tests of the resilience module."""
+
+import os
+import sys
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import resilience  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class TransientException(Exception):
+    """Stands for a failure that is likely to be transient."""
+
+    pass
+
+
+class FailingFunction(object):  # pylint: disable=too-few-public-methods
+    """Raises the given exceptions in turn, then returns 'done', counting its calls."""
+
+    def __init__(self, *errors):
+        """Initialize the function with the exceptions to raise."""
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        """Raise the next exception, or return 'done' once there are none left."""
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'done'
+
+
+class RetryPolicyTest(unittest.TestCase):
+    """Tests of resilience.RetryPolicy."""
+
+    def test_attempts_are_at_least_one(self):
+        """An attempts of 0 or less still makes one attempt."""
+        self.assertEqual(resilience.RetryPolicy(attempts=0).attempts, 1)
+        self.assertEqual(resilience.RetryPolicy(attempts='3').attempts, 3)
+
+    def test_delay_grows_up_to_max_delay(self):
+        """The delay is jittered below a bound doubling per attempt, capped at max_delay."""
+        retry_policy = resilience.RetryPolicy(base_delay=1.0, max_delay=5.0)
+
+        for attempt, bound in enumerate([1.0, 2.0, 4.0, 5.0, 5.0]):
+            for _ in range(20):
+                self.assertTrue(0 <= retry_policy.delay(attempt) <= bound)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """Tests of the states of resilience.CircuitBreaker."""
+
+    def setUp(self):
+        """Set up a breaker that opens after 2 failures."""
+        self.breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def open_breaker(self):
+        """Record failures up to the threshold."""
+        self.breaker.record_failure('host')
+        self.breaker.record_failure('host')
+
+    def test_opens_at_the_threshold(self):
+        """Calls are let through below the threshold, and refused once it is reached."""
+        self.breaker.record_failure('host')
+        self.breaker.before_call('host')
+
+        self.breaker.record_failure('host')
+        with self.assertRaises(resilience.CircuitOpenException):
+            self.breaker.before_call('host')
+
+    def test_success_resets_the_count(self):
+        """A success in between failures starts the count again."""
+        self.breaker.record_failure('host')
+        self.breaker.record_success()
+        self.breaker.record_failure('host')
+
+        self.breaker.before_call('host')
+
+    def test_single_trial_after_reset_timeout(self):
+        """Once the reset timeout is over, one trial call is let through, and no other."""
+        self.open_breaker()
+        self.breaker.opened_at -= 61
+
+        self.breaker.before_call('host')
+        with self.assertRaises(resilience.CircuitOpenException):
+            self.breaker.before_call('host')
+
+    def test_trial_success_closes(self):
+        """A successful trial call closes the circuit."""
+        self.open_breaker()
+        self.breaker.opened_at -= 61
+        self.breaker.before_call('host')
+
+        self.breaker.record_success()
+
+        self.breaker.before_call('host')
+        self.breaker.before_call('host')
+
+    def test_trial_failure_opens_again(self):
+        """A failed trial call opens the circuit for another reset timeout."""
+        self.open_breaker()
+        self.breaker.opened_at -= 61
+        self.breaker.before_call('host')
+
+        self.breaker.record_failure('host')
+
+        with self.assertRaises(resilience.CircuitOpenException):
+            self.breaker.before_call('host')
+
+    def test_registry_holds_a_breaker_per_host(self):
+        """The registry gives the same breaker for a host, and another for another host."""
+        breakers = resilience.CircuitBreakerRegistry(failure_threshold=1)
+
+        self.assertIs(breakers.get('host1'), breakers.get('host1'))
+        self.assertIsNot(breakers.get('host1'), breakers.get('host2'))
+        self.assertEqual(breakers.get('host1').failure_threshold, 1)
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    """Tests of resilience.AdaptiveLimiter."""
+
+    def call(self, limiter, latency, error=False):
+        """Make a call of the given latency through the limiter."""
+        limiter.acquire()
+        limiter.release(latency, error, 'GET')
+
+    def test_starts_at_max_limit(self):
+        """The limit starts at max_limit, which is at least 1."""
+        self.assertEqual(resilience.AdaptiveLimiter(4).limit, 4.0)
+        self.assertEqual(resilience.AdaptiveLimiter(0).limit, 1.0)
+
+    def test_error_halves_the_limit(self):
+        """An error halves the limit, at most once per limit calls, down to 1."""
+        limiter = resilience.AdaptiveLimiter(8)
+        for _ in range(8):
+            self.call(limiter, 0.01)
+
+        self.call(limiter, 0.01, error=True)
+        self.assertEqual(int(limiter.limit), 4)
+        self.call(limiter, 0.01, error=True)
+        self.assertEqual(int(limiter.limit), 4)
+
+        for _ in range(20):
+            self.call(limiter, 0.01, error=True)
+        self.assertEqual(limiter.limit, 1.0)
+
+    def test_slow_call_halves_the_limit(self):
+        """A call much slower than the fastest recent one halves the limit."""
+        limiter = resilience.AdaptiveLimiter(8)
+        for _ in range(8):
+            self.call(limiter, 0.05)
+
+        self.call(limiter, 1.0)
+
+        self.assertEqual(int(limiter.limit), 4)
+
+    def test_successes_grow_the_limit_to_max_limit(self):
+        """The limit grows by 1 / limit per successful call, up to max_limit."""
+        limiter = resilience.AdaptiveLimiter(4)
+        limiter.limit = 2.0
+
+        self.call(limiter, 0.01)
+        self.call(limiter, 0.01)
+        self.assertEqual(int(limiter.limit), 2)
+        self.call(limiter, 0.01)
+        self.assertEqual(int(limiter.limit), 3)
+
+        for _ in range(20):
+            self.call(limiter, 0.01)
+        self.assertEqual(limiter.limit, 4.0)
+
+    def test_in_flight_calls(self):
+        """The calls in flight are counted until they are released."""
+        limiter = resilience.AdaptiveLimiter(2)
+        limiter.acquire()
+        limiter.acquire()
+
+        self.assertEqual(limiter.in_flight, 2)
+        limiter.release(0.01, False)
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class CallTest(unittest.TestCase):
+    """Tests of resilience.call."""
+
+    def setUp(self):
+        """Set up breakers that open after 3 failures, and a retry policy without delays."""
+        self.breakers = resilience.CircuitBreakerRegistry(failure_threshold=3)
+        self.retry_policy = resilience.RetryPolicy(attempts=3, base_delay=0)
+
+    def call(self, function, **kwargs):
+        """Call the function towards 'host', transient errors being TransientException."""
+        return resilience.call(
+            function,
+            host='host',
+            retry_policy=self.retry_policy,
+            is_transient=lambda error: isinstance(error, TransientException),
+            breakers=self.breakers,
+            **kwargs
+        )
+
+    def test_transient_failure_is_retried(self):
+        """An idempotent call is retried after a transient failure."""
+        function = FailingFunction(TransientException())
+
+        self.assertEqual(self.call(function, idempotent=True), 'done')
+        self.assertEqual(function.calls, 2)
+
+    def test_other_failure_is_raised_at_once(self):
+        """Other failures are raised without retrying, and don't open the circuit."""
+        function = FailingFunction(ValueError(), ValueError(), ValueError())
+
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                self.call(function, idempotent=True)
+
+        self.assertEqual(function.calls, 3)
+        self.breakers.get('host').before_call('host')
+
+    def test_non_idempotent_call_is_not_retried(self):
+        """A call that isn't idempotent is only retried if it wasn't processed."""
+        function = FailingFunction(TransientException(), TransientException())
+
+        with self.assertRaises(TransientException):
+            self.call(function)
+        self.assertEqual(function.calls, 1)
+
+        self.assertEqual(self.call(function, is_unprocessed=lambda error: True), 'done')
+        self.assertEqual(function.calls, 3)
+
+    def test_repeated_transient_failures_open_the_circuit(self):
+        """Transient failures on every attempt are raised, and open the circuit."""
+        function = FailingFunction(*[TransientException() for _ in range(3)])
+
+        with self.assertRaises(TransientException):
+            self.call(function, idempotent=True)
+        with self.assertRaises(resilience.CircuitOpenException):
+            self.call(function, idempotent=True)
+        self.assertEqual(function.calls, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""Unit tests of the scheduler module."""
+
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+import urllib2
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import scheduler  # noqa: E402  pylint: disable=wrong-import-position
+
+WAIT_TIMEOUT = 10
+
+
+class CountingSync(object):  # pylint: disable=too-few-public-methods
+    """A sync function that counts its runs, failing the runs given."""
+
+    def __init__(self, failing_runs=()):
+        """Initialize the sync, failing the given run numbers, counting from 1."""
+        self.failing_runs = failing_runs
+        self.runs = 0
+        self.run_times = []
+        self.ran = threading.Event()
+
+    def __call__(self):
+        """Run the sync."""
+        self.runs += 1
+        self.run_times.append(time.time())
+        self.ran.set()
+        if self.runs in self.failing_runs:
+            raise RuntimeError('sync ' + str(self.runs) + ' failed')
+
+    def wait(self):
+        """Wait for the next run, returning False if it doesn't come in time."""
+        ran = self.ran.wait(WAIT_TIMEOUT)
+        self.ran.clear()
+        return ran
+
+
+class SyncDaemonTest(unittest.TestCase):
+    """Tests of the scheduling of scheduler.SyncDaemon."""
+
+    def start(self, sync_daemon):
+        """Run the daemon in a background thread, stopping it at the end of the test."""
+        thread = threading.Thread(target=sync_daemon.run_forever)
+        thread.daemon = True
+        thread.start()
+
+        def stop():
+            """Stop the daemon and wait for it."""
+            sync_daemon.stop()
+            thread.join(WAIT_TIMEOUT)
+
+        self.addCleanup(stop)
+
+    def test_jitter(self):
+        """The delay is within the jitter of the interval, the jitter no more than the interval."""
+        sync_daemon = scheduler.SyncDaemon(CountingSync(), interval=10, jitter=2)
+        delays = [sync_daemon.next_delay() for _ in range(200)]
+
+        self.assertTrue(all(8 <= delay <= 12 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+        sync_daemon = scheduler.SyncDaemon(CountingSync(), interval=1, jitter=5)
+        self.assertEqual(sync_daemon.jitter, 1)
+        self.assertTrue(all(0 <= sync_daemon.next_delay() <= 2 for _ in range(200)))
+
+    def test_interval(self):
+        """The first sync runs straight away, and the next ones an interval apart."""
+        sync = CountingSync()
+        sync_daemon = scheduler.SyncDaemon(sync, interval=0.2, jitter=0)
+        start_time = time.time()
+        self.start(sync_daemon)
+
+        for _ in range(3):
+            self.assertTrue(sync.wait())
+
+        self.assertLess(sync.run_times[0] - start_time, 0.15)
+        for previous_time, run_time in zip(sync.run_times, sync.run_times[1:]):
+            self.assertGreaterEqual(run_time - previous_time, 0.19)
+        self.assertIsNotNone(sync_daemon.status()['next_run_time'])
+
+    def test_failed_sync(self):
+        """A failed sync is kept in the status, and the daemon carries on."""
+        sync = CountingSync(failing_runs=(1,))
+        sync_daemon = scheduler.SyncDaemon(sync, interval=60, jitter=0)
+
+        sync_daemon.run_once()
+
+        self.assertFalse(sync_daemon.is_healthy())
+        self.assertEqual(sync_daemon.status()['last_error'], 'sync 1 failed')
+        self.assertIsNone(sync_daemon.status()['last_success'])
+
+        sync_daemon.run_once()
+
+        self.assertTrue(sync_daemon.is_healthy())
+        status = sync_daemon.status()
+        self.assertEqual((status['runs'], status['failures']), (2, 1))
+        self.assertIsNotNone(status['last_success'])
+
+    def test_stop(self):
+        """A stopped daemon doesn't wait out the interval."""
+        sync = CountingSync()
+        sync_daemon = scheduler.SyncDaemon(sync, interval=60, jitter=0)
+        thread = threading.Thread(target=sync_daemon.run_forever)
+        thread.start()
+        self.assertTrue(sync.wait())
+
+        sync_daemon.stop()
+        thread.join(WAIT_TIMEOUT)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(sync.runs, 1)
+
+
+class StatusServerTest(unittest.TestCase):
+    """Tests of the endpoints of scheduler.StatusServer."""
+
+    def setUp(self):
+        """Start a status server on a free port, for a daemon that syncs every minute."""
+        self.sync = CountingSync(failing_runs=(1,))
+        self.sync_daemon = scheduler.SyncDaemon(self.sync, interval=60, jitter=0)
+        self.server = scheduler.StatusServer(self.sync_daemon, port=0)
+        self.server.start()
+        self.base_url = 'http://%s:%d' % self.server.server_address[:2]
+
+    def tearDown(self):
+        """Stop the status server."""
+        self.server.stop()
+
+    def request(self, path, data=None):
+        """Return the status and body of a request to the server, a POST if data is given."""
+        try:
+            response = urllib2.urlopen(self.base_url + path, data, WAIT_TIMEOUT)
+        except urllib2.HTTPError as error:
+            return error.code, error.read()
+        return response.getcode(), response.read()
+
+    def test_health_after_failed_sync(self):
+        """The health is a 503 with the error after a failed sync, and a 200 after a good one."""
+        self.sync_daemon.run_once()
+
+        status, body = self.request('/health')
+
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body)['last_error'], 'sync 1 failed')
+
+        self.sync_daemon.run_once()
+
+        status, body = self.request('/health')
+
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['healthy'])
+
+    def test_trigger(self):
+        """A POST to /trigger runs a sync straight away, rather than after the interval."""
+        thread = threading.Thread(target=self.sync_daemon.run_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join, WAIT_TIMEOUT)
+        self.addCleanup(self.sync_daemon.stop)
+        self.assertTrue(self.sync.wait())
+
+        status, body = self.request('/trigger', data='')
+
+        self.assertEqual((status, json.loads(body)), (202, {'triggered': True}))
+        self.assertTrue(self.sync.wait())
+        self.assertEqual(self.sync.runs, 2)
+
+    def test_metrics(self):
+        """The metrics include the daemon's runs and failures."""
+        self.sync_daemon.run_once()
+
+        status, body = self.request('/metrics')
+
+        self.assertEqual(status, 200)
+        self.assertIn('importer_sync_runs_total 1\n', body)
+        self.assertIn('importer_sync_failures_total 1\n', body)
+        self.assertIn('importer_sync_healthy 0\n', body)
+
+    def test_unknown_path(self):
+        """Other paths are a 404."""
+        self.assertEqual(self.request('/other')[0], 404)
+        self.assertEqual(self.request('/health', data='')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""Unit tests of the token_cache module, with a stub keystone auth plugin."""
+
+import os
+import sys
+import threading
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import token_cache  # noqa: E402  pylint: disable=wrong-import-position
+
+ENVIRONMENT = {
+    'OS_AUTH_URL': 'http://cloud1:5000/v3',
+    'OS_PROJECT_NAME': 'admin',
+    'OS_USERNAME': 'admin',
+    'OS_PASSWORD': 'secret'
+}
+
+
+class StubAccess(object):  # pylint: disable=too-few-public-methods
+    """Stands in for a keystoneauth1 AccessInfo, a token expiring in expires_in seconds."""
+
+    def __init__(self, auth_token, expires_in):
+        """Initialize the access with the given token."""
+        self.auth_token = auth_token
+        self.expires_in = expires_in
+        self.expires = 'in ' + str(expires_in) + 's'
+
+    def will_expire_soon(self, stale_duration):
+        """Return True if the token expires within stale_duration seconds."""
+        return self.expires_in < stale_duration
+
+
+class StubAuth(object):
+    """Stands in for a keystoneauth1 password plugin, giving token1, token2 and so on."""
+
+    def __init__(self, expires_in=3600, error=None):
+        """Initialize the plugin, giving tokens expiring in expires_in seconds, or raising error."""
+        self.expires_in = expires_in
+        self.error = error
+        self.auth_ref = None
+        self.token_requests = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        """Forget the token held."""
+        self.invalidations += 1
+        self.auth_ref = None
+
+    def get_access(self, session):  # pylint: disable=unused-argument
+        """Ask the stub keystone for a new token."""
+        self.token_requests += 1
+        if self.error is not None:
+            raise self.error
+        self.auth_ref = StubAccess('token' + str(self.token_requests), self.expires_in)
+        return self.auth_ref
+
+
+class StubSession(object):  # pylint: disable=too-few-public-methods
+    """Stands in for a keystoneauth1 session, holding its auth plugin."""
+
+    def __init__(self, auth):
+        """Initialize the session with the given auth plugin."""
+        self.auth = auth
+
+
+def add_stub_session(cache, auth, environment=None):
+    """Give the cache a stub session with the given auth plugin for the environment."""
+    session_key = token_cache.cache_key(environment or ENVIRONMENT)
+    cache.sessions[session_key] = StubSession(auth)
+    cache.session_locks[session_key] = threading.Lock()
+
+
+class DisabledTokenCacheTest(unittest.TestCase):
+    """Tests of TokenCache.get_command_environment when no token is to be passed."""
+
+    def test_disabled_cache(self):
+        """A disabled cache leaves the password in place, without asking keystone."""
+        cache = token_cache.TokenCache()
+        auth = StubAuth()
+        add_stub_session(cache, auth)
+        cache.disable()
+
+        self.assertEqual(cache.get_command_environment(ENVIRONMENT), ENVIRONMENT)
+        self.assertEqual(auth.token_requests, 0)
+
+    def test_environment_without_password(self):
+        """An environment without openstack credentials is left as it is."""
+        cache = token_cache.TokenCache()
+        environment = {'PATH': '/usr/bin'}
+
+        self.assertEqual(cache.get_command_environment(environment), environment)
+
+
+@unittest.skipUnless(token_cache.is_available(), 'keystoneauth1 is not installed')
+class TokenCacheTest(unittest.TestCase):
+    """Tests of the token renewal and password swap of token_cache.TokenCache."""
+
+    def setUp(self):
+        """Set up a cache renewing tokens that expire within 600 seconds."""
+        self.cache = token_cache.TokenCache(expiry_margin=600)
+
+    def test_token_is_reused(self):
+        """Keystone is asked for a token once, while it doesn't expire soon."""
+        auth = StubAuth(expires_in=3600)
+        add_stub_session(self.cache, auth)
+
+        first = self.cache.get_access(ENVIRONMENT)
+        second = self.cache.get_access(dict(ENVIRONMENT, OS_REGION_NAME='region1'))
+
+        self.assertIs(first, second)
+        self.assertEqual(auth.token_requests, 1)
+
+    def test_token_renewed_within_expiry_margin(self):
+        """A token expiring within expiry_margin seconds is replaced by a new one."""
+        auth = StubAuth(expires_in=3600)
+        add_stub_session(self.cache, auth)
+        self.cache.get_access(ENVIRONMENT).expires_in = 300
+
+        access = self.cache.get_access(ENVIRONMENT)
+
+        self.assertEqual(access.auth_token, 'token2')
+        self.assertEqual(auth.invalidations, 2)
+
+    def test_keystone_failure_is_raised(self):
+        """get_access raises the keystoneauth1 exception if no token can be had."""
+        add_stub_session(self.cache, StubAuth(
+            error=token_cache.keystone_exceptions.ConnectFailure('keystone is down')
+        ))
+
+        with self.assertRaises(token_cache.keystone_exceptions.ClientException):
+            self.cache.get_access(ENVIRONMENT)
+
+    def test_password_swapped_for_token(self):
+        """The cli environment has the token in place of the password, the original is unchanged."""
+        add_stub_session(self.cache, StubAuth())
+
+        environment = self.cache.get_command_environment(ENVIRONMENT)
+
+        self.assertNotIn('OS_PASSWORD', environment)
+        self.assertEqual(environment['OS_AUTH_TYPE'], 'token')
+        self.assertEqual(environment['OS_TOKEN'], 'token1')
+        self.assertEqual(environment['OS_PROJECT_DOMAIN_NAME'], token_cache.DEFAULT_DOMAIN_NAME)
+        self.assertEqual(environment['OS_AUTH_URL'], ENVIRONMENT['OS_AUTH_URL'])
+        self.assertEqual(ENVIRONMENT['OS_PASSWORD'], 'secret')
+
+    def test_password_kept_when_keystone_fails(self):
+        """The password is left in place if keystone can't give a token."""
+        add_stub_session(self.cache, StubAuth(
+            error=token_cache.keystone_exceptions.ConnectFailure('keystone is down')
+        ))
+
+        self.assertEqual(self.cache.get_command_environment(ENVIRONMENT), ENVIRONMENT)
+
+    def test_sessions_per_project_and_user(self):
+        """Each auth url, project and user has its own session and token."""
+        other_environment = dict(ENVIRONMENT, OS_USERNAME='other')
+        add_stub_session(self.cache, StubAuth())
+        add_stub_session(self.cache, StubAuth(), other_environment)
+
+        self.assertIsNot(
+            self.cache.get_session(ENVIRONMENT), self.cache.get_session(other_environment)
+        )
+        self.assertEqual(self.cache.get_access(other_environment).auth_token, 'token1')
+
+
+if __name__ == '__main__':
+    unittest.main()
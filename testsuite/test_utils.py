@@ -0,0 +1,207 @@
+"""Unit tests of the utils module."""
+
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTSUITE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TESTSUITE_DIR, '..', 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import resilience  # noqa: E402  pylint: disable=wrong-import-position
+import utils  # noqa: E402  pylint: disable=wrong-import-position
+
+
+class RunCliCommandTest(unittest.TestCase):
+    """Tests of the retries of utils.run_cli_command."""
+
+    def setUp(self):
+        """Set up a cloud of its own, so that the breakers of other tests don't interfere."""
+        self.directory = tempfile.mkdtemp()
+        self.attempts_file = os.path.join(self.directory, 'attempts')
+        self.env = dict(os.environ, OS_AUTH_URL='http://' + self._testMethodName + ':5000/v3')
+
+    def tearDown(self):
+        """Remove the attempts file."""
+        shutil.rmtree(self.directory)
+
+    def run_shell(self, script, **kwargs):
+        """Run the given shell script as a cli command, counting its attempts."""
+        return utils.run_cli_command(
+            'sh -c "echo attempt >> ' + self.attempts_file + '; ' + script + '"',
+            env=self.env,
+            **kwargs
+        )
+
+    def count_attempts(self):
+        """Return the number of times the shell script was run."""
+        with open(self.attempts_file) as attempts_file:
+            return len(attempts_file.readlines())
+
+    def test_failure_is_raised_at_once(self):
+        """A command failing for any reason but a timeout or connection error isn't retried."""
+        for _ in range(resilience.DEFAULT_FAILURE_THRESHOLD + 1):
+            with self.assertRaises(utils.CliNonZeroExitCodeException) as context:
+                self.run_shell('echo No project with a name or ID of bad exists. >&2; exit 1')
+            self.assertNotIsInstance(context.exception, utils.CliTransientException)
+
+        self.assertEqual(self.count_attempts(), resilience.DEFAULT_FAILURE_THRESHOLD + 1)
+        self.assertEqual(self.run_shell('echo ok')['standard_output'], 'ok\n')
+
+    def test_connection_error_is_retried(self):
+        """A command that can't reach its cloud is retried."""
+        with self.assertRaises(utils.CliTransientException):
+            self.run_shell('echo Unable to establish connection to http://cloud >&2; exit 1',
+                           attempts=2)
+
+        self.assertEqual(self.count_attempts(), 2)
+
+    def test_timeout_is_retried(self):
+        """A command that times out is retried."""
+        with self.assertRaises(utils.CliTransientException):
+            self.run_shell('exec sleep 5', attempts=2, timeout=0.2)
+
+        self.assertEqual(self.count_attempts(), 2)
+
+
+class RunCliCommandsTest(unittest.TestCase):
+    """Tests of utils.run_cli_commands."""
+
+    def test_unparsable_output_fails_its_command_only(self):
+        """A command whose output parse_output can't parse fails, and the others still run."""
+        cli_commands = [
+            utils.CliCommand(
+                'echo ' + output, key=output,
+                parse_output=lambda output: json.loads(output['standard_output'])
+            )
+            for output in ('notjson', '[1]')
+        ]
+
+        completed = dict(
+            (cli_command.key, cli_command)
+            for cli_command in utils.run_cli_commands(cli_commands, raise_on_failure=False)
+        )
+
+        self.assertIsInstance(completed['notjson'].error, utils.CliOutputException)
+        self.assertIsNone(completed['notjson'].result)
+        self.assertIsNone(completed['[1]'].error)
+        self.assertEqual(completed['[1]'].result, [1])
+
+    def test_failed_commands_are_raised_once_all_have_run(self):
+        """With raise_on_failure, the failed commands are raised after the others are yielded."""
+        cli_commands = [
+            utils.CliCommand('echo notjson', parse_output=lambda output: json.loads(
+                output['standard_output']
+            )),
+            utils.CliCommand('echo ok')
+        ]
+        completed = []
+
+        with self.assertRaises(utils.CliCommandsFailedException) as context:
+            for cli_command in utils.run_cli_commands(cli_commands):
+                completed.append(cli_command)
+
+        self.assertEqual(len(completed), 2)
+        self.assertEqual(context.exception.failed_commands, [cli_commands[0]])
+
+
+class RecordingHandler(logging.Handler):
+    """Keeps the messages of the log records it handles."""
+
+    def __init__(self):
+        """Initialize the handler without messages."""
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        """Keep the message of the record."""
+        self.messages.append(record.getMessage())
+
+
+class RaisingPayload(object):  # pylint: disable=too-few-public-methods
+    """A payload that fails the test if it is turned into text."""
+
+    def __str__(self):
+        """Fail, as the payload shouldn't be turned into text."""
+        raise AssertionError('The payload was turned into text')
+
+
+class PayloadLoggingTest(unittest.TestCase):
+    """Tests of the payloads logged through utils.PayloadPreview, and of utils.configure_logging."""
+
+    def setUp(self):
+        """Record the messages of a logger of this test, keeping the logging setup to restore."""
+        self.handler = RecordingHandler()
+        self.log = logging.getLogger('test_utils.' + self._testMethodName)
+        self.log.addHandler(self.handler)
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+        root_logger = logging.getLogger()
+        self.root_handlers = list(root_logger.handlers)
+        self.root_level = root_logger.level
+        self.library_levels = dict(
+            (library_name, logging.getLogger(library_name).level)
+            for library_name in ('requests', 'urllib3')
+        )
+
+    def tearDown(self):
+        """Restore the payload log limit and the logging setup."""
+        utils.PAYLOAD_LOG_LIMIT = utils.DEFAULT_PAYLOAD_LOG_LIMIT
+        root_logger = logging.getLogger()
+        root_logger.handlers = self.root_handlers
+        root_logger.setLevel(self.root_level)
+        for library_name, level in self.library_levels.items():
+            logging.getLogger(library_name).setLevel(level)
+
+    def log_payload(self, payload):
+        """Log the given payload through a PayloadPreview, returning the message logged."""
+        self.log.debug("Sending payload %s", utils.PayloadPreview(payload))
+        return self.handler.messages[-1]
+
+    def test_small_payload_unchanged(self):
+        """A payload within the limit is logged as it is."""
+        payload = json.dumps({'name': 'team1'})
+
+        self.assertEqual(self.log_payload(payload), 'Sending payload ' + payload)
+        self.assertEqual(self.log_payload([1, 2]), 'Sending payload [1, 2]')
+
+    def test_large_payload_truncated(self):
+        """A payload over the limit is cut to it, with its full length noted."""
+        payload = json.dumps([{'name': 'team' + str(number)} for number in range(100)])
+
+        message = self.log_payload(payload)
+
+        self.assertEqual(
+            message,
+            'Sending payload ' + payload[:utils.PAYLOAD_LOG_LIMIT] +
+            '... (' + str(len(payload)) + ' characters)'
+        )
+
+    def test_payload_not_logged_or_not_built(self):
+        """A limit of 0 leaves payloads out, and a payload isn't turned into text unless logged."""
+        utils.PAYLOAD_LOG_LIMIT = 0
+
+        self.assertEqual(self.log_payload('secret'), 'Sending payload <payload not logged>')
+
+        self.log.setLevel(logging.INFO)
+        self.log.debug("Sending payload %s", utils.PayloadPreview(RaisingPayload()))
+        self.assertEqual(len(self.handler.messages), 1)
+
+    def test_configure_logging(self):
+        """configure_logging sets the payload log limit, and keeps library logs to warnings."""
+        utils.configure_logging(logging.DEBUG, payload_log_limit=10)
+
+        self.assertEqual(
+            self.log_payload('a' * 20), 'Sending payload aaaaaaaaaa... (20 characters)'
+        )
+        self.assertEqual(logging.getLogger().level, logging.DEBUG)
+        self.assertEqual(logging.getLogger('urllib3').level, logging.WARNING)
+
+
+if __name__ == '__main__':
+    unittest.main()